@@ -42,6 +42,6 @@ class StorageConfig(AppConfig):  #  Убедись, что имя совпада
             logger.info("✅ Telegram-планировщик успешно запущен")
             
         except ImportError as e:
-            logger.warning(f"⚠️ timer_scheduler.py не найден: {e}")
+            logger.warning("⚠️ timer_scheduler.py не найден: %s", e)
         except Exception as e:
-            logger.error(f"❌ Ошибка при запуске планировщика: {e}")
+            logger.error("❌ Ошибка при запуске планировщика: %s", e)
@@ -1,9 +1,10 @@
 # storage/management/commands/send_qr_code.py
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import CommandError
 from storage.models import RentalAgreement
 from storage.notification_service import TelegramNotificationService
+from storage.profiling import ProfiledCommand, phase
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
     help = 'Отправляет QR-код для доступа к боксу'
     
     def add_arguments(self, parser):
@@ -13,7 +14,8 @@ class Command(BaseCommand):
         agreement_id = options['agreement_id']
         
         try:
-            agreement = RentalAgreement.objects.get(id=agreement_id)
+            with phase('query'):
+                agreement = RentalAgreement.objects.select_related('client', 'warehouse').get(id=agreement_id)
         except RentalAgreement.DoesNotExist:
             raise CommandError(f'Договор #{agreement_id} не найден')
         
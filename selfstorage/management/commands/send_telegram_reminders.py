@@ -1,16 +1,17 @@
 # storage/management/commands/send_telegram_reminders.py
-from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.utils import timezone
 from datetime import date, timedelta
+from storage.db_router import read_alias
 from storage.models import Client, RentalAgreement
 from storage.notification_service import TelegramNotificationService
+from storage.profiling import ProfiledCommand, phase
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
     help = 'Отправляет Telegram-уведомления клиентам о статусе аренды'
     
     def add_arguments(self, parser):
@@ -40,12 +41,14 @@ class Command(BaseCommand):
         }
         
         # 1. Обрабатываем активные договоры
-        active_agreements = RentalAgreement.objects.filter(
-            status='active',
-            end_date__isnull=False
-        ).select_related('client', 'warehouse').prefetch_related('boxes')
+        # Выборки читаются с реплики (если она есть), отметки об отправке пишутся в основную БД
+        with phase('query'):
+            active_agreements = list(RentalAgreement.objects.using(read_alias()).filter(
+                status='active',
+                end_date__isnull=False
+            ).select_related('client', 'warehouse').prefetch_related('boxes'))
         
-        self.stdout.write(f"\n📋 Проверка активных договоров: {active_agreements.count()} шт.")
+        self.stdout.write(f"\n📋 Проверка активных договоров: {len(active_agreements)} шт.")
         
         for agreement in active_agreements:
             stats['active_checked'] += 1
@@ -65,11 +68,12 @@ class Command(BaseCommand):
                 stats['overdue_notifications'] += overdue
         
         # 2. Обрабатываем просроченные договоры
-        overdue_agreements = RentalAgreement.objects.filter(
-            status='overdue'
-        ).select_related('client', 'warehouse').prefetch_related('boxes')
+        with phase('query'):
+            overdue_agreements = list(RentalAgreement.objects.using(read_alias()).filter(
+                status='overdue'
+            ).select_related('client', 'warehouse').prefetch_related('boxes'))
         
-        self.stdout.write(f"\n📋 Проверка просроченных договоров: {overdue_agreements.count()} шт.")
+        self.stdout.write(f"\n📋 Проверка просроченных договоров: {len(overdue_agreements)} шт.")
         
         for agreement in overdue_agreements:
             stats['overdue_checked'] += 1
@@ -147,7 +151,8 @@ class Command(BaseCommand):
         if agreement.status == 'active' and days_overdue > 0:
             agreement.status = 'overdue'
             if not dry_run:
-                agreement.save(update_fields=['status'])
+                with phase('flag-update'):
+                    agreement.save(update_fields=['status'])
             self.stdout.write(
                 self.style.WARNING(
                     f"📝 Статус договора #{agreement.id} изменен на 'overdue'"
@@ -4,8 +4,21 @@ from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# .env читается до всех настроек, которые берутся из окружения
+load_dotenv()
+
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '8788678520:AAGsi2iVaB2-aGrSRW-hDtsH1nq0yBo7hIQ')
 TELEGRAM_LOGIST_CHAT_IDS = [975432272]
+# Адрес Bot API; для нагрузочных тестов — локальная заглушка (manage.py fake_telegram_api)
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+# Смещение getUpdates для run_telegram_bot (long polling)
+TELEGRAM_OFFSET_FILE = os.environ.get('TELEGRAM_OFFSET_FILE', BASE_DIR / 'telegram_offset.json')
+# Секрет вебхука: Telegram присылает его в X-Telegram-Bot-Api-Secret-Token.
+# Без него вебхук отклоняет все запросы
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')
+# Обрабатывать очередь вебхука фоновым потоком веб-процесса; False —
+# если запущен отдельный process_telegram_updates
+TELEGRAM_UPDATES_IN_PROCESS = os.environ.get('TELEGRAM_UPDATES_IN_PROCESS', 'True') == 'True'
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-fallback-key')
 
 DEBUG = True
@@ -27,7 +40,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "storage.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "storage.middleware.PrimaryStickyMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -56,13 +71,113 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "selfstorage.wsgi.application"
 
-DATABASES = {
-    "default": {
+# DB_ENGINE=sqlite (по умолчанию) или postgres (нужен пакет psycopg)
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get('DB_NAME', 'selfstorage'),
+            "USER": os.environ.get('DB_USER', 'selfstorage'),
+            "PASSWORD": os.environ.get('DB_PASSWORD', ''),
+            "HOST": os.environ.get('DB_HOST', 'localhost'),
+            "PORT": os.environ.get('DB_PORT', '5432'),
+            # Постоянные соединения с проверкой перед каждым запросом
+            "CONN_MAX_AGE": int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+else:
+    # WAL: чтение не блокируется записью; IMMEDIATE берёт блокировку записи
+    # в начале транзакции, и ожидание busy_timeout срабатывает вместо
+    # "database is locked" посреди транзакции
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get('DB_NAME', BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA busy_timeout=20000;"
+                    "PRAGMA mmap_size=134217728;"
+                    "PRAGMA cache_size=-20000;"
+                    "PRAGMA temp_store=MEMORY;"
+                ),
+            },
+        }
+    }
+
+# Реплика для чтения каталога и отчётов — см. storage/db_router.py.
+# Postgres: DB_REPLICA_HOST — хост реплики. SQLite: DB_READ_REPLICA=True
+# открывает тот же файл вторым соединением только для чтения
+if DB_ENGINE == 'postgres' and os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        "HOST": os.environ['DB_REPLICA_HOST'],
+        "PORT": os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        "TEST": {"MIRROR": "default"},
+    }
+elif DB_ENGINE != 'postgres' and os.environ.get('DB_READ_REPLICA', 'False') == 'True':
+    DATABASES['replica'] = {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": f"file:{DATABASES['default']['NAME']}?mode=ro",
+        "OPTIONS": {
+            "timeout": 20,
+            "init_command": (
+                "PRAGMA query_only=ON;"
+                "PRAGMA mmap_size=134217728;"
+                "PRAGMA cache_size=-20000;"
+            ),
+        },
+        "TEST": {"MIRROR": "default"},
     }
+
+DATABASE_ROUTERS = ['storage.db_router.ReplicaRouter']
+# Сколько секунд после записи клиент читает только с основной БД
+DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+
+# Кеш справочных данных (боксы, типы боксов, склады) — см. storage/reference_cache.py
+STORAGE_REFERENCE_CACHE = {
+    'MAXSIZE': 2048,
+    'TTL': 300,
+    'BACKEND': 'default',
 }
 
+# Ограничение частоты AJAX-запросов — см. storage/throttling.py.
+# Корзины лежат в кеше default: с LocMemCache лимит действует в каждом
+# процессе отдельно, общий для всех воркеров — с Redis/memcached
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+# Включать только за прокси, который сам выставляет X-Forwarded-For
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = os.environ.get('RATE_LIMIT_TRUST_X_FORWARDED_FOR', 'False') == 'True'
+
+# Метрики запросов — см. storage/request_metrics.py.
+# Время ответа пишется всегда, SQL считается для доли запросов
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', 'True') == 'True'
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0.1))
+# Токен для /metrics/ (Authorization: Bearer <токен>); без него — только сотрудники
+REQUEST_METRICS_TOKEN = os.environ.get('REQUEST_METRICS_TOKEN', '')
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 1000))
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
+# Один и тот же SQL чаще стольких раз за запрос считается N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+
+# Журнал запусков management-команд и профили --profile — см. storage/profiling.py
+COMMAND_PROFILE_DIR = BASE_DIR / 'logs' / 'profiles'
+COMMAND_RUNS_RETENTION_DAYS = int(os.environ.get('COMMAND_RUNS_RETENTION_DAYS', 90))
+# Профилировать каждый запуск планировщика (selfstorage/timer_scheduler.py)
+SCHEDULER_PROFILE = os.environ.get('SCHEDULER_PROFILE', 'False') == 'True'
+
+# CustomerBackend загружает пользователя сессии вместе с профилем и клиентом
+# (users/customer.py). ModelBackend оставлен для сессий, открытых до него
+AUTHENTICATION_BACKENDS = [
+    'users.customer.CustomerBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -100,7 +215,6 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-load_dotenv()
 gmail_password = os.environ.get('GMAIL_PASSWORD', '')
 email_host_user = os.environ.get('EMAIL_HOST_USER', '')
 
@@ -113,6 +227,16 @@ EMAIL_HOST_PASSWORD = gmail_password
 
 DEFAULT_FROM_EMAIL = f'SelfStorage <{email_host_user}>' if email_host_user else 'support@selfstorage.com'
 
+# Логи пишутся в фоне через очередь (storage/log_handlers.py): запись
+# в файл не задерживает запросы и рассылки
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+# JSON в файле — по строке на запись, удобно для сборщиков логов
+LOG_JSON = os.environ.get('LOG_JSON', 'False' if DEBUG else 'True') == 'True'
+# Доля массовых событий ниже WARNING (по одному на сообщение Telegram и т. п.)
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0 if DEBUG else 0.1))
+LOG_FILE_MAX_BYTES = int(os.environ.get('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024))
+LOG_FILE_BACKUP_COUNT = int(os.environ.get('LOG_FILE_BACKUP_COUNT', 5))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -125,6 +249,15 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'storage.log_handlers.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sample_high_volume': {
+            '()': 'storage.log_handlers.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
     },
     'handlers': {
         'console': {
@@ -132,9 +265,17 @@ LOGGING = {
             'formatter': 'verbose',
         },
         'file': {
-            'class': 'logging.FileHandler',
+            'class': 'logging.handlers.RotatingFileHandler',
             'filename': BASE_DIR / 'logs' / 'django.log',
-            'formatter': 'verbose',
+            'maxBytes': LOG_FILE_MAX_BYTES,
+            'backupCount': LOG_FILE_BACKUP_COUNT,
+            'encoding': 'utf-8',
+            'formatter': 'json' if LOG_JSON else 'verbose',
+        },
+        'queue': {
+            '()': 'storage.log_handlers.QueueListenerHandler',
+            'handlers': ['console', 'file'],
+            'filters': ['sample_high_volume'],
         },
     },
     'loggers': {
@@ -143,13 +284,18 @@ LOGGING = {
             'level': 'INFO',
         },
         'django.mail': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
             'propagate': True,
         },
         'storage': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'selfstorage': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },
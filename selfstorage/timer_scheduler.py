@@ -4,6 +4,7 @@ import time
 from django.core.management import call_command
 from django.db import connections
 from django.conf import settings
+from storage.db_router import job_scope
 import logging
 import atexit
 import signal
@@ -32,13 +33,21 @@ def send_telegrams_periodically(interval_minutes=1):  # Добавь парам
             try:
                 connections.close_all()
                 
-                # Вызываем Telegram-команду
-                call_command('send_telegram_reminders', verbosity=0)
+                # Вызываем Telegram-команду; запуск сохраняется в CommandRun с пометкой «по расписанию»
+                options = {'verbosity': 0, 'scheduled': True}
+                if getattr(settings, 'SCHEDULER_PROFILE', False):
+                    options['profile'] = ''
+                started = time.monotonic()
+                with job_scope():
+                    call_command('send_telegram_reminders', **options)
                 
-                logger.info(f"Telegram-проверка выполнена (следующая через {interval_minutes} мин)")
+                logger.info(
+                    "Telegram-проверка выполнена за %.1f с (следующая через %s мин)",
+                    time.monotonic() - started, interval_minutes,
+                )
                 
             except Exception as e:
-                logger.error(f"Ошибка при отправке Telegram: {e}")
+                logger.error("Ошибка при отправке Telegram: %s", e)
             
             # Ждём интервал перед следующей проверкой
             for _ in range(interval_seconds):
@@ -49,7 +58,7 @@ def send_telegrams_periodically(interval_minutes=1):  # Добавь парам
     timer_thread = threading.Thread(target=job, daemon=True)
     timer_thread.start()
     
-    logger.info(f"🤖 Telegram-планировщик запущен (интервал: {interval_minutes} минут)")
+    logger.info("🤖 Telegram-планировщик запущен (интервал: %s минут)", interval_minutes)
     return timer_thread
 
 
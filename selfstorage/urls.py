@@ -3,10 +3,12 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 from storage import views
+from storage.request_metrics import metrics_view
 
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path('', include('users.urls')),
     path('storage/', include('storage.urls')),
 ]
@@ -1,15 +1,20 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse, path
-from django.shortcuts import redirect
+from django.shortcuts import redirect, render
+from django.http import HttpResponse
 from django.contrib import messages
 from django.db.models import F, Q
 from django.utils.safestring import mark_safe
 from django import forms
 from datetime import date
-from .models import Warehouse, BoxType, Box, WarehouseImage, Client, RentalAgreement, PromoCode
+from .models import Warehouse, BoxType, Box, WarehouseImage, Client, RentalAgreement, PromoCode, CommandRun
 from .notification_service import TelegramNotificationService
 from django.utils.html import format_html
+from . import pricing, promo_cache
+from .reports import revenue_forecast, write_csv, write_json
+from .db_router import use_replica
+from .exports import export_response
 
 
 class RentStatusFilter(admin.SimpleListFilter):
@@ -118,6 +123,40 @@ class WarehouseAdmin(admin.ModelAdmin):
         ('Инфо для сайта', {'fields': ('description', 'directions', 'contacts'), 'classes': ('collapse',)}),
     )
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('revenue-report/',
+                 self.admin_site.admin_view(self.revenue_report),
+                 name='warehouse_revenue_report'),
+        ]
+        return custom_urls + urls
+
+    def revenue_report(self, request):
+        """Прогноз выручки и заполненности на 12 месяцев (?format=csv|json для выгрузки)"""
+        with use_replica():
+            rows = revenue_forecast(months=12)
+        export_format = request.GET.get('format')
+
+        if export_format == 'csv':
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="revenue_report.csv"'
+            write_csv(rows, response)
+            return response
+        if export_format == 'json':
+            response = HttpResponse(content_type='application/json; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="revenue_report.json"'
+            write_json(rows, response)
+            return response
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Прогноз выручки и заполненности',
+            'opts': self.model._meta,
+            'rows': rows,
+        }
+        return render(request, 'admin/storage/revenue_report.html', context)
+
     def get_total_boxes(self, obj):
         from .models import Box
         count = Box.objects.filter(box_type__warehouse_id=obj.id).count()
@@ -176,11 +215,16 @@ class BoxAdmin(admin.ModelAdmin):
     list_filter = ('status', 'box_type__category', 'box_type__warehouse')
     search_fields = ('number', 'box_type__warehouse__address')
     readonly_fields = ('current_agreement',)
+    actions = ['export_csv']
 
     def warehouse(self, obj):
         return obj.box_type.warehouse
     warehouse.short_description = "Склад"
 
+    def export_csv(self, request, queryset):
+        return export_response('boxes', queryset)
+    export_csv.short_description = "Выгрузить выбранные боксы в CSV"
+
 
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
@@ -247,11 +291,14 @@ class PromoCodeAdmin(admin.ModelAdmin):
     actions = ['activate_promocodes', 'deactivate_promocodes']
     
     def activate_promocodes(self, request, queryset):
+        # update() не вызывает сигналы — кеш промокодов сбрасываем сами
+        promo_cache.invalidate_codes(*queryset.values_list('code', flat=True))
         queryset.update(is_active=True)
         self.message_user(request, f"Активировано {queryset.count()} промокодов")
     activate_promocodes.short_description = "Активировать выбранные промокоды"
     
     def deactivate_promocodes(self, request, queryset):
+        promo_cache.invalidate_codes(*queryset.values_list('code', flat=True))
         queryset.update(is_active=False)
         self.message_user(request, f"Деактивировано {queryset.count()} промокодов")
     deactivate_promocodes.short_description = "Деактивировать выбранные промокоды"
@@ -344,6 +391,18 @@ class RentalAgreementAdmin(admin.ModelAdmin):
     )
 
     readonly_fields = ('price_display',)
+    actions = ['export_csv']
+
+    def export_csv(self, request, queryset):
+        return export_response('agreements', queryset)
+    export_csv.short_description = "Выгрузить выбранные договоры в CSV"
+
+    def get_queryset(self, request):
+        # Стоимость считается по аннотации, боксы — одним prefetch-запросом
+        queryset = super().get_queryset(request)
+        return pricing.with_pricing(queryset).select_related(
+            'client', 'warehouse'
+        ).prefetch_related('boxes')
     
     def get_urls(self):
         urls = super().get_urls()
@@ -456,11 +515,57 @@ class RentalAgreementAdmin(admin.ModelAdmin):
 class ClientAdmin(admin.ModelAdmin):
     list_display = ('full_name', 'phone', 'email', 'total_active_units')
     search_fields = ('full_name', 'phone', 'email')
+    actions = ['export_csv']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_active_units()
+
+    def export_csv(self, request, queryset):
+        return export_response('clients', queryset)
+    export_csv.short_description = "Выгрузить выбранных клиентов в CSV"
 
     def total_active_units(self, obj):
         return obj.total_active_units
     total_active_units.short_description = "Активных мест"
-    total_active_units.admin_order_field = 'id'
+    total_active_units.admin_order_field = 'active_units'
+
+
+
+@admin.register(CommandRun)
+class CommandRunAdmin(admin.ModelAdmin):
+    list_display = ('command', 'started_at', 'duration_display', 'queries', 'ok', 'scheduled')
+    list_filter = ('command', 'ok', 'scheduled')
+    date_hierarchy = 'started_at'
+    # Сырой JSON фаз не показываем — вместо него таблица phases_display
+    exclude = ('phases',)
+    readonly_fields = [field.name for field in CommandRun._meta.fields if field.name != 'phases'] + ['phases_display']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def duration_display(self, obj):
+        return f"{obj.duration:.2f} с"
+    duration_display.short_description = "Длительность"
+    duration_display.admin_order_field = 'duration'
+
+    def phases_display(self, obj):
+        rows = sorted(obj.phases.items(), key=lambda item: -item[1].get('seconds', 0))
+        return format_html(
+            '<table><tr><th>Фаза</th><th>Секунд</th><th>Вызовов</th><th>SQL</th></tr>{}</table>',
+            mark_safe(''.join(
+                format_html(
+                    # format_html экранирует аргументы до форматирования, поэтому
+                    # число форматируется заранее
+                    '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+                    name, f"{totals.get('seconds', 0):.3f}", totals.get('calls', 0), totals.get('queries', 0),
+                )
+                for name, totals in rows
+            )),
+        )
+    phases_display.short_description = "Время по фазам"
 
 
 # @admin.register(AdTransition)
@@ -0,0 +1,37 @@
+"""
+Нормализация контактов клиента для поиска.
+
+Client хранит email и телефон в том виде, в каком их ввели, а рядом —
+нормализованные копии (email_normalized, phone_e164) с индексами.
+Поиск (например, привязка Telegram по /start) сравнивает только их.
+"""
+import re
+
+
+PHONE_MIN_DIGITS = 10
+PHONE_MAX_DIGITS = 15
+
+
+def normalize_email(value):
+    """Email в нижнем регистре без пробелов по краям или '' для не-email"""
+    value = (value or '').strip().lower()
+    return value if '@' in value else ''
+
+
+def normalize_phone(value):
+    """
+    Телефон в формате E.164 (+79991234567) или ''.
+    Российские номера: 8XXXXXXXXXX и 10 цифр без кода страны приводятся к +7
+    """
+    value = (value or '').strip()
+    digits = re.sub(r'\D', '', value)
+
+    if not value.startswith('+'):
+        if len(digits) == 11 and digits[0] == '8':
+            digits = '7' + digits[1:]
+        elif len(digits) == 10:
+            digits = '7' + digits
+
+    if not PHONE_MIN_DIGITS <= len(digits) <= PHONE_MAX_DIGITS:
+        return ''
+    return '+' + digits
@@ -0,0 +1,112 @@
+"""
+Чтение каталога и отчётов с реплики.
+
+Если в settings.DATABASES есть алиас 'replica', чтения внутри use_replica()
+(или view с декоратором @read_replica) идут на него; все остальные чтения и
+любые записи — на 'default'. Без реплики роутер ничего не меняет.
+
+После первой записи запрос «прилипает» к основной БД до конца запроса,
+а PrimaryStickyMiddleware продлевает это на несколько секунд cookie,
+чтобы следующий запрос (order_view → order_confirmation_view) увидел
+свои же изменения, даже если реплика отстаёт. Фоновые циклы
+(планировщик, обработчик очереди Telegram) живут дольше одного запроса:
+каждое их задание выполняется в job_scope(), иначе после первой записи
+все следующие чтения потока ушли бы на основную БД. Запись сессии (её
+сохраняет SessionMiddleware почти на каждом запросе) прилипания не
+включает: сессии читаются только с основной БД.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+_has_written = ContextVar('has_written', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def read_alias():
+    """Алиас для явных read-only выборок (.using(...)) — реплика, если она есть"""
+    return REPLICA_DB_ALIAS if replica_configured() else DEFAULT_DB_ALIAS
+
+
+def start_request(pinned):
+    """Сбрасывает состояние потока перед новым запросом"""
+    _pinned_to_primary.set(pinned)
+    _has_written.set(False)
+
+
+def has_written():
+    return _has_written.get()
+
+
+def is_session_model(model):
+    from django.contrib.sessions.base_session import AbstractBaseSession
+
+    return issubclass(model, AbstractBaseSession)
+
+
+@contextmanager
+def job_scope():
+    """Одно задание фонового потока — как отдельный запрос для роутера"""
+    start_request(pinned=False)
+    try:
+        yield
+    finally:
+        start_request(pinned=False)
+
+
+@contextmanager
+def use_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_replica(view_func):
+    """View только читает данные — её запросы можно отдать реплике"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with use_replica():
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not replica_configured():
+            return None
+        if is_session_model(model):
+            return DEFAULT_DB_ALIAS
+        if _use_replica.get() and not (_pinned_to_primary.get() or _has_written.get()):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not replica_configured():
+            return None
+        if not is_session_model(model):
+            _has_written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,118 @@
+"""
+Потоковая выгрузка договоров, клиентов и боксов в CSV.
+
+Строки читаются из БД порциями через iterator(chunk_size=...) и сразу
+отдаются клиенту, поэтому память не растёт с числом записей, а заголовок
+уходит ещё до первого запроса к БД.
+"""
+import csv
+
+from django.http import StreamingHttpResponse
+
+from . import pricing
+from .db_router import read_alias
+from .models import Box, Client, RentalAgreement
+
+
+CHUNK_SIZE = 2000
+
+AGREEMENT_HEADER = (
+    'ID', 'Клиент', 'Телефон', 'Склад', 'Боксы', 'Дата начала', 'Дата окончания',
+    'Статус', 'Промокод', 'Стоимость/мес', 'Стоимость за срок',
+)
+CLIENT_HEADER = (
+    'ID', 'ФИО', 'Телефон', 'Email', 'Адрес', 'Telegram привязан',
+    'Активных мест', 'Дата создания',
+)
+BOX_HEADER = (
+    'ID', 'Номер', 'Склад', 'Размеры', 'Объем', 'Цена/мес', 'Статус', 'Текущий договор',
+)
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def agreement_rows(queryset):
+    queryset = pricing.with_pricing(queryset).select_related(
+        'client', 'warehouse'
+    ).prefetch_related('boxes')
+    for agreement in queryset.iterator(chunk_size=CHUNK_SIZE):
+        total_cost = pricing.agreement_total_cost(agreement)
+        yield (
+            agreement.pk,
+            agreement.client.full_name,
+            agreement.client.phone,
+            str(agreement.warehouse),
+            ', '.join(box.number for box in agreement.boxes.all()),
+            agreement.start_date.isoformat(),
+            agreement.end_date.isoformat() if agreement.end_date else '',
+            agreement.get_status_display(),
+            agreement.promo_code.code if agreement.promo_code else '',
+            pricing.agreement_monthly_cost(agreement),
+            total_cost if total_cost is not None else '',
+        )
+
+
+def client_rows(queryset):
+    for client in queryset.with_active_units().iterator(chunk_size=CHUNK_SIZE):
+        yield (
+            client.pk,
+            client.full_name,
+            client.phone,
+            client.email or '',
+            client.address,
+            'да' if client.telegram_linked else 'нет',
+            client.total_active_units,
+            client.created_at.strftime('%d.%m.%Y %H:%M'),
+        )
+
+
+def box_rows(queryset):
+    queryset = queryset.select_related('box_type', 'box_type__warehouse')
+    for box in queryset.iterator(chunk_size=CHUNK_SIZE):
+        box_type = box.box_type
+        yield (
+            box.pk,
+            box.number,
+            str(box_type.warehouse),
+            f"{box_type.length}x{box_type.width}x{box_type.height}",
+            box_type.volume,
+            box_type.price,
+            box.get_status_display(),
+            box.current_agreement_id or '',
+        )
+
+
+EXPORTS = {
+    'agreements': (RentalAgreement, AGREEMENT_HEADER, agreement_rows),
+    'clients': (Client, CLIENT_HEADER, client_rows),
+    'boxes': (Box, BOX_HEADER, box_rows),
+}
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel правильно открыл кириллицу
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def streaming_csv_response(filename, header, rows):
+    response = StreamingHttpResponse(
+        iter_csv(header, rows),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_response(name, queryset):
+    _, header, row_builder = EXPORTS[name]
+    # Строки читаются уже после выхода из view, поэтому реплика указывается явно
+    queryset = queryset.using(read_alias())
+    return streaming_csv_response(f'{name}.csv', header, row_builder(queryset))
@@ -0,0 +1,176 @@
+"""
+Локальная заглушка Telegram Bot API для нагрузочных тестов.
+
+Поддерживает sendMessage, sendPhoto, getUpdates (long polling),
+setWebhook, deleteWebhook и getMe. Задержка ответа, доля ошибок 5xx
+и доля ответов 429 (с retry_after) настраиваются. Запуск отдельным
+процессом — manage.py fake_telegram_api, внутри процесса — FakeBotAPI.start().
+
+Служебные адреса: GET /_fake/stats — счётчики, POST /_fake/updates —
+поставить обновление (JSON без update_id) в очередь getUpdates.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeBotAPI:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.responses = Counter()
+        self.updates = []
+        self.webhook_url = ''
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._lock = threading.Lock()
+        self._updates_changed = threading.Condition(self._lock)
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push_update(self, update):
+        """Ставит обновление в очередь getUpdates; update_id назначается здесь"""
+        with self._updates_changed:
+            update = {**update, 'update_id': self._next_update_id}
+            self._next_update_id += 1
+            self.updates.append(update)
+            self._updates_changed.notify_all()
+        return update['update_id']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'responses': dict(self.responses),
+                'pending_updates': len(self.updates),
+            }
+
+    def handle(self, method, params):
+        """(HTTP-статус, тело ответа) для вызова метода"""
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            return self._error(429, f'Too Many Requests: retry after {self.retry_after}',
+                               parameters={'retry_after': self.retry_after})
+        if roll < self.rate_limit_rate + self.error_rate:
+            return self._error(500, 'Internal Server Error')
+
+        handler = getattr(self, f'api_{method}', None)
+        if handler is None:
+            return self._error(404, 'Not Found')
+        result = handler(params)
+        with self._lock:
+            self.responses[200] += 1
+        return 200, {'ok': True, 'result': result}
+
+    def _error(self, status, description, **extra):
+        with self._lock:
+            self.responses[status] += 1
+        return status, {'ok': False, 'error_code': status, 'description': description, **extra}
+
+    def _message(self, params):
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return {'message_id': message_id, 'date': int(time.time()), 'chat': {'id': params.get('chat_id')}}
+
+    def api_sendMessage(self, params):
+        return {**self._message(params), 'text': params.get('text', '')}
+
+    def api_sendPhoto(self, params):
+        return {**self._message(params), 'caption': params.get('caption', '')}
+
+    def api_getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        with self._updates_changed:
+            # Как Telegram: смещение подтверждает все обновления до него
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self._updates_changed.wait(deadline - time.monotonic())
+            return self.updates[:limit]
+
+    def api_setWebhook(self, params):
+        self.webhook_url = params.get('url', '')
+        return True
+
+    def api_deleteWebhook(self, params):
+        self.webhook_url = ''
+        return True
+
+    def api_getMe(self, params):
+        return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+
+def _make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Заголовки и тело уходят разными write: без этого keep-alive ловит
+        # задержку Nagle + delayed ACK (~40 мс) на каждый ответ
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == '/_fake/stats':
+                self._send(200, api.stats())
+            else:
+                self._dispatch({})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if self.path == '/_fake/updates':
+                update_id = api.push_update(json.loads(body or b'{}'))
+                self._send(200, {'ok': True, 'update_id': update_id})
+                return
+            params = {}
+            if self.headers.get_content_type() == 'application/json' and body:
+                params = json.loads(body)
+            self._dispatch(params)
+
+        def _dispatch(self, params):
+            # /bot<token>/<method>
+            parts = self.path.split('?', 1)[0].strip('/').split('/')
+            if len(parts) != 2 or not parts[0].startswith('bot'):
+                self._send(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                return
+            self._send(*api.handle(parts[1], params))
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
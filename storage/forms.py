@@ -1,6 +1,11 @@
+import logging
+
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import Warehouse, Box, RentalAgreement
+from . import inventory, pricing
+
+logger = logging.getLogger(__name__)
 
 
 class OrderForm(forms.Form):
@@ -176,11 +181,11 @@ class OrderForm(forms.Form):
             volume_needed = length * width * height
             cleaned_data['volume_needed'] = volume_needed
             
-            suitable_box = Box.objects.filter(
-                box_type__warehouse=warehouse,
-                status='free',
-                box_type__volume__gte=volume_needed
-            ).order_by('box_type__volume').first()
+            # Тот же выбор, что и у расчёта цены на странице (ajax best-fit)
+            fit = inventory.best_fit_box(warehouse.pk, volume_needed)
+            suitable_box = Box.objects.select_related('box_type__warehouse').filter(
+                pk=fit['id'], status='free'
+            ).first() if fit else None
             
             if not suitable_box:
                 any_free = Box.objects.filter(
@@ -225,32 +230,16 @@ class OrderForm(forms.Form):
             box = cleaned_data['selected_box']
             duration = cleaned_data['rental_duration']
             
-            monthly_price = float(box.box_type.price)
-            
-            duration_discount = 0
-            if duration >= 12:
-                duration_discount = 0.15
-            elif duration >= 6:
-                duration_discount  = 0.10
-                
-            price_after_duration = monthly_price * (1 - duration_discount) 
-            
-            final_monthly = price_after_duration * (1 - promo_discount / 100)
-            
-            total = final_monthly * duration
+            price_info = pricing.quote(box.box_type.price, duration, promo_discount)
             
             return {
+                **price_info,
                 'volume': float(box.box_type.volume),
-                'monthly_price': round(final_monthly, 2),
-                'total_price': round(total, 2),
-                'discount_percent': int(duration_discount * 100),
-                'promo_discount': promo_discount,
-                'duration': duration,
                 'box_number': box.number,
                 'box_dimensions': f"{box.box_type.length}×{box.box_type.width}×{box.box_type.height}",
                 'warehouse': str(box.box_type.warehouse),  
             }
             
         except Exception as e:
-            print(f"Error in calculate_price: {e}")
+            logger.exception("Error in calculate_price: %s", e)
             return default_result
\ No newline at end of file
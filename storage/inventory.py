@@ -0,0 +1,170 @@
+"""
+Наличие свободных боксов по складам.
+
+У каждого склада есть счётчик Warehouse.inventory_version, который
+увеличивается при любом изменении его боксов или типов боксов
+(см. signals.py). Счётчик служит ETag для AJAX-эндпоинта и ключом
+кеша для готового ответа.
+
+Дополнительно в кеше Django хранится общая версия каталога — её
+увеличивает каждый bump_version. По ней кешируются целые страницы
+каталога для анонимных посетителей без обращения к БД.
+"""
+import threading
+import time
+from bisect import bisect_left
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Box, Warehouse
+
+
+CACHE_TIMEOUT = 60 * 60
+CATALOG_VERSION_KEY = 'storage:catalog:version'
+
+
+def bump_version(**warehouse_filters):
+    """Увеличивает версию наличия у складов, подходящих под фильтр"""
+    Warehouse.objects.filter(**warehouse_filters).update(
+        inventory_version=F('inventory_version') + 1
+    )
+    bump_catalog_version()
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Отсчёт от текущего времени: после потери ключа версия
+        # не совпадёт ни с одной из уже использованных
+        version = time.time_ns()
+        cache.add(CATALOG_VERSION_KEY, version, None)
+        version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def bump_version_for_boxes(box_ids):
+    if box_ids:
+        bump_version(pk__in=Box.objects.filter(pk__in=box_ids).values('box_type__warehouse_id'))
+
+
+def get_version(warehouse_id):
+    """Текущая версия наличия склада или None, если склада нет"""
+    return Warehouse.objects.filter(pk=warehouse_id).values_list(
+        'inventory_version', flat=True
+    ).first()
+
+
+def make_etag(warehouse_id, version):
+    return f'inv-{warehouse_id}-{version}'
+
+
+def build_inventory(warehouse_id, version):
+    """Свободные боксы склада в колоночном виде"""
+    boxes = Box.objects.filter(
+        box_type__warehouse_id=warehouse_id,
+        status='free',
+    ).order_by('number').values_list(
+        'id', 'number',
+        'box_type__volume', 'box_type__length', 'box_type__width', 'box_type__height',
+        'box_type__price',
+    )
+
+    columns = {
+        'ids': [], 'numbers': [], 'volumes': [],
+        'lengths': [], 'widths': [], 'heights': [], 'prices': [],
+    }
+    for box_id, number, volume, length, width, height, price in boxes:
+        columns['ids'].append(box_id)
+        columns['numbers'].append(number)
+        columns['volumes'].append(float(volume))
+        columns['lengths'].append(float(length))
+        columns['widths'].append(float(width))
+        columns['heights'].append(float(height))
+        columns['prices'].append(float(price))
+
+    return {'warehouse_id': int(warehouse_id), 'version': version, **columns}
+
+
+def get_inventory(warehouse_id, version):
+    """Наличие из кеша; ключ содержит версию, поэтому устаревшие записи не читаются"""
+    key = f'storage:inventory:{warehouse_id}:{version}'
+    data = cache.get(key)
+    if data is None:
+        data = build_inventory(warehouse_id, version)
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+class VolumeIndex:
+    """Свободные боксы склада, отсортированные по объёму, для поиска bisect'ом"""
+
+    def __init__(self, version, boxes):
+        self.version = version
+        self.boxes = sorted(boxes, key=lambda box: (box['volume'], box['number']))
+        self.volumes = [box['volume'] for box in self.boxes]
+
+    def best_fit(self, volume):
+        """Наименьший бокс, вмещающий volume, или None"""
+        position = bisect_left(self.volumes, volume)
+        if position == len(self.boxes):
+            return None
+        return self.boxes[position]
+
+
+_volume_indexes = {}
+_volume_indexes_lock = threading.Lock()
+
+
+def get_volume_index(warehouse_id, version):
+    """
+    Индекс из памяти процесса. Версия наличия читается из БД на каждый
+    запрос, поэтому изменения в других процессах тоже сбрасывают индекс
+    """
+    index = _volume_indexes.get(warehouse_id)
+    if index is not None and index.version == version:
+        return index
+
+    with _volume_indexes_lock:
+        index = _volume_indexes.get(warehouse_id)
+        if index is None or index.version != version:
+            data = get_inventory(warehouse_id, version)
+            boxes = [
+                {
+                    'id': box_id,
+                    'number': number,
+                    'volume': Decimal(str(volume)),
+                    'length': length,
+                    'width': width,
+                    'height': height,
+                    'price': Decimal(str(price)),
+                }
+                for box_id, number, volume, length, width, height, price in zip(
+                    data['ids'], data['numbers'], data['volumes'],
+                    data['lengths'], data['widths'], data['heights'], data['prices'],
+                )
+            ]
+            index = VolumeIndex(version, boxes)
+            _volume_indexes[warehouse_id] = index
+    return index
+
+
+def best_fit_box(warehouse_id, volume, version=None):
+    """
+    Наименьший свободный бокс склада под объём, при равном объёме — с
+    меньшим номером; None, если такого нет. Один выбор и для расчёта
+    цены на странице заказа, и для назначения бокса при оформлении
+    """
+    if version is None:
+        version = get_version(warehouse_id)
+        if version is None:
+            return None
+    return get_volume_index(int(warehouse_id), version).best_fit(volume)
@@ -0,0 +1,119 @@
+"""
+Обработчики логов: запись в файл и консоль вынесена из рабочих потоков.
+
+QueueListenerHandler кладёт запись в очередь, а фоновый QueueListener
+передаёт её целевым обработчикам (handlers в settings.LOGGING). Поток
+слушателя запускается при первой записи в каждом процессе, так что
+воркеры, порождённые fork, получают свой.
+
+JsonFormatter — одна JSON-строка на запись, поля из extra= попадают в неё.
+SamplingFilter пропускает долю записей ниже WARNING, помеченных
+extra=HIGH_VOLUME (например, по одной на каждое отправленное сообщение).
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Пометка массовых событий для SamplingFilter
+HIGH_VOLUME = {'high_volume': True}
+
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'high_volume'}
+
+
+class QueueListenerHandler(QueueHandler):
+    """handlers — имена обработчиков из того же settings.LOGGING"""
+
+    def __init__(self, handlers, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.handler_names = handlers
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _targets(self):
+        # Обработчики создаются dictConfig по имени; к первой записи они уже есть
+        get_handler = getattr(logging, 'getHandlerByName', None)
+        if get_handler is None:
+            get_handler = lambda name: logging._handlers.get(name)
+        return [handler for handler in map(get_handler, self.handler_names) if handler is not None]
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.listener = QueueListener(self.queue, *self._targets(), respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+            atexit.register(self._stop)
+
+    def _stop(self):
+        # QueueListener.stop нельзя вызывать дважды (close и atexit)
+        with self._start_lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self._pid = None
+
+    def prepare(self, record):
+        # Как QueueHandler.prepare, но трассировка остаётся в exc_text, а не в тексте сообщения
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Лог не должен тормозить запросы: при переполнении запись теряется
+            pass
+
+    def close(self):
+        self._stop()
+        super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, 'high_volume', False):
+            return True
+        return self.rate >= 1 or random.random() < self.rate
@@ -0,0 +1,45 @@
+from storage.contacts import normalize_email, normalize_phone
+from storage.models import Client
+from storage.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = 'Заполняет email_normalized и phone_e164 у клиентов заново (после смены правил нормализации)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для чтения и bulk_update',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        clients = Client.objects.only(
+            'pk', 'email', 'phone', 'email_normalized', 'phone_e164'
+        ).order_by('pk')
+
+        checked = updated = 0
+        batch = []
+        for client in clients.iterator(chunk_size=batch_size):
+            checked += 1
+            email = normalize_email(client.email)
+            phone = normalize_phone(client.phone)
+            if client.email_normalized == email and client.phone_e164 == phone:
+                continue
+            client.email_normalized = email
+            client.phone_e164 = phone
+            batch.append(client)
+            if len(batch) >= batch_size:
+                updated += self._flush(batch)
+
+        updated += self._flush(batch)
+        self.stdout.write(self.style.SUCCESS(f'Проверено клиентов: {checked}, обновлено: {updated}'))
+
+    def _flush(self, batch):
+        count = len(batch)
+        if batch:
+            Client.objects.bulk_update(batch, ['email_normalized', 'phone_e164'])
+            batch.clear()
+        return count
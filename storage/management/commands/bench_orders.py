@@ -0,0 +1,120 @@
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+
+from django.db import OperationalError, connection, transaction
+
+from storage.models import AdTransition, Box, BoxType, Client, RentalAgreement, Warehouse
+from storage.profiling import ProfiledCommand
+
+
+MARKER = '__bench_orders__'
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Нагрузочный тест записи: параллельное оформление заказов на текущей БД. '
+        'Создаёт временный склад с боксами и удаляет всё созданное после прогона'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Параллельных потоков')
+        parser.add_argument('--orders', type=int, default=50, help='Заказов на поток')
+
+    def handle(self, *args, **options):
+        workers, orders = options['workers'], options['orders']
+        self._describe_database()
+
+        warehouse = Warehouse.objects.create(town=MARKER, address=MARKER, ceiling_height=3)
+        try:
+            box_type = BoxType.objects.create(
+                warehouse=warehouse, length=1, width=1, height=1, price=1000,
+            )
+            Box.objects.bulk_create(
+                [Box(box_type=box_type, number=str(n)) for n in range(workers * orders)],
+                batch_size=1000,
+            )
+            box_ids = list(box_type.boxes.order_by('pk').values_list('pk', flat=True))
+
+            results = [[] for _ in range(workers)]
+            errors = [0] * workers
+            threads = [
+                threading.Thread(
+                    target=self._worker,
+                    args=(warehouse, box_ids[n * orders:(n + 1) * orders], results[n], errors, n),
+                )
+                for n in range(workers)
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            self._cleanup(warehouse)
+
+        latencies = sorted(latency for worker in results for latency in worker)
+        self._report(workers, latencies, sum(errors), elapsed)
+
+    def _worker(self, warehouse, box_ids, latencies, errors, n):
+        """Повторяет запись order_view: клиент, договор, бокс + вставка из AdTrackingMiddleware"""
+        try:
+            for i, box_id in enumerate(box_ids):
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        client = Client.objects.create(
+                            full_name=f'{MARKER} {n}-{i}', address='', phone='',
+                        )
+                        agreement = RentalAgreement.objects.create(
+                            client=client,
+                            warehouse=warehouse,
+                            end_date=date.today() + timedelta(days=30),
+                            status='active',
+                        )
+                        agreement.boxes.add(box_id)
+                    AdTransition.objects.create(
+                        session_key=f'{MARKER}{n}-{i}', source='other', landing_page='/',
+                    )
+                except OperationalError:
+                    errors[n] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+
+    def _describe_database(self):
+        settings_dict = connection.settings_dict
+        line = f"БД: {connection.vendor} ({settings_dict['NAME']})"
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                pragmas = {}
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    pragmas[pragma] = cursor.fetchone()[0]
+            line += ', ' + ', '.join(f'{name}={value}' for name, value in pragmas.items())
+        else:
+            line += f", CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}"
+        self.stdout.write(line)
+
+    def _cleanup(self, warehouse):
+        AdTransition.objects.filter(session_key__startswith=MARKER).delete()
+        RentalAgreement.objects.filter(warehouse=warehouse).delete()
+        Client.objects.filter(full_name__startswith=MARKER).delete()
+        warehouse.delete()
+
+    def _report(self, workers, latencies, errors, elapsed):
+        done = len(latencies)
+        self.stdout.write(f'Потоков: {workers}, заказов: {done}, ошибок блокировки: {errors}')
+        self.stdout.write(f'Время: {elapsed:.2f} с, пропускная способность: {done / elapsed:.1f} заказов/с')
+        if latencies:
+            p95 = latencies[min(done - 1, int(done * 0.95))]
+            self.stdout.write(
+                f'Задержка, мс: p50 {statistics.median(latencies) * 1000:.1f}, '
+                f'p95 {p95 * 1000:.1f}, max {latencies[-1] * 1000:.1f}'
+            )
+        style = self.style.SUCCESS if not errors else self.style.WARNING
+        self.stdout.write(style('Готово'))
@@ -0,0 +1,117 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.db import connection
+
+from storage import telegram_dispatch
+from storage.models import Client, RentalAgreement, TelegramChat, Warehouse
+from storage.profiling import ProfiledCommand
+
+
+MARKER = '__bench_telegram__'
+# Отрицательные ID — групповые чаты, с чатами клиентов не пересекаются
+CHAT_ID_BASE = -10 ** 12
+# Диалог одного раунда: справка, выбор договора для продления, отказ,
+# сообщение вне диалога и отмена — без отправки QR и изменения договоров
+ROUND = ['/help', '/extend', '1', 'нет', 'привет', '/cancel']
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Замер накладных расходов диспетчера Telegram-бота: сообщений в секунду '
+        'и запросов к БД на сообщение с кешем состояния чатов и без него. '
+        'Создаёт временных клиентов и удаляет их после прогона'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=200, help='Чатов (клиентов)')
+        parser.add_argument('--rounds', type=int, default=5, help='Раундов диалога на чат')
+
+    def handle(self, *args, **options):
+        chats, rounds = options['chats'], options['rounds']
+        routing = self._bench_routing()
+        self.stdout.write(f'Разбор команды и выбор обработчика: {routing:,.0f} сообщений/с')
+
+        warehouse = Warehouse.objects.create(town=MARKER, address=MARKER, ceiling_height=3)
+        try:
+            chat_ids = self._seed(warehouse, chats)
+            for title, cold in (('С кешем договоров', False), ('Без кеша (договоры из БД на каждое сообщение)', True)):
+                TelegramChat.objects.filter(pk__in=chat_ids).delete()
+                telegram_dispatch.agreements_cache.clear()
+                latencies, queries, elapsed = self._run(chat_ids, rounds, cold)
+                self._report(title, latencies, queries, elapsed)
+        finally:
+            telegram_dispatch.agreements_cache.clear()
+            TelegramChat.objects.filter(client__full_name__startswith=MARKER).delete()
+            RentalAgreement.objects.filter(warehouse=warehouse).delete()
+            Client.objects.filter(full_name__startswith=MARKER).delete()
+            warehouse.delete()
+
+    def _bench_routing(self, count=100000):
+        """Только регулярное выражение и таблица команд, без обработчиков"""
+        texts = ['/start user@example.com', '/qr', '/extend@bot', 'привет', '2']
+        started = time.perf_counter()
+        for n in range(count):
+            match = telegram_dispatch.COMMAND_RE.match(texts[n % len(texts)])
+            if match:
+                telegram_dispatch.COMMANDS.get(match['name'].lower())
+        return count / (time.perf_counter() - started)
+
+    def _seed(self, warehouse, chats):
+        clients = Client.objects.bulk_create([
+            Client(
+                full_name=f'{MARKER} {n}',
+                address='',
+                phone=f'+7900{n:07d}',
+                phone_e164=f'+7900{n:07d}',
+            )
+            for n in range(chats)
+        ])
+        end_date = date.today() + timedelta(days=60)
+        RentalAgreement.objects.bulk_create([
+            RentalAgreement(client=client, warehouse=warehouse, end_date=end_date + timedelta(days=k))
+            for client in clients
+            for k in range(2)
+        ])
+        return [CHAT_ID_BASE - n for n in range(chats)]
+
+    def _run(self, chat_ids, rounds, cold):
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        messages = [
+            (chat_id, f'/start +7900{n:07d}') for n, chat_id in enumerate(chat_ids)
+        ] + [
+            (chat_id, text) for _ in range(rounds) for text in ROUND for chat_id in chat_ids
+        ]
+        latencies = []
+        with connection.execute_wrapper(count_queries):
+            started = time.perf_counter()
+            for update_id, (chat_id, text) in enumerate(messages):
+                if cold:
+                    telegram_dispatch.agreements_cache.clear()
+                message_started = time.perf_counter()
+                telegram_dispatch.dispatch({
+                    'update_id': update_id,
+                    'message': {'chat': {'id': chat_id}, 'text': text},
+                })
+                latencies.append(time.perf_counter() - message_started)
+            elapsed = time.perf_counter() - started
+        return sorted(latencies), queries[0], elapsed
+
+    def _report(self, title, latencies, queries, elapsed):
+        count = len(latencies)
+        p95 = latencies[min(count - 1, int(count * 0.95))]
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(
+            f'  Сообщений: {count}, {count / elapsed:.0f} сообщений/с, '
+            f'запросов к БД на сообщение: {queries / count:.2f}'
+        )
+        self.stdout.write(
+            f'  Задержка, мс: p50 {statistics.median(latencies) * 1000:.2f}, p95 {p95 * 1000:.2f}'
+        )
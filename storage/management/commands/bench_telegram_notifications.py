@@ -0,0 +1,147 @@
+import io
+import threading
+import time
+from datetime import date, timedelta
+
+from django.test.utils import override_settings
+
+from selfstorage.management.commands.send_telegram_reminders import Command as RemindersCommand
+from storage import telegram_api
+from storage.fake_telegram import FakeBotAPI
+from storage.models import Client, RentalAgreement, Warehouse
+from storage.notification_service import TelegramNotificationService
+from storage.profiling import ProfiledCommand
+
+
+MARKER = '__bench_notifications__'
+CHAT_ID_BASE = -2 * 10 ** 12
+
+
+class TimedBotAPI(telegram_api.BotAPI):
+    """BotAPI, который запоминает длительность и исход каждого вызова (с повторами)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = []
+        self._records_lock = threading.Lock()
+
+    def call(self, method, *args, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = super().call(method, *args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._records_lock:
+                self.records.append((method, time.perf_counter() - started, ok))
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Нагрузочный тест отправки Telegram-уведомлений через локальную заглушку Bot API: '
+        'прогон напоминаний и отправка QR-кодов. Создаёт временные договоры и удаляет их после прогона'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agreements', type=int, default=200, help='Договоров для напоминаний')
+        parser.add_argument('--qr', type=int, default=50, help='Отправок QR-кода')
+        parser.add_argument('--latency-ms', type=float, default=30, help='Задержка ответа заглушки')
+        parser.add_argument('--error-rate', type=float, default=0.02, help='Доля ответов 500')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.05, help='Доля ответов 429')
+        parser.add_argument('--retry-after', type=float, default=0.2, help='retry_after в ответах 429, с')
+        parser.add_argument(
+            '--api-url',
+            help='Уже запущенная заглушка (manage.py fake_telegram_api); по умолчанию поднимается своя',
+        )
+
+    def handle(self, *args, **options):
+        fake = None
+        api_url = options['api_url']
+        if not api_url:
+            fake = FakeBotAPI(
+                latency=options['latency_ms'] / 1000,
+                error_rate=options['error_rate'],
+                rate_limit_rate=options['rate_limit_rate'],
+                retry_after=options['retry_after'],
+                seed=1,
+            )
+            api_url = fake.start()
+        self.stdout.write(f'Bot API: {api_url}')
+
+        warehouse = Warehouse.objects.create(town=MARKER, address=MARKER, ceiling_height=3)
+        try:
+            self._seed(warehouse, options['agreements'])
+            with override_settings(TELEGRAM_API_URL=api_url, TELEGRAM_BOT_TOKEN='bench'):
+                self._phase('Напоминания (send_telegram_reminders)', self._run_reminders, warehouse)
+                self._phase('QR-коды (send_qr_code_for_access)', self._run_qr, warehouse, options['qr'])
+        finally:
+            telegram_api.reset_api()
+            RentalAgreement.objects.filter(warehouse=warehouse).delete()
+            Client.objects.filter(full_name__startswith=MARKER).delete()
+            warehouse.delete()
+            if fake is not None:
+                fake.stop()
+                self.stdout.write(f'Заглушка: {fake.stats()}')
+
+    def _seed(self, warehouse, count):
+        clients = Client.objects.bulk_create([
+            Client(
+                full_name=f'{MARKER} {n}',
+                address='',
+                phone='',
+                telegram_chat_id=str(CHAT_ID_BASE - n),
+                telegram_linked=True,
+            )
+            for n in range(count)
+        ])
+        # Окончание через 1–29 дней: каждому договору положено от одного до четырёх напоминаний
+        today = date.today()
+        RentalAgreement.objects.bulk_create([
+            RentalAgreement(
+                client=client,
+                warehouse=warehouse,
+                end_date=today + timedelta(days=1 + n % 29),
+                status='active',
+            )
+            for n, client in enumerate(clients)
+        ])
+
+    def _agreements(self, warehouse):
+        return RentalAgreement.objects.filter(
+            warehouse=warehouse, status='active', end_date__isnull=False
+        ).select_related('client', 'warehouse').prefetch_related('boxes').order_by('pk')
+
+    def _run_reminders(self, warehouse):
+        """Та же проверка и отправка, что в send_telegram_reminders, только по тестовым договорам"""
+        command = RemindersCommand(stdout=io.StringIO())
+        today = date.today()
+        for agreement in self._agreements(warehouse):
+            command._check_and_send_reminders(agreement, (agreement.end_date - today).days)
+
+    def _run_qr(self, warehouse, count):
+        for agreement in self._agreements(warehouse)[:count]:
+            TelegramNotificationService.send_qr_code_for_access(agreement)
+
+    def _phase(self, title, run, *args):
+        api = TimedBotAPI()
+        telegram_api.reset_api(api)
+        started = time.perf_counter()
+        run(*args)
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency, _ in api.records)
+        sent = sum(ok for _, _, ok in api.records)
+        failed = len(api.records) - sent
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(
+            f'  Сообщений отправлено: {sent}, не отправлено: {failed}, повторов: {api.retries}'
+        )
+        if latencies:
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            p50 = latencies[len(latencies) // 2]
+            self.stdout.write(
+                f'  {sent / elapsed:.1f} сообщений/с за {elapsed:.2f} с; '
+                f'задержка вызова с повторами, мс: p50 {p50 * 1000:.1f}, p99 {p99 * 1000:.1f}'
+            )
@@ -0,0 +1,156 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from django.db.models import Max, Min
+from django.test import Client as HttpClient
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from storage import telegram_api, telegram_updates
+from storage.fake_telegram import FakeBotAPI
+from storage.models import TelegramChat, TelegramUpdate
+from storage.profiling import ProfiledCommand
+from storage.telegram_webhook import SECRET_HEADER
+
+
+SECRET = 'bench-secret'
+UPDATE_ID_BASE = 9 * 10 ** 15
+CHAT_ID_BASE = -3 * 10 ** 12
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Нагрузочный тест вебхука Telegram: отправляет обновления на telegram_webhook '
+        'с заданной частотой, обработчик очереди отвечает через локальную заглушку Bot API. '
+        'Тестовые обновления и чаты удаляются после прогона'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=500, help='Обновлений в секунду')
+        parser.add_argument('--duration', type=float, default=10, help='Длительность отправки, с')
+        parser.add_argument('--chats', type=int, default=200, help='Разных чатов')
+        parser.add_argument('--concurrency', type=int, default=16, help='Параллельных запросов к вебхуку')
+        parser.add_argument('--latency-ms', type=float, default=30, help='Задержка ответа заглушки')
+        parser.add_argument('--error-rate', type=float, default=0, help='Доля ответов 500')
+        parser.add_argument('--drain-timeout', type=float, default=120, help='Ожидание разбора очереди, с')
+        parser.add_argument(
+            '--api-url',
+            help='Уже запущенная заглушка (manage.py fake_telegram_api); по умолчанию поднимается своя',
+        )
+
+    def handle(self, *args, **options):
+        fake = None
+        api_url = options['api_url']
+        if not api_url:
+            fake = FakeBotAPI(latency=options['latency_ms'] / 1000, error_rate=options['error_rate'], seed=1)
+            api_url = fake.start()
+        self.stdout.write(f'Bot API: {api_url}')
+
+        total = int(options['rate'] * options['duration'])
+        try:
+            with override_settings(
+                TELEGRAM_API_URL=api_url,
+                TELEGRAM_BOT_TOKEN='bench',
+                TELEGRAM_WEBHOOK_SECRET=SECRET,
+                TELEGRAM_UPDATES_IN_PROCESS=True,
+                ALLOWED_HOSTS=['testserver'],
+                RATE_LIMIT_ENABLED=False,
+            ):
+                telegram_api.reset_api()
+                latencies, statuses, elapsed = self._send(total, options)
+                drained = self._drain(options['drain_timeout'])
+                self._report(total, latencies, statuses, elapsed, drained)
+        finally:
+            telegram_api.reset_api()
+            TelegramUpdate.objects.filter(update_id__gte=UPDATE_ID_BASE).delete()
+            TelegramChat.objects.filter(
+                chat_id__lte=CHAT_ID_BASE, chat_id__gt=CHAT_ID_BASE - options['chats']
+            ).delete()
+            if fake is not None:
+                fake.stop()
+                self.stdout.write(f'Заглушка: {fake.stats()}')
+
+    def _send(self, total, options):
+        """Отправляет total обновлений с частотой rate; (задержки, статусы ответов, секунд)"""
+        url = reverse('telegram_webhook')
+        local = threading.local()
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+
+        def post(n):
+            if not hasattr(local, 'client'):
+                local.client = HttpClient()
+            update = {
+                'update_id': UPDATE_ID_BASE + n,
+                'message': {'chat': {'id': CHAT_ID_BASE - n % options['chats']}, 'text': '/help'},
+            }
+            started = time.perf_counter()
+            response = local.client.post(
+                url, json.dumps(update), content_type='application/json',
+                headers={SECRET_HEADER: SECRET},
+            )
+            latency = time.perf_counter() - started
+            close_old_connections()
+            with lock:
+                latencies.append(latency)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for n in range(total):
+                # Равномерный поток: n-е обновление уходит в started + n / rate
+                delay = started + n / options['rate'] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(post, n)
+        return sorted(latencies), statuses, time.perf_counter() - started
+
+    def _drain(self, timeout):
+        """Ждёт, пока обработчик разберёт очередь; True, если успел"""
+        deadline = time.monotonic() + timeout
+        pending = TelegramUpdate.objects.filter(
+            update_id__gte=UPDATE_ID_BASE, status__in=['new', 'processing']
+        )
+        while pending.exists():
+            if time.monotonic() > deadline:
+                return False
+            telegram_updates.notify_worker()
+            time.sleep(0.2)
+        return True
+
+    def _report(self, total, latencies, statuses, elapsed, drained):
+        self.stdout.write(self.style.MIGRATE_HEADING('Вебхук'))
+        self.stdout.write(
+            f'  Отправлено {total} обновлений за {elapsed:.2f} с ({total / elapsed:.1f}/с); '
+            f'ответы: {statuses}'
+        )
+        if latencies:
+            self.stdout.write(
+                f'  Время ответа вебхука, мс: p50 {percentile(latencies, 0.5) * 1000:.1f}, '
+                f'p99 {percentile(latencies, 0.99) * 1000:.1f}, max {latencies[-1] * 1000:.1f}'
+            )
+
+        updates = TelegramUpdate.objects.filter(update_id__gte=UPDATE_ID_BASE)
+        done = updates.filter(status='done')
+        self.stdout.write(self.style.MIGRATE_HEADING('Обработка очереди'))
+        self.stdout.write(
+            f'  Обработано: {done.count()}, ошибок: {updates.filter(status="failed").count()}, '
+            f'в очереди: {updates.filter(status__in=["new", "processing"]).count()}'
+            + ('' if drained else ' (очередь не разобрана за отведённое время)')
+        )
+        span = done.aggregate(first=Min('received_at'), last=Max('processed_at'))
+        if span['first'] and span['last']:
+            seconds = (span['last'] - span['first']).total_seconds()
+            self.stdout.write(
+                f'  От первого получения до последнего ответа: {seconds:.2f} с '
+                f'({done.count() / max(seconds, 0.001):.1f} обновлений/с)'
+            )
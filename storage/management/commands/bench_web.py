@@ -0,0 +1,211 @@
+import json
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from storage.management.commands.seed_benchmark_data import (
+    ADMIN_USERNAME, EMAIL_DOMAIN, seeded_warehouses,
+)
+from storage.models import AdTransition, Box, Client, RentalAgreement, Warehouse
+from storage.profiling import ProfiledCommand
+
+
+class Scenario:
+    """
+    Один замер: запрос (метод, URL, данные) от имени пользователя.
+    cold — очищать кеш перед каждым запросом; mutating — запрос пишет в БД,
+    весь прогон откатывается
+    """
+
+    def __init__(self, name, path, method='get', user=None, cold=False, mutating=False, data=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.user = user
+        self.cold = cold
+        self.mutating = mutating
+        self.data = data
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Замер горячих страниц на данных seed_benchmark_data: задержка и число '
+        'запросов к БД. Результаты можно сохранить (--json) и сравнить с прошлым прогоном (--compare)'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов (не учитываются)')
+        parser.add_argument('--only', help='Только сценарии, в названии которых есть подстрока')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в файл')
+        parser.add_argument('--compare', help='Файл с результатами прошлого прогона')
+
+    def handle(self, *args, **options):
+        warehouse = seeded_warehouses().annotate(n=Count('box_types__boxes')).order_by('-n').first()
+        if warehouse is None:
+            raise CommandError('Нет данных: сначала запустите seed_benchmark_data')
+        self.warehouse = warehouse
+        self.admin = User.objects.get(username=ADMIN_USERNAME)
+        # Клиент с наибольшим числом договоров — худший случай для «Моей аренды»
+        self.renter = Client.objects.filter(
+            email__endswith=f'@{EMAIL_DOMAIN}'
+        ).annotate(n=Count('agreements')).order_by('-n').select_related('user').first().user
+
+        scenarios = [
+            scenario for scenario in self._scenarios()
+            if not options['only'] or options['only'] in scenario.name
+        ]
+        results = {}
+        # Тестовый клиент ходит с Host: testserver; ограничение частоты исказило бы замер
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(RATE_LIMIT_ENABLED=False, ALLOWED_HOSTS=allowed_hosts):
+            for scenario in scenarios:
+                results[scenario.name] = self._run(scenario, options['repeat'], options['warmup'])
+
+        report = {
+            'commit': self._commit(),
+            'database': connection.vendor,
+            'data': self._data_size(),
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        previous = self._load(options['compare']) if options['compare'] else None
+        self._print(report, previous)
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты сохранены в {options['json_path']}")
+
+    def _scenarios(self):
+        warehouse_id = self.warehouse.pk
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+        order = {
+            'warehouse': warehouse_id,
+            'rental_duration': 3,
+            'start_date': tomorrow,
+            'pdn_accepted': 'on',
+            'need_length': '1',
+            'need_width': '1',
+            'need_height': '1',
+        }
+
+        def manual_order():
+            box = Box.objects.filter(box_type__warehouse_id=warehouse_id, status='free').first()
+            return {**order, 'mode': 'manual', 'selected_box': box.pk if box else ''}
+
+        return [
+            Scenario('home: аноним, кеш страницы', '/'),
+            Scenario('home: без кеша', '/', cold=True),
+            Scenario('boxes: аноним, кеш страницы', '/boxes/'),
+            Scenario('boxes: без кеша', '/boxes/', cold=True),
+            Scenario('ajax get-boxes: крупнейший склад', f'/storage/ajax/get-boxes/?warehouse_id={warehouse_id}'),
+            Scenario('order POST: ручной выбор', '/storage/order/', method='post', user=self.renter,
+                     mutating=True, data=manual_order),
+            Scenario('order POST: автоподбор', '/storage/order/', method='post', user=self.renter,
+                     mutating=True, data=lambda: {**order, 'mode': 'auto'}),
+            Scenario('my-rent: клиент с максимумом договоров', '/my-rent/', user=self.renter),
+            Scenario('cabinet: личный кабинет', '/cabinet/', user=self.renter),
+            Scenario('admin: договоры', '/admin/storage/rentalagreement/', user=self.admin),
+            Scenario('admin: клиенты', '/admin/storage/client/', user=self.admin),
+            Scenario('admin: боксы', '/admin/storage/box/', user=self.admin),
+            Scenario('admin: склады', '/admin/storage/warehouse/', user=self.admin),
+            Scenario('admin: промокоды', '/admin/storage/promocode/', user=self.admin),
+        ]
+
+    def _run(self, scenario, repeat, warmup):
+        client = TestClient()
+        if scenario.user is not None:
+            client.force_login(scenario.user)
+
+        latencies, queries, statuses = [], [], {}
+        with self._rolled_back(scenario.mutating):
+            for n in range(warmup + repeat):
+                if scenario.cold:
+                    cache.clear()
+                data = scenario.data() if callable(scenario.data) else scenario.data
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(client, scenario.method)(scenario.path, data)
+                    elapsed = time.perf_counter() - started
+                if n < warmup:
+                    continue
+                latencies.append(elapsed)
+                queries.append(len(captured))
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        latencies.sort()
+        return {
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+            'queries': statistics.median(queries),
+            'queries_max': max(queries),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        }
+
+    @contextmanager
+    def _rolled_back(self, enabled):
+        """Заказы в замере не должны менять данные для следующих прогонов"""
+        if not enabled:
+            yield
+            return
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+        cache.clear()
+
+    def _data_size(self):
+        return {
+            'warehouses': Warehouse.objects.count(),
+            'boxes': Box.objects.count(),
+            'clients': Client.objects.count(),
+            'agreements': RentalAgreement.objects.count(),
+            'transitions': AdTransition.objects.count(),
+        }
+
+    def _commit(self):
+        try:
+            result = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+            )
+        except (OSError, subprocess.SubprocessError):
+            return ''
+        return result.stdout.strip()
+
+    def _load(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать {path}: {e}')
+
+    def _print(self, report, previous):
+        data = ', '.join(f'{name}={count}' for name, count in report['data'].items())
+        self.stdout.write(f"Коммит {report['commit'] or '?'}, БД {report['database']}, данные: {data}")
+        if previous:
+            old_data = ', '.join(f'{name}={count}' for name, count in previous['data'].items())
+            self.stdout.write(f"Сравнение с {previous['commit'] or '?'} ({old_data})")
+
+        self.stdout.write(f"{'Сценарий':<42} {'p50, мс':>9} {'p95, мс':>9} {'запросов':>9}  статусы")
+        for name, result in report['results'].items():
+            line = (
+                f"{name:<42} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                f"{result['queries']:>9g}  {result['statuses']}"
+            )
+            old = (previous or {}).get('results', {}).get(name)
+            if old:
+                line += f"  (было p50 {old['p50_ms']:.2f} мс, запросов {old['queries']:g})"
+            self.stdout.write(line)
@@ -0,0 +1,109 @@
+import re
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from storage.models import AdTransition, Box, Client, PromoCode, RentalAgreement
+from storage.profiling import ProfiledCommand
+
+
+def hot_queries():
+    """(название, таблица, которая должна читаться по индексу, queryset)"""
+    today = date.today()
+    return [
+        (
+            'Свободные боксы типа',
+            Box._meta.db_table,
+            Box.objects.filter(box_type_id=1, status='free'),
+        ),
+        (
+            'Свободные боксы склада',
+            Box._meta.db_table,
+            Box.objects.filter(box_type__warehouse_id=1, status='free'),
+        ),
+        (
+            'Активные договоры с датой окончания (напоминания)',
+            RentalAgreement._meta.db_table,
+            RentalAgreement.objects.filter(status='active', end_date__isnull=False),
+        ),
+        (
+            'Истекающие договоры',
+            RentalAgreement._meta.db_table,
+            RentalAgreement.objects.filter(status='active', end_date__lte=today + timedelta(days=30)),
+        ),
+        (
+            'Промокод уже использован клиентом',
+            RentalAgreement._meta.db_table,
+            RentalAgreement.objects.filter(client_id=1, promo_code_id=1),
+        ),
+        (
+            'Недавний рекламный переход сессии',
+            AdTransition._meta.db_table,
+            AdTransition.objects.filter(
+                session_key='x', created_at__gt=timezone.now() - timedelta(minutes=30)
+            ),
+        ),
+        (
+            'Клиент по email (/start)',
+            Client._meta.db_table,
+            Client.objects.filter(email_normalized='x@example.com'),
+        ),
+        (
+            'Клиент по телефону (/start)',
+            Client._meta.db_table,
+            Client.objects.filter(phone_e164='+70000000000'),
+        ),
+        (
+            'Активный промокод по коду',
+            PromoCode._meta.db_table,
+            PromoCode.objects.filter(code='X', is_active=True),
+        ),
+    ]
+
+
+def full_scan(plan, table):
+    """Есть ли в плане полный просмотр таблицы table"""
+    if connection.vendor == 'sqlite':
+        # "SCAN t" — полный просмотр; "SEARCH t USING INDEX ..." — поиск по индексу
+        return re.search(rf'\bSCAN {re.escape(table)}\b(?! USING (COVERING )?INDEX)', plan) is not None
+    if connection.vendor == 'postgresql':
+        return re.search(rf'Seq Scan on {re.escape(table)}\b', plan) is not None
+    return 'ALL' in plan
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Проверяет через EXPLAIN, что горячие запросы используют индексы, '
+        'и замеряет их время. Завершается ошибкой при полном просмотре таблицы'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200, help='Повторов для замера времени')
+        parser.add_argument('--verbose-plan', action='store_true', help='Печатать планы целиком')
+
+    def handle(self, *args, **options):
+        failed = []
+        for name, table, queryset in hot_queries():
+            plan = queryset.explain()
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            avg_ms = sum(timings) / len(timings) * 1000
+
+            if full_scan(plan, table):
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {name} ({avg_ms:.3f} мс)'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'INDEX      {name} ({avg_ms:.3f} мс)'))
+                if options['verbose_plan']:
+                    self.stdout.write(plan)
+
+        if failed:
+            raise CommandError(f'Полный просмотр таблицы в запросах: {", ".join(failed)}')
@@ -0,0 +1,36 @@
+from storage.db_router import read_alias
+from storage.exports import EXPORTS, iter_csv
+from storage.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = 'Потоковая выгрузка договоров, клиентов или боксов в CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'entity',
+            choices=sorted(EXPORTS),
+            help='Что выгружать',
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для сохранения (по умолчанию stdout)',
+        )
+
+    def handle(self, *args, **options):
+        model, header, row_builder = EXPORTS[options['entity']]
+        chunks = iter_csv(header, row_builder(model.objects.using(read_alias())))
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        count = -1
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Выгружено {count} строк в {options['output']}"
+        ))
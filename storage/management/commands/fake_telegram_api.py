@@ -0,0 +1,41 @@
+import time
+
+
+from storage.fake_telegram import FakeBotAPI
+from storage.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Локальная заглушка Telegram Bot API для нагрузочных тестов. '
+        'Укажите её адрес в TELEGRAM_API_URL у тестируемого процесса'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--latency-ms', type=float, default=50, help='Задержка каждого ответа')
+        parser.add_argument('--error-rate', type=float, default=0, help='Доля ответов 500')
+        parser.add_argument('--rate-limit-rate', type=float, default=0, help='Доля ответов 429')
+        parser.add_argument('--retry-after', type=float, default=1, help='retry_after в ответах 429, с')
+
+    def handle(self, *args, **options):
+        api = FakeBotAPI(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            retry_after=options['retry_after'],
+        )
+        url = api.start()
+        self.stdout.write(self.style.SUCCESS(f'Заглушка Bot API: {url} (TELEGRAM_API_URL={url})'))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            api.stop()
+        self.stdout.write(f'Статистика: {api.stats()}')
@@ -0,0 +1,207 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from storage import inventory
+from storage.models import Box, BoxType, Warehouse
+from storage.profiling import ProfiledCommand
+
+
+REQUIRED_FIELDS = ('warehouse', 'number', 'length', 'width', 'height', 'price')
+DIMENSION_FIELDS = ('length', 'width', 'height')
+STATUSES = {value for value, _ in Box.STATUS_CHOICES}
+CENT = Decimal('0.01')
+
+
+def decimal_limit(model, field_name):
+    """Наибольшее значение DecimalField: max_digits=5, decimal_places=2 -> 999.99"""
+    field = model._meta.get_field(field_name)
+    return Decimal(10) ** (field.max_digits - field.decimal_places) - Decimal(10) ** -field.decimal_places
+
+
+# Больше не поместится в колонку: bulk_create упадёт посреди транзакции
+LIMITS = {field: decimal_limit(BoxType, field) for field in DIMENSION_FIELDS + ('price', 'volume')}
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Массовая загрузка типов боксов и боксов из CSV/JSON. '
+        'Поля: warehouse (ID склада), number, length, width, height, price, status (необязательно)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .json')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'json'],
+            help='Формат файла (по умолчанию — по расширению)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только проверить файл, ничего не сохранять',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Укажите --format csv или --format json')
+
+        try:
+            records = self._read(path, file_format)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать {path}: {e}')
+
+        rows, errors = self._validate(records)
+        if errors:
+            for error in errors[:50]:
+                self.stderr.write(self.style.ERROR(error))
+            if len(errors) > 50:
+                self.stderr.write(self.style.ERROR(f'... и ещё {len(errors) - 50} ошибок'))
+            raise CommandError(f'Файл не загружен: {len(errors)} ошибок')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Проверено {len(rows)} боксов, ошибок нет'))
+            return
+
+        with transaction.atomic():
+            types_created, boxes_created = self._import(rows)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано типов боксов: {types_created}, боксов: {boxes_created}'
+        ))
+
+    def _read(self, path, file_format):
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            if file_format == 'json':
+                data = json.load(f)
+                if not isinstance(data, list):
+                    raise ValueError('ожидается JSON-массив объектов')
+                return data
+            return list(csv.DictReader(f))
+
+    def _validate(self, records):
+        """Проверяет строки и приводит значения к типам. Возвращает (rows, errors)"""
+        warehouse_ids = set(Warehouse.objects.values_list('pk', flat=True))
+        rows = []
+        errors = []
+        seen = set()
+
+        for line, record in enumerate(records, start=1):
+            missing = [field for field in REQUIRED_FIELDS if not str(record.get(field) or '').strip()]
+            if missing:
+                errors.append(f"Строка {line}: не заполнены поля {', '.join(missing)}")
+                continue
+
+            try:
+                warehouse_id = int(record['warehouse'])
+                values = {
+                    field: Decimal(str(record[field]).replace(',', '.')).quantize(CENT)
+                    for field in DIMENSION_FIELDS + ('price',)
+                }
+            except (ValueError, InvalidOperation):
+                values = None
+            if values is None or not all(value.is_finite() for value in values.values()):
+                errors.append(f'Строка {line}: неверное число')
+                continue
+
+            if warehouse_id not in warehouse_ids:
+                errors.append(f'Строка {line}: склад #{warehouse_id} не найден')
+                continue
+            if any(values[field] < Decimal('0.1') for field in DIMENSION_FIELDS):
+                errors.append(f'Строка {line}: размеры должны быть не меньше 0.1 м')
+                continue
+            if values['price'] < 0:
+                errors.append(f'Строка {line}: цена не может быть отрицательной')
+                continue
+            too_large = [field for field in DIMENSION_FIELDS + ('price',) if values[field] > LIMITS[field]]
+            if too_large:
+                errors.append(f'Строка {line}: ' + ', '.join(
+                    f'{BoxType._meta.get_field(field).verbose_name} больше {LIMITS[field]}'
+                    for field in too_large
+                ))
+                continue
+            volume = (values['length'] * values['width'] * values['height']).quantize(CENT)
+            if volume > LIMITS['volume']:
+                errors.append(f"Строка {line}: объём {volume} м³ больше {LIMITS['volume']}")
+                continue
+
+            number = str(record['number']).strip()
+            if len(number) > Box._meta.get_field('number').max_length:
+                errors.append(f'Строка {line}: слишком длинный номер бокса {number}')
+                continue
+
+            status = str(record.get('status') or 'free').strip()
+            if status not in STATUSES:
+                errors.append(f'Строка {line}: неизвестный статус {status}')
+                continue
+
+            key = (warehouse_id, values['length'], values['width'], values['height'], values['price'])
+            if (key, number) in seen:
+                errors.append(f'Строка {line}: бокс №{number} повторяется в файле')
+                continue
+            seen.add((key, number))
+
+            rows.append({'type_key': key, 'number': number, 'status': status})
+
+        return rows, errors
+
+    def _import(self, rows):
+        warehouse_ids = {row['type_key'][0] for row in rows}
+        box_types = {
+            (bt.warehouse_id, bt.length, bt.width, bt.height, bt.price): bt
+            for bt in BoxType.objects.filter(warehouse_id__in=warehouse_ids)
+        }
+
+        # Новые типы боксов: объём и категория считаются здесь, т.к. bulk_create
+        # не вызывает pre_save-сигнал calculate_box_properties
+        new_types = []
+        for key in dict.fromkeys(row['type_key'] for row in rows):
+            if key in box_types:
+                continue
+            warehouse_id, length, width, height, price = key
+            volume, category = BoxType.calculate_properties(length, width, height)
+            box_type = BoxType(
+                warehouse_id=warehouse_id,
+                length=length,
+                width=width,
+                height=height,
+                volume=volume,
+                category=category,
+                price=price,
+            )
+            box_types[key] = box_type
+            new_types.append(box_type)
+        BoxType.objects.bulk_create(new_types, batch_size=1000)
+
+        type_ids = {box_type.pk for box_type in box_types.values()}
+        existing = set(
+            Box.objects.filter(box_type_id__in=type_ids).values_list('box_type_id', 'number')
+        )
+        duplicates = [
+            row['number'] for row in rows
+            if (box_types[row['type_key']].pk, row['number']) in existing
+        ]
+        if duplicates:
+            raise CommandError(
+                f"Боксы уже существуют: {', '.join(duplicates[:20])}"
+                + (' ...' if len(duplicates) > 20 else '')
+            )
+
+        boxes = Box.objects.bulk_create(
+            [
+                Box(box_type=box_types[row['type_key']], number=row['number'], status=row['status'])
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+
+        BoxType.objects.filter(pk__in=type_ids).refresh_counters()
+        # bulk_create не вызывает сигналы, поэтому версию наличия обновляем сами
+        inventory.bump_version(pk__in=warehouse_ids)
+        return len(new_types), len(boxes)
@@ -0,0 +1,39 @@
+import time
+
+from django.db import close_old_connections
+
+from storage import telegram_updates
+from storage.db_router import job_scope
+from storage.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = 'Обрабатывает очередь обновлений Telegram-вебхука отдельным процессом'
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и выйти')
+        parser.add_argument('--batch-size', type=int, default=telegram_updates.BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1, help='Пауза при пустой очереди, с')
+
+    def handle(self, *args, **options):
+        processed = 0
+        last_purge = 0
+        try:
+            while True:
+                with job_scope():
+                    count = telegram_updates.process_batch(limit=options['batch_size'])
+                processed += count
+                if count:
+                    continue
+                if options['once']:
+                    break
+
+                if time.monotonic() - last_purge > telegram_updates.PURGE_INTERVAL:
+                    telegram_updates.purge_processed()
+                    last_purge = time.monotonic()
+                close_old_connections()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Обработано обновлений: {processed}'))
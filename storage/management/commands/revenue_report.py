@@ -0,0 +1,44 @@
+from io import StringIO
+
+
+from storage.db_router import use_replica
+from storage.profiling import ProfiledCommand
+from storage.reports import revenue_forecast, write_csv, write_json
+
+
+class Command(ProfiledCommand):
+    help = 'Прогноз выручки и заполненности складов по месяцам (CSV/JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=12,
+            help='Горизонт прогноза в месяцах (по умолчанию 12)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'json'],
+            default='csv',
+            help='Формат вывода',
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для сохранения отчёта (по умолчанию stdout)',
+        )
+
+    def handle(self, *args, **options):
+        with use_replica():
+            rows = revenue_forecast(months=options['months'])
+        writer = write_json if options['format'] == 'json' else write_csv
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                writer(rows, f)
+            self.stderr.write(self.style.SUCCESS(
+                f"Отчёт сохранён: {options['output']} ({len(rows)} строк)"
+            ))
+        else:
+            buffer = StringIO()
+            writer(rows, buffer)
+            self.stdout.write(buffer.getvalue())
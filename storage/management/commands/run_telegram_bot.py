@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from storage.profiling import ProfiledCommand
+from storage.telegram_api import BotAPI, TelegramAPIError
+from storage.telegram_dispatch import dispatch, update_chat_id
+
+
+logger = logging.getLogger('storage.telegram_bot')
+
+
+def in_daemon_thread(func, *args, **kwargs):
+    """
+    Запускает блокирующий вызов в daemon-потоке. Для long polling: при остановке
+    незавершённый getUpdates не должен задерживать выход процесса
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(result, error):
+        if not future.cancelled():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def target():
+        result = error = None
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(resolve, result, error)
+        except RuntimeError:
+            pass  # цикл событий уже закрыт
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+
+class OffsetStore:
+    """
+    Смещение getUpdates и ID уже обработанных обновлений текущей пачки в файле.
+    Telegram считает обновления подтверждёнными только после getUpdates
+    со смещением больше их ID, поэтому при падении посреди пачки она придёт
+    снова, а уже обработанные её обновления будут пропущены
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = None
+        self.done = set()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning('Повреждён файл смещения %s, начинаем заново', self.path)
+            return
+        self.offset = state.get('offset')
+        self.done = set(state.get('done', []))
+
+    def save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'offset': self.offset, 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+    def mark_done(self, update_id):
+        self.done.add(update_id)
+        self.save()
+
+    def advance(self, offset):
+        self.offset = offset
+        self.done = {update_id for update_id in self.done if update_id >= offset}
+        self.save()
+
+
+class Metrics:
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=1000)
+        self._window_started = time.monotonic()
+        self._window_processed = 0
+
+    def observe(self, latency, ok):
+        self.latencies.append(latency)
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+
+    def report(self):
+        now = time.monotonic()
+        total = self.processed + self.failed
+        rate = (total - self._window_processed) / max(now - self._window_started, 1e-9)
+        self._window_started, self._window_processed = now, total
+
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            logger.info(
+                'Бот: обработано %s, ошибок %s, %.1f обновл./с, задержка p50 %.1f мс, p95 %.1f мс',
+                self.processed, self.failed, rate,
+                statistics.median(ordered) * 1000, p95 * 1000,
+            )
+        else:
+            logger.info('Бот: обработано %s, ошибок %s, %.1f обновл./с', self.processed, self.failed, rate)
+
+
+class Command(ProfiledCommand):
+    help = 'Telegram-бот на long polling: параллельная обработка обновлений с сохранением смещения'
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Обработчиков одновременно')
+        parser.add_argument('--poll-timeout', type=int, default=50, help='Таймаут long polling, с')
+        parser.add_argument('--metrics-interval', type=int, default=60, help='Период вывода метрик, с')
+        parser.add_argument(
+            '--offset-file',
+            default=settings.TELEGRAM_OFFSET_FILE,
+            help='Файл для сохранения смещения getUpdates',
+        )
+
+    def handle(self, *args, **options):
+        self.api = BotAPI(pool_size=options['workers'] + 1)
+        self.store = OffsetStore(options['offset_file'])
+        self.metrics = Metrics()
+        self.options = options
+        try:
+            asyncio.run(self.run())
+        finally:
+            self.api.close()
+            self.metrics.report()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # ORM и requests синхронные: выполняются в пуле потоков размером с число обработчиков
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.options['workers']))
+
+        self.stopping = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        self.store.load()
+        # У каждого обработчика своя очередь, чат всегда попадает в одну и ту же:
+        # обновления чата («/extend», затем «1») обрабатываются по порядку
+        queues = [asyncio.Queue(maxsize=4) for _ in range(self.options['workers'])]
+        workers = [asyncio.create_task(self.worker(queue)) for queue in queues]
+        reporter = asyncio.create_task(self.report_metrics())
+        logger.info('Бот запущен (long polling), смещение %s', self.store.offset)
+
+        try:
+            await self.poll(queues)
+        finally:
+            for task in workers + [reporter]:
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            logger.info('Бот остановлен, смещение %s', self.store.offset)
+
+    async def poll(self, queues):
+        poll_timeout = self.options['poll_timeout']
+        while not self.stopping.is_set():
+            get_updates = asyncio.ensure_future(in_daemon_thread(
+                self.api.get_updates, offset=self.store.offset, timeout=poll_timeout,
+            ))
+            stop = asyncio.create_task(self.stopping.wait())
+            await asyncio.wait({get_updates, stop}, return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+            if self.stopping.is_set():
+                get_updates.cancel()
+                return
+
+            try:
+                updates = get_updates.result()
+            except TelegramAPIError as e:
+                logger.error('Ошибка getUpdates: %s', e)
+                await asyncio.sleep(5)
+                continue
+
+            if not updates:
+                continue
+
+            # Пачка обрабатывается параллельно (разные чаты); смещение сдвигается,
+            # когда она обработана целиком, и только после этого Telegram её подтверждает
+            for update in updates:
+                if update['update_id'] not in self.store.done:
+                    chat_id = update_chat_id(update)
+                    shard = hash(chat_id if chat_id is not None else update['update_id'])
+                    await queues[shard % len(queues)].put(update)
+            for queue in queues:
+                await queue.join()
+            self.store.advance(updates[-1]['update_id'] + 1)
+
+    async def worker(self, queue):
+        while True:
+            update = await queue.get()
+            started = time.perf_counter()
+            ok = True
+            try:
+                await asyncio.to_thread(self.process_update, update)
+            except Exception:
+                ok = False
+                logger.exception('Ошибка обработки обновления %s', update.get('update_id'))
+            finally:
+                self.metrics.observe(time.perf_counter() - started, ok)
+                self.store.mark_done(update['update_id'])
+                queue.task_done()
+
+    def process_update(self, update):
+        close_old_connections()
+        try:
+            reply = dispatch(update)
+        finally:
+            close_old_connections()
+        if reply:
+            chat_id, text = reply
+            self.api.send_message(chat_id, text)
+
+    async def report_metrics(self):
+        while True:
+            await asyncio.sleep(self.options['metrics_interval'])
+            self.metrics.report()
@@ -0,0 +1,245 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from storage import contacts, inventory
+from storage.models import (
+    AdTransition, Box, BoxType, Client, PromoCode, RentalAgreement, Warehouse,
+)
+from storage.profiling import ProfiledCommand
+from users.models import Profile
+
+
+# Помечает сгенерированные данные: по нему их находит --clear и bench_web
+MARKER = '[seed]'
+USERNAME_PREFIX = 'seed_user_'
+ADMIN_USERNAME = 'seed_admin'
+EMAIL_DOMAIN = 'seed.example'
+
+# (длина, ширина, высота, цена в месяц) — типы боксов на каждом складе
+BOX_SIZES = [
+    (1, 1, 1, 1500),
+    (1.5, 1, 2, 2900),
+    (2, 1.5, 2, 4500),
+    (2, 2, 2.5, 6900),
+    (3, 2, 2.5, 9500),
+    (4, 3, 3, 16000),
+]
+STATUS_WEIGHTS = {'active': 70, 'completed': 20, 'overdue': 5, 'cancelled': 5}
+AD_SOURCES = ['yandex', 'google', 'vk', 'telegram']
+# Доля боксов, которую могут занять договоры: заказу нужны свободные
+MAX_OCCUPANCY = 0.7
+
+
+def seeded_warehouses():
+    return Warehouse.objects.filter(address__startswith=MARKER)
+
+
+class Command(ProfiledCommand):
+    help = (
+        'Генерирует воспроизводимый набор данных для bench_web: склады, боксы, '
+        'клиентов с пользователями, договоры и рекламные переходы. '
+        'Запускайте на отдельной БД'
+    )
+    record_runs = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warehouses', type=int, default=10)
+        parser.add_argument('--boxes', type=int, default=2000, help='Боксов всего')
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--agreements', type=int, default=3000)
+        parser.add_argument('--transitions', type=int, default=10000, help='Рекламных переходов')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно генератора')
+        parser.add_argument('--clear', action='store_true', help='Удалить ранее сгенерированные данные')
+
+    def handle(self, *args, **options):
+        if options['boxes'] < options['warehouses'] * len(BOX_SIZES):
+            raise CommandError(f'Нужно хотя бы {len(BOX_SIZES)} бокса на склад')
+
+        started = time.perf_counter()
+        self.random = random.Random(options['seed'])
+        with transaction.atomic():
+            if options['clear']:
+                self._clear()
+            if seeded_warehouses().exists():
+                raise CommandError('Данные уже сгенерированы; используйте --clear')
+
+            warehouses = self._warehouses(options['warehouses'])
+            boxes = self._boxes(warehouses, options['boxes'])
+            clients = self._clients(options['clients'])
+            promo_codes = self._promo_codes()
+            agreements = self._agreements(clients, boxes, promo_codes, options['agreements'])
+            self._transitions(clients, options['transitions'])
+
+            BoxType.objects.filter(warehouse__in=warehouses).refresh_counters()
+            # bulk_create не вызывает сигналы, поэтому версию наличия обновляем сами
+            inventory.bump_version(pk__in=[warehouse.pk for warehouse in warehouses])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Складов: {len(warehouses)}, боксов: {len(boxes)}, клиентов: {len(clients)}, '
+            f'договоров: {agreements}, переходов: {options["transitions"]} '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def _clear(self):
+        warehouses = seeded_warehouses()
+        AdTransition.objects.filter(session_key__startswith=MARKER).delete()
+        RentalAgreement.objects.filter(warehouse__in=warehouses).delete()
+        Client.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+        PromoCode.objects.filter(code__startswith='SEED').delete()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        User.objects.filter(username=ADMIN_USERNAME).delete()
+        warehouses.delete()
+
+    def _warehouses(self, count):
+        return Warehouse.objects.bulk_create([
+            Warehouse(
+                town=f'Город {n % 5 + 1}',
+                address=f'{MARKER} ул. Складская, д. {n + 1}',
+                description='Сгенерированный склад',
+                ceiling_height=Decimal('3.50'),
+            )
+            for n in range(count)
+        ])
+
+    def _boxes(self, warehouses, count):
+        box_types = []
+        for warehouse in warehouses:
+            for length, width, height, price in BOX_SIZES:
+                length, width, height = Decimal(str(length)), Decimal(str(width)), Decimal(str(height))
+                volume, category = BoxType.calculate_properties(length, width, height)
+                box_types.append(BoxType(
+                    warehouse=warehouse, length=length, width=width, height=height,
+                    volume=volume, category=category, price=price,
+                ))
+        box_types = BoxType.objects.bulk_create(box_types, batch_size=1000)
+
+        boxes = [
+            Box(box_type=box_types[n % len(box_types)], number=str(n // len(box_types) + 1))
+            for n in range(count)
+        ]
+        return Box.objects.bulk_create(boxes, batch_size=1000)
+
+    def _clients(self, count):
+        # Хеш пароля считается один раз: make_password на каждого занял бы минуты
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(
+                username=f'{USERNAME_PREFIX}{n}',
+                email=f'user{n}@{EMAIL_DOMAIN}',
+                first_name=f'Клиент{n}',
+                last_name='Тестовый',
+                password=password,
+            )
+            for n in range(count)
+        ], batch_size=1000)
+        User.objects.create_superuser(ADMIN_USERNAME, f'admin@{EMAIL_DOMAIN}', None)
+        Profile.objects.bulk_create(
+            [Profile(user=user, phone=f'+7900{n:07d}') for n, user in enumerate(users)],
+            batch_size=1000,
+        )
+
+        clients = []
+        for n, user in enumerate(users):
+            phone = f'+7 900 {n:07d}'
+            clients.append(Client(
+                user=user,
+                full_name=f'{user.first_name} {user.last_name}',
+                address=f'ул. Клиентская, д. {n + 1}',
+                phone=phone,
+                email=user.email,
+                # Client.save не вызывается при bulk_create
+                email_normalized=contacts.normalize_email(user.email),
+                phone_e164=contacts.normalize_phone(phone),
+            ))
+        return Client.objects.bulk_create(clients, batch_size=1000)
+
+    def _promo_codes(self):
+        today = date.today()
+        return PromoCode.objects.bulk_create([
+            PromoCode(
+                code=f'SEED{n}',
+                discount_percent=5 * (n + 1),
+                valid_from=today - timedelta(days=30),
+                valid_until=today + timedelta(days=365),
+                max_uses=0,
+            )
+            for n in range(5)
+        ])
+
+    def _agreements(self, clients, boxes, promo_codes, count):
+        today = date.today()
+        free_boxes = list(boxes)
+        self.random.shuffle(free_boxes)
+        free_boxes = free_boxes[:int(len(free_boxes) * MAX_OCCUPANCY)]
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+
+        agreements, assigned = [], []
+        used_promos = set()
+        for n in range(count):
+            status = self.random.choices(statuses, weights)[0]
+            # Занимают бокс только действующие договоры, пока есть свободные
+            box = free_boxes.pop() if status in ('active', 'overdue') and free_boxes else None
+            if box is None and status in ('active', 'overdue'):
+                status = 'completed'
+
+            client = self.random.choice(clients)
+            start = today - timedelta(days=self.random.randint(0, 720))
+            if status == 'overdue':
+                end = today - timedelta(days=self.random.randint(1, 200))
+            elif status == 'active':
+                end = today + timedelta(days=self.random.randint(-5, 365))
+            else:
+                end = start + timedelta(days=self.random.randint(30, 365))
+
+            promo = None
+            if self.random.random() < 0.1:
+                promo = self.random.choice(promo_codes)
+                if (client.pk, promo.pk) in used_promos:
+                    promo = None
+                else:
+                    used_promos.add((client.pk, promo.pk))
+
+            agreements.append(RentalAgreement(
+                client=client,
+                warehouse=box.box_type.warehouse if box else self.random.choice(boxes).box_type.warehouse,
+                start_date=start,
+                end_date=end if self.random.random() > 0.05 else None,
+                status=status,
+                promo_code=promo,
+            ))
+            assigned.append(box)
+
+        agreements = RentalAgreement.objects.bulk_create(agreements, batch_size=1000)
+
+        through = RentalAgreement.boxes.through
+        links, occupied = [], []
+        for agreement, box in zip(agreements, assigned):
+            if box is not None:
+                links.append(through(rentalagreement=agreement, box=box))
+                box.status = 'occupied'
+                box.current_agreement = agreement
+                occupied.append(box)
+        through.objects.bulk_create(links, batch_size=1000)
+        Box.objects.bulk_update(occupied, ['status', 'current_agreement'], batch_size=1000)
+        return len(agreements)
+
+    def _transitions(self, clients, count):
+        AdTransition.objects.bulk_create([
+            AdTransition(
+                session_key=f'{MARKER}{n:010d}',
+                source=self.random.choice(AD_SOURCES),
+                medium='cpc',
+                campaign=f'campaign-{n % 20}',
+                landing_page='https://example.com/',
+                client=self.random.choice(clients) if self.random.random() < 0.3 else None,
+            )
+            for n in range(count)
+        ], batch_size=1000)
@@ -1,24 +1,48 @@
-from django.core.management.base import BaseCommand
 from django.conf import settings
-import requests
 
-class Command(BaseCommand):
+from storage.profiling import ProfiledCommand
+from storage.telegram_api import BotAPI, TelegramAPIError
+
+
+class Command(ProfiledCommand):
     help = 'Устанавливает webhook для Telegram бота'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            # URL твоего сайта на PythonAnywhere
+            default='https://antoxaboss.pythonanywhere.com/storage/telegram/webhook/',
+        )
+        parser.add_argument(
+            '--max-connections',
+            type=int,
+            default=40,
+            help='Одновременных соединений Telegram к вебхуку',
+        )
+
     def handle(self, *args, **options):
         token = getattr(settings, 'TELEGRAM_BOT_TOKEN', None)
         if not token:
             self.stdout.write(self.style.ERROR('TELEGRAM_BOT_TOKEN не настроен!'))
             return
 
-        # URL твоего сайта на PythonAnywhere
-        webhook_url = f"https://antoxaboss.pythonanywhere.com/storage/telegram/webhook/"
-        
-        # Удаляем старый webhook и ставим новый
-        url = f"https://api.telegram.org/bot{token}/setWebhook"
-        response = requests.post(url, data={'url': webhook_url})
-        
-        if response.json().get('ok'):
-            self.stdout.write(self.style.SUCCESS(f'Webhook установлен: {webhook_url}'))
-        else:
-            self.stdout.write(self.style.ERROR(f'Ошибка: {response.json()}'))
\ No newline at end of file
+        webhook_url = options['url']
+        params = {
+            'url': webhook_url,
+            'max_connections': options['max_connections'],
+            'allowed_updates': ['message'],
+        }
+        secret = getattr(settings, 'TELEGRAM_WEBHOOK_SECRET', '')
+        if not secret:
+            # Вебхук без секрета отклоняет все запросы (telegram_webhook.py)
+            self.stdout.write(self.style.ERROR('TELEGRAM_WEBHOOK_SECRET не настроен!'))
+            return
+        params['secret_token'] = secret
+
+        # Заменяет ранее установленный webhook
+        try:
+            BotAPI(token).call('setWebhook', **params)
+        except TelegramAPIError as e:
+            self.stdout.write(self.style.ERROR(f'Ошибка: {e}'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Webhook установлен: {webhook_url}'))
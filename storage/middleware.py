@@ -1,6 +1,15 @@
 from .models import AdTransition
+from . import db_router
+from . import request_metrics
+from django.conf import settings
 from django.utils import timezone
+from contextlib import ExitStack
 import hashlib
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
 
 class AdTrackingMiddleware:
     def __init__(self, get_response):
@@ -41,4 +50,92 @@ class AdTrackingMiddleware:
 
         response = self.get_response(request)
         return response
-        
\ No newline at end of file
+        
+
+
+class PrimaryStickyMiddleware:
+    """
+    После записи в БД следующие запросы клиента в течение
+    DB_REPLICA_STICKY_SECONDS читают с основной БД (см. storage/db_router.py)
+    """
+    cookie_name = 'db_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not db_router.replica_configured():
+            return self.get_response(request)
+
+        db_router.start_request(pinned=self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if db_router.has_written():
+                response.set_cookie(
+                    self.cookie_name, '1',
+                    max_age=settings.DB_REPLICA_STICKY_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+        finally:
+            db_router.start_request(pinned=False)
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Время ответа каждого запроса — в гистограмму по view; для доли
+    REQUEST_METRICS_SAMPLE_RATE ещё число и время SQL, медленные запросы
+    и повторы одного SQL (N+1) — в лог. См. storage/request_metrics.py
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        recorder = None
+        started = time.perf_counter()
+        if random.random() < request_metrics.sample_rate():
+            recorder = request_metrics.QueryRecorder(getattr(settings, 'SLOW_QUERY_MS', 100) / 1000)
+            with ExitStack() as stack:
+                for connection in request_metrics.sampled_connections():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = request_metrics.view_name(request)
+        if recorder is not None:
+            recorder.finish(getattr(settings, 'N_PLUS_ONE_THRESHOLD', 10))
+            self._log_queries(request, view, recorder)
+        request_metrics.registry.record(view, duration, response.status_code, recorder)
+
+        if duration * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 1000):
+            if recorder is not None:
+                logger.warning(
+                    'Медленный запрос %s %s (%s): %.0f мс, SQL: %s запросов, %.0f мс',
+                    request.method, request.path, view, duration * 1000,
+                    recorder.count, recorder.time * 1000,
+                )
+            else:
+                logger.warning(
+                    'Медленный запрос %s %s (%s): %.0f мс',
+                    request.method, request.path, view, duration * 1000,
+                )
+        return response
+
+    def _log_queries(self, request, view, recorder):
+        for elapsed, sql in recorder.slow:
+            logger.warning(
+                'Медленный SQL в %s (%s): %.0f мс: %s',
+                view, request.path, elapsed * 1000, sql[:request_metrics.SQL_LOG_LENGTH],
+            )
+        for shape, count in recorder.repeated:
+            logger.warning(
+                'Возможный N+1 в %s (%s): %s раз: %s',
+                view, request.path, count, shape[:request_metrics.SQL_LOG_LENGTH],
+            )
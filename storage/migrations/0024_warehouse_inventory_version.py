@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0023_client_created_at_client_telegram_chat_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warehouse',
+            name='inventory_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Увеличивается при любом изменении боксов склада', verbose_name='Версия наличия боксов'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0024_warehouse_inventory_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adtransition',
+            name='session_key',
+            field=models.CharField(help_text='ID сессии пользователя', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='adtransition',
+            index=models.Index(fields=['session_key', 'created_at'], name='adtransition_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(condition=models.Q(('status', 'free')), fields=['box_type'], name='box_free_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalagreement',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['end_date'], name='agreement_active_end_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0026_client_normalized_contacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramUpdate',
+            fields=[
+                ('update_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID обновления')),
+                ('payload', models.JSONField(verbose_name='Обновление')),
+                ('status', models.CharField(choices=[('new', 'Новое'), ('processing', 'В обработке'), ('done', 'Обработано'), ('failed', 'Ошибка')], default='new', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Получено')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в обработку')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+            ],
+            options={
+                'verbose_name': 'Обновление Telegram',
+                'verbose_name_plural': 'Обновления Telegram',
+                'ordering': ['update_id'],
+                'indexes': [models.Index(fields=['status', 'update_id'], name='tgupdate_status_idx')],
+            },
+        ),
+    ]
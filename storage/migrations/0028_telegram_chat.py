@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_existing_chats(apps, schema_editor):
+    """Чаты клиентов, уже привязавших Telegram, чтобы боту не пришлось искать их по telegram_chat_id"""
+    Client = apps.get_model('storage', 'Client')
+    TelegramChat = apps.get_model('storage', 'TelegramChat')
+    chats = {}
+    linked = Client.objects.filter(telegram_linked=True).exclude(telegram_chat_id__isnull=True)
+    for client_id, chat_id in linked.values_list('pk', 'telegram_chat_id').order_by('pk'):
+        try:
+            chats[int(chat_id)] = client_id
+        except ValueError:
+            continue
+    TelegramChat.objects.bulk_create(
+        [TelegramChat(chat_id=chat_id, client_id=client_id) for chat_id, client_id in chats.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0027_telegram_update'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramChat',
+            fields=[
+                ('chat_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Chat ID')),
+                ('step', models.CharField(blank=True, max_length=30, verbose_name='Шаг диалога')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='Данные шага')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='telegram_chats', to='storage.client', verbose_name='Клиент')),
+            ],
+            options={
+                'verbose_name': 'Чат Telegram',
+                'verbose_name_plural': 'Чаты Telegram',
+            },
+        ),
+        migrations.RunPython(link_existing_chats, migrations.RunPython.noop),
+    ]
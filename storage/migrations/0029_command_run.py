@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0028_telegram_chat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command', models.CharField(max_length=100, verbose_name='Команда')),
+                ('started_at', models.DateTimeField(verbose_name='Начало')),
+                ('duration', models.FloatField(verbose_name='Длительность, с')),
+                ('ok', models.BooleanField(default=True, verbose_name='Успешно')),
+                ('scheduled', models.BooleanField(default=False, verbose_name='По расписанию')),
+                ('queries', models.PositiveIntegerField(default=0, verbose_name='SQL-запросов')),
+                ('db_time', models.FloatField(default=0, verbose_name='Время SQL, с')),
+                ('phases', models.JSONField(blank=True, default=dict, verbose_name='Фазы')),
+                ('profile_path', models.CharField(blank=True, max_length=500, verbose_name='Файл профиля')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+            ],
+            options={
+                'verbose_name': 'Запуск команды',
+                'verbose_name_plural': 'Запуски команд',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['command', 'started_at'], name='cmdrun_command_started_idx')],
+            },
+        ),
+    ]
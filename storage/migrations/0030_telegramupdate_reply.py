@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0029_command_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegramupdate',
+            name='reply',
+            field=models.TextField(blank=True, null=True, verbose_name='Ответ'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def fill_chat_id(apps, schema_editor):
+    # Необработанным обновлениям chat_id нужен для отправки ответа
+    TelegramUpdate = apps.get_model('storage', 'TelegramUpdate')
+    pending = TelegramUpdate.objects.exclude(status='done')
+    for update in pending.iterator():
+        chat_id = ((update.payload.get('message') or {}).get('chat') or {}).get('id')
+        if chat_id is not None:
+            TelegramUpdate.objects.filter(pk=update.pk).update(chat_id=chat_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0030_telegramupdate_reply'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegramupdate',
+            name='chat_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Chat ID'),
+        ),
+        migrations.RunPython(fill_chat_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations
+
+from storage.contacts import normalize_email, normalize_phone
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_contacts(apps, schema_editor):
+    # Без нормализованных контактов клиент не найдётся по /start
+    # (то же делает команда backfill_client_contacts)
+    Client = apps.get_model('storage', 'Client')
+    clients = Client.objects.only('pk', 'email', 'phone', 'email_normalized', 'phone_e164').order_by('pk')
+    batch = []
+    for client in clients.iterator(chunk_size=BATCH_SIZE):
+        email = normalize_email(client.email)
+        phone = normalize_phone(client.phone)
+        if client.email_normalized == email and client.phone_e164 == phone:
+            continue
+        client.email_normalized = email
+        client.phone_e164 = phone
+        batch.append(client)
+        if len(batch) >= BATCH_SIZE:
+            Client.objects.bulk_update(batch, ['email_normalized', 'phone_e164'])
+            batch = []
+    if batch:
+        Client.objects.bulk_update(batch, ['email_normalized', 'phone_e164'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0031_telegramupdate_chat_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_contacts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0032_backfill_client_contacts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='telegramupdate',
+            index=models.Index(condition=models.Q(('status__in', ['new', 'processing'])), fields=['chat_id', 'update_id'], name='tgupdate_chat_pending_idx'),
+        ),
+    ]
@@ -1,10 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-from django.db.models import F, Sum
+from django.db.models import F, Sum, Count, Q
+from django.db.models.functions import Coalesce
 from datetime import date, timedelta
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from decimal import Decimal
+from . import contacts, pricing
 
 
 class Warehouse(models.Model):
@@ -24,6 +27,12 @@ class Warehouse(models.Model):
         decimal_places=2,
         verbose_name="Высота потолка всего зала (м)"
     )
+    inventory_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Версия наличия боксов",
+        help_text="Увеличивается при любом изменении боксов склада"
+    )
 
     class Meta:
         verbose_name = "Склад"
@@ -33,6 +42,16 @@ class Warehouse(models.Model):
     def __str__(self):
         return f"{self.town}, {self.address}"
 
+    def save(self, *args, **kwargs):
+        # Версию наличия меняет только inventory.bump_version (F() + 1):
+        # сохранение устаревшего экземпляра не должно откатывать счётчик
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'inventory_version'
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def total_units(self):
         from .models import Box
@@ -53,6 +72,30 @@ class Warehouse(models.Model):
         free_box = Box.objects.filter(box_type__warehouse=self, status='free').order_by('box_type__price').first()
         return free_box.box_type.price if free_box else 0
 
+    @cached_property
+    def free_boxes(self):
+        """Свободные боксы склада с типами одним запросом (для страницы каталога)"""
+        return list(
+            Box.objects.filter(box_type__warehouse=self, status='free')
+            .select_related('box_type')
+            .order_by('box_type__volume', 'box_type_id', 'number')
+        )
+
+
+class BoxTypeQuerySet(models.QuerySet):
+    def refresh_counters(self):
+        """Пересчитывает total_count и occupied_count одним UPDATE"""
+        def boxes_count(**filters):
+            boxes = Box.objects.filter(
+                box_type=models.OuterRef('pk'), **filters
+            ).order_by().values('box_type').annotate(n=Count('pk')).values('n')
+            return Coalesce(models.Subquery(boxes), 0)
+
+        return self.update(
+            total_count=boxes_count(),
+            occupied_count=boxes_count(status='occupied'),
+        )
+
 
 class BoxType(models.Model):
     SIZE_CATEGORY_CHOICES = [
@@ -106,6 +149,8 @@ class BoxType(models.Model):
     total_count = models.PositiveIntegerField(default=0)
     occupied_count = models.PositiveIntegerField(default=0)
 
+    objects = BoxTypeQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Тип бокса"
         verbose_name_plural = "Типы боксов"
@@ -114,6 +159,18 @@ class BoxType(models.Model):
     def __str__(self):
         return f"{self.volume}м³ ({self.length}x{self.width}x{self.height}м)"
 
+    @staticmethod
+    def calculate_properties(length, width, height):
+        """Возвращает (объём, категория) по размерам бокса"""
+        if not (length and width and height):
+            return 0, 'small'
+        volume = length * width * height
+        if volume <= 3:
+            return volume, 'small'
+        if volume <= 10:
+            return volume, 'medium'
+        return volume, 'large'
+
 
 class Box(models.Model):
     STATUS_CHOICES = [
@@ -149,6 +206,11 @@ class Box(models.Model):
         verbose_name_plural = "Боксы"
         ordering = ['number']
         unique_together = ('box_type', 'number')
+        indexes = [
+            # Свободные боксы типа или склада (каталог, наличие, счётчики).
+            # Частичный индекс: занятые боксы в него не попадают
+            models.Index(fields=['box_type'], condition=Q(status='free'), name='box_free_type_idx'),
+        ]
 
     def __str__(self):
         return f"Бокс №{self.number} ({self.box_type.volume}м³) - {self.get_status_display()}"
@@ -179,6 +241,23 @@ class WarehouseImage(models.Model):
         return f"Фото для {self.warehouse.address}"
 
 
+class ClientQuerySet(models.QuerySet):
+    def with_active_units(self):
+        """Добавляет active_units — число боксов в активных договорах, одним запросом"""
+        if 'active_units' in self.query.annotations:
+            return self
+        queryset = self.annotate(
+            active_units=Count(
+                'agreements__boxes',
+                filter=Q(agreements__status='active')
+            )
+        )
+        # Django не применяет Meta.ordering к запросам с GROUP BY
+        if not self.query.order_by:
+            queryset = queryset.order_by(*self.model._meta.ordering)
+        return queryset
+
+
 class Client(models.Model):
     user = models.OneToOneField(
         User,
@@ -192,6 +271,21 @@ class Client(models.Model):
     address = models.CharField(max_length=255, verbose_name="Адрес клиента")
     phone = models.CharField(max_length=20, verbose_name="Телефон")
     email = models.EmailField(null=True, blank=True ,verbose_name="Email")
+    # Нормализованные копии для поиска по индексу (заполняются в save)
+    email_normalized = models.CharField(
+        max_length=254,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Email для поиска"
+    )
+    phone_e164 = models.CharField(
+        max_length=16,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Телефон в формате E.164"
+    )
 
     telegram_chat_id = models.CharField(
         max_length=50,
@@ -205,6 +299,8 @@ class Client(models.Model):
     )
     
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ClientQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Клиент"
@@ -214,13 +310,28 @@ class Client(models.Model):
     def __str__(self):
         return self.full_name
 
+    def save(self, *args, **kwargs):
+        self.email_normalized = contacts.normalize_email(self.email)
+        self.phone_e164 = contacts.normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'email' in update_fields:
+                update_fields.add('email_normalized')
+            if 'phone' in update_fields:
+                update_fields.add('phone_e164')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
     @property
     def total_active_units(self):
-        active_agreements = self.agreements.filter(status='active')
-        total = 0
-        for agreement in active_agreements:
-            total += agreement.boxes.count()
-        return total
+        # Если клиент получен через with_active_units() — берём готовую аннотацию
+        if hasattr(self, 'active_units'):
+            return self.active_units
+        return RentalAgreement.boxes.through.objects.filter(
+            rentalagreement__client=self,
+            rentalagreement__status='active'
+        ).count()
 
 
 class PromoCode(models.Model):
@@ -397,6 +508,11 @@ class RentalAgreement(models.Model):
                 name='unique_client_promo'
             )
         ]
+        indexes = [
+            # Напоминания: активные договоры по дате окончания.
+            # Частичный индекс: завершённые договоры в него не попадают
+            models.Index(fields=['end_date'], condition=Q(status='active'), name='agreement_active_end_idx'),
+        ]
 
     def __str__(self):
         boxes_info = ", ".join([b.number for b in self.boxes.all()[:3]])
@@ -420,13 +536,11 @@ class RentalAgreement(models.Model):
 
     def get_current_price_multiplier(self):
         if self.is_overdue and self.status == 'active':
-            return Decimal('1.25')
+            return pricing.OVERDUE_MULTIPLIER
         return Decimal('1.0')
 
     def get_total_monthly_cost(self):
-        base_cost = sum(box.box_type.price for box in self.boxes.all())
-        multiplier = self.get_current_price_multiplier()
-        return base_cost * multiplier
+        return pricing.agreement_monthly_cost(self, with_promo=False)
 
     def get_total_monthly_cost_display(self):
         cost = self.get_total_monthly_cost()
@@ -439,12 +553,11 @@ class RentalAgreement(models.Model):
     
     def get_final_monthly_cost(self):
         """Возвращает стоимость с учетом промокода"""
-        base_cost = self.get_total_monthly_cost()
-        
-        if self.promo_code and self.promo_code.is_valid():
-            discount = base_cost * (self.promo_code.discount_percent / Decimal('100'))
-            return base_cost - discount
-        return base_cost
+        return pricing.agreement_monthly_cost(self)
+
+    def get_total_cost(self):
+        """Стоимость за весь срок договора (None для бессрочных)"""
+        return pricing.agreement_total_cost(self)
 
     def get_final_monthly_cost_display(self):
         """Отображает стоимость с промокодом для админки и шаблонов"""
@@ -460,6 +573,14 @@ class RentalAgreement(models.Model):
             )
         return f"{cost:.2f} руб"
 
+    def extend(self, days=30):
+        """Продлевает договор (личный кабинет и бот); бессрочные не продлеваются"""
+        if self.end_date is None:
+            return False
+        self.end_date += timedelta(days=days)
+        self.save(update_fields=['end_date'])
+        return True
+
 
 class AdTransition(models.Model):
     SOURCE_CHOICES = [
@@ -471,7 +592,6 @@ class AdTransition(models.Model):
 
     session_key = models.CharField(
         max_length=100, 
-        db_index=True,
         help_text="ID сессии пользователя"
     )
     source = models.CharField(
@@ -516,6 +636,115 @@ class AdTransition(models.Model):
         verbose_name = "Рекламный переход"
         verbose_name_plural = "Рекламные переходы"
         ordering = ['-created_at']
+        indexes = [
+            # Недавний переход той же сессии (AdTrackingMiddleware);
+            # заменяет отдельный индекс по session_key
+            models.Index(fields=['session_key', 'created_at'], name='adtransition_session_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_source_display()} -> {self.session_key} ({self.created_at})"
+
+
+class TelegramUpdate(models.Model):
+    """
+    Очередь входящих обновлений Telegram-вебхука.
+    update_id — первичный ключ: повторная доставка того же обновления
+    не создаёт вторую запись. reply сохраняется сразу после диспетчера:
+    повторная попытка только переотправляет его, не выполняя команду снова
+    """
+    STATUS_CHOICES = [
+        ('new', 'Новое'),
+        ('processing', 'В обработке'),
+        ('done', 'Обработано'),
+        ('failed', 'Ошибка'),
+    ]
+
+    update_id = models.BigIntegerField(primary_key=True, verbose_name="ID обновления")
+    payload = models.JSONField(verbose_name="Обновление")
+    # Чат обновления: берётся только самое раннее незавершённое обновление чата
+    chat_id = models.BigIntegerField(null=True, blank=True, verbose_name="Chat ID")
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='new',
+        verbose_name="Статус"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    # None — диспетчер ещё не вызывался, '' — отвечать не нужно
+    reply = models.TextField(null=True, blank=True, verbose_name="Ответ")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Получено")
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name="Взято в обработку")
+    # После неудачной попытки обновление не берётся до этого времени
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="Следующая попытка")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Обработано")
+
+    class Meta:
+        verbose_name = "Обновление Telegram"
+        verbose_name_plural = "Обновления Telegram"
+        ordering = ['update_id']
+        indexes = [
+            # Выборка очередной пачки обработчиком
+            models.Index(fields=['status', 'update_id'], name='tgupdate_status_idx'),
+            # Более раннее незавершённое обновление того же чата (claim_batch)
+            models.Index(
+                fields=['chat_id', 'update_id'],
+                condition=Q(status__in=['new', 'processing']),
+                name='tgupdate_chat_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.update_id} ({self.get_status_display()})"
+
+
+class TelegramChat(models.Model):
+    """
+    Чат с ботом: привязанный клиент и шаг текущего диалога.
+    Кешируется в памяти процесса диспетчером бота (telegram_dispatch.py)
+    """
+    chat_id = models.BigIntegerField(primary_key=True, verbose_name="Chat ID")
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='telegram_chats',
+        verbose_name="Клиент"
+    )
+    step = models.CharField(max_length=30, blank=True, verbose_name="Шаг диалога")
+    data = models.JSONField(default=dict, blank=True, verbose_name="Данные шага")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Чат Telegram"
+        verbose_name_plural = "Чаты Telegram"
+
+    def __str__(self):
+        return str(self.chat_id)
+
+
+class CommandRun(models.Model):
+    """Запуск management-команды: длительность, SQL и время по фазам (см. storage/profiling.py)"""
+    command = models.CharField(max_length=100, verbose_name="Команда")
+    started_at = models.DateTimeField(verbose_name="Начало")
+    duration = models.FloatField(verbose_name="Длительность, с")
+    ok = models.BooleanField(default=True, verbose_name="Успешно")
+    scheduled = models.BooleanField(default=False, verbose_name="По расписанию")
+    queries = models.PositiveIntegerField(default=0, verbose_name="SQL-запросов")
+    db_time = models.FloatField(default=0, verbose_name="Время SQL, с")
+    phases = models.JSONField(default=dict, blank=True, verbose_name="Фазы")
+    profile_path = models.CharField(max_length=500, blank=True, verbose_name="Файл профиля")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+
+    class Meta:
+        verbose_name = "Запуск команды"
+        verbose_name_plural = "Запуски команд"
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['command', 'started_at'], name='cmdrun_command_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.command} {self.started_at:%d.%m.%Y %H:%M} ({self.duration:.1f} с)"
@@ -3,7 +3,9 @@ from .utils import send_telegram_notification
 from django.conf import settings
 from django.utils import timezone
 from datetime import date, timedelta
+from .log_handlers import HIGH_VOLUME
 from .models import RentalAgreement, Client
+from .profiling import phase, timed
 import logging
 from django.db import transaction
 
@@ -14,6 +16,7 @@ class TelegramNotificationService:
     """Сервис для отправки Telegram-уведомлений о договорах аренды"""
     
     @staticmethod
+    @timed('render')
     def send_reminder_30d(agreement):
         """Отправка напоминания за 30 дней до окончания"""
         subject = 'Напоминание: до окончания аренды осталось 30 дней'
@@ -32,6 +35,7 @@ class TelegramNotificationService:
         return TelegramNotificationService._send_telegram(agreement, subject, message, 'reminder_30d_sent')
     
     @staticmethod
+    @timed('render')
     def send_reminder_14d(agreement):
         """Отправка напоминания за 14 дней до окончания"""
         subject = 'Напоминание: до окончания аренды осталось 14 дней'
@@ -50,6 +54,7 @@ class TelegramNotificationService:
         return TelegramNotificationService._send_telegram(agreement, subject, message, 'reminder_14d_sent')
     
     @staticmethod
+    @timed('render')
     def send_reminder_7d(agreement):
         """Отправка напоминания за 7 дней до окончания"""
         subject = 'Напоминание: до окончания аренды осталась неделя'
@@ -68,6 +73,7 @@ class TelegramNotificationService:
         return TelegramNotificationService._send_telegram(agreement, subject, message, 'reminder_7d_sent')
     
     @staticmethod
+    @timed('render')
     def send_reminder_3d(agreement):
         """Отправка напоминания за 3 дня до окончания"""
         subject = 'До окончания аренды осталось 3 дня'
@@ -86,6 +92,7 @@ class TelegramNotificationService:
         return TelegramNotificationService._send_telegram(agreement, subject, message, 'reminder_3d_sent')
     
     @staticmethod
+    @timed('render')
     def send_overdue_notification(agreement):
         """Отправка уведомления о просрочке (первое)"""
         subject = 'Срок аренды истек'
@@ -107,6 +114,7 @@ class TelegramNotificationService:
         return TelegramNotificationService._send_telegram(agreement, subject, message, 'overdue_notification_sent')
     
     @staticmethod
+    @timed('render')
     def send_monthly_overdue_reminder(agreement):
         """Отправка ежемесячного напоминания о просрочке"""
         months_overdue = (date.today() - agreement.end_date).days // 30
@@ -131,10 +139,12 @@ class TelegramNotificationService:
         success = TelegramNotificationService._send_telegram(agreement, subject, message, None)
         if success:
             agreement.last_overdue_reminder_sent = date.today()
-            agreement.save(update_fields=['last_overdue_reminder_sent'])
+            with phase('flag-update'):
+                agreement.save(update_fields=['last_overdue_reminder_sent'])
         return success
     
     @staticmethod
+    @timed('render')
     def send_grace_period_expired_notification(agreement):
         """Отправка уведомления об окончании льготного периода"""
         subject = 'Срочно: последний день хранения вещей'
@@ -154,15 +164,16 @@ class TelegramNotificationService:
         return TelegramNotificationService._send_telegram(agreement, subject, message, 'grace_period_notification_sent')
     
     @staticmethod
-    def send_qr_code_for_access(agreement):
-        """Отправляет QR-код для доступа к боксу по запросу"""
+    @timed('render')
+    def send_qr_code_for_access(agreement, api=None):
+        """Отправляет QR-код для доступа к боксу по запросу; api — как в send_telegram_notification"""
         if not agreement.client.telegram_chat_id or not agreement.client.telegram_linked:
-            logger.warning(f"Telegram: клиент {agreement.client.full_name} не привязан")
+            logger.warning("Telegram: клиент %s не привязан", agreement.client.full_name)
             return False
         
         import qrcode
         from io import BytesIO
-        import requests
+        from .telegram_api import TelegramAPIError, get_api
         
         # Генерируем данные для QR
         qr_data = f"BOX_ACCESS:{agreement.id}:{agreement.client.id}:{agreement.warehouse.id}"
@@ -176,10 +187,8 @@ class TelegramNotificationService:
         # Сохраняем в буфер
         buffer = BytesIO()
         img.save(buffer, format='PNG')
-        buffer.seek(0)
         
         # Отправляем в Telegram
-        token = getattr(settings, 'TELEGRAM_BOT_TOKEN', '')
         chat_id = agreement.client.telegram_chat_id
         
         message = f"""🔑 <b>Доступ к вашему боксу</b>
@@ -194,18 +203,17 @@ class TelegramNotificationService:
         
         # Отправляем текст
         from .utils import send_telegram_notification
-        send_telegram_notification(chat_id, message)
+        send_telegram_notification(chat_id, message, api=api)
         
         # Отправляем QR как фото
-        url = f"https://api.telegram.org/bot{token}/sendPhoto"
-        files = {'photo': ('qr.png', buffer, 'image/png')}
-        data = {'chat_id': chat_id, 'caption': '📱 Ваш QR-код для доступа'}
-        
         try:
-            response = requests.post(url, data=data, files=files, timeout=10)
-            return response.json().get('ok', False)
-        except Exception as e:
-            logger.error(f"QR send error: {e}")
+            with phase('send'):
+                (api or get_api()).send_photo(
+                    chat_id, buffer.getvalue(), caption='📱 Ваш QR-код для доступа', filename='qr.png'
+                )
+            return True
+        except TelegramAPIError as e:
+            logger.error("QR send error: %s", e)
             return False
     
     
@@ -219,19 +227,16 @@ class TelegramNotificationService:
         
         # Проверка: привязан ли Telegram у клиента
         if not client.telegram_chat_id or not client.telegram_linked:
-            logger.warning(
-                f"[TELEGRAM] Клиент {client.full_name} (ID: {client.id}) не привязал Telegram"
-            )
+            logger.warning("[TELEGRAM] Клиент %s (ID: %s) не привязал Telegram", client.full_name, client.id)
             return False
         
         # Формируем текст сообщения с заголовком
         full_text = f"<b>{subject}</b>\n\n{message}"
         
-        logger.info(
-            f"[TELEGRAM] Попытка отправки:\n"
-            f"  -> Кому: {client.full_name} (chat_id: {client.telegram_chat_id})\n"
-            f"  -> Тема: {subject}\n"
-            f"  -> Договор: #{agreement.id}"
+        logger.debug(
+            "[TELEGRAM] Отправка «%s» по договору #%s: %s (chat_id: %s)",
+            subject, agreement.id, client.full_name, client.telegram_chat_id,
+            extra=HIGH_VOLUME,
         )
         
         try:
@@ -247,16 +252,17 @@ class TelegramNotificationService:
             # Если указан флаг — обновляем его в базе
             if success and flag_field and hasattr(agreement, flag_field):
                 setattr(agreement, flag_field, True)
-                agreement.save(update_fields=[flag_field])
-                logger.info(f"[TELEGRAM] Флаг '{flag_field}' обновлён")
+                with phase('flag-update'):
+                    agreement.save(update_fields=[flag_field])
+                logger.debug("[TELEGRAM] Флаг '%s' обновлён", flag_field, extra=HIGH_VOLUME)
             
             if success:
-                logger.info(f"[TELEGRAM] Сообщение успешно отправлено")
+                logger.info("[TELEGRAM] Договор #%s: «%s» отправлено", agreement.id, subject, extra=HIGH_VOLUME)
             else:
-                logger.error(f"[TELEGRAM] Ошибка при отправке (API вернул failure)")
+                logger.error("[TELEGRAM] Договор #%s: ошибка при отправке «%s»", agreement.id, subject)
             
             return success
             
         except Exception as e:
-            logger.error(f"[TELEGRAM] Исключение при отправке: {type(e).__name__}: {e}")
+            logger.error("[TELEGRAM] Исключение при отправке: %s: %s", type(e).__name__, e)
             return False
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+Кеш целых страниц каталога для анонимных посетителей.
+
+Ключ содержит общую версию каталога (inventory.get_catalog_version),
+поэтому любое изменение боксов, типов боксов, складов или их фотографий
+делает старые записи недостижимыми. Версия хранится в кеше процесса,
+так что в других процессах страница может отставать не дольше PAGE_TIMEOUT.
+
+Query string в ключ не входит, кроме параметров из query_params, которые
+меняют страницу: иначе каждая ссылка с utm_* и другими метками создавала
+бы свою запись.
+
+Страница с {% csrf_token %} общая для всех, поэтому при отдаче из кеша
+токен в скрытых полях формы подменяется токеном текущего посетителя.
+Запросы с сессией (вошедшие пользователи, flash-сообщения) кеш не используют.
+"""
+import hashlib
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_vary_headers
+
+from . import inventory
+
+
+PAGE_TIMEOUT = 60
+CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def _is_cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def _page_key(request, query_params):
+    query = urlencode(sorted(
+        (name, value)
+        for name in query_params
+        for value in request.GET.getlist(name)
+    ))
+    path = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'storage:page:{inventory.get_catalog_version()}:{path}'
+
+
+def cache_anonymous_page(timeout=PAGE_TIMEOUT, query_params=()):
+    """
+    Кеширует ответ view для посетителей без сессии.
+    query_params — параметры запроса, от которых зависит страница
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable(request):
+                response = view_func(request, *args, **kwargs)
+                patch_vary_headers(response, ('Cookie',))
+                return response
+
+            key = _page_key(request, query_params)
+            cached = cache.get(key)
+            if cached is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    cache.set(key, (response.content, response['Content-Type']), timeout)
+                patch_vary_headers(response, ('Cookie',))
+                return response
+
+            content, content_type = cached
+            token = get_token(request).encode()
+            response = HttpResponse(
+                CSRF_INPUT_RE.sub(lambda match: match[1] + token + match[2], content),
+                content_type=content_type,
+            )
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
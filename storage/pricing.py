@@ -0,0 +1,162 @@
+"""
+Расчёт стоимости аренды.
+
+Все суммы считаются в Decimal. Одни и те же функции используются
+и для одного договора, и для пакетного расчёта по queryset, поэтому
+результаты совпадают до копейки.
+"""
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+CENT = Decimal('0.01')
+OVERDUE_MULTIPLIER = Decimal('1.25')
+DAYS_IN_MONTH = 30.44
+
+# (минимальный срок в месяцах, скидка в процентах) — от большего к меньшему
+DURATION_DISCOUNTS = (
+    (12, 15),
+    (6, 10),
+)
+
+MONEY_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def to_money(value):
+    """Округляет сумму до копеек"""
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def apply_discount(amount, percent):
+    """Уменьшает сумму на percent процентов"""
+    if not percent:
+        return amount
+    return amount - amount * (Decimal(percent) / Decimal('100'))
+
+
+def duration_discount_percent(months):
+    """Скидка за срок аренды: 10% от 6 месяцев, 15% от 12 месяцев"""
+    for min_months, percent in DURATION_DISCOUNTS:
+        if months >= min_months:
+            return percent
+    return 0
+
+
+def rental_months(start_date, end_date):
+    """Срок договора в месяцах (обратное к расчёту end_date в order_view)"""
+    if not start_date or not end_date:
+        return None
+    return max(1, round((end_date - start_date).days / DAYS_IN_MONTH))
+
+
+def is_overdue(status, end_date, today=None):
+    today = today or date.today()
+    return status == 'active' and end_date is not None and today > end_date
+
+
+def promo_percent(promo_code):
+    """Скидка промокода, если он сейчас действует"""
+    if promo_code and promo_code.is_valid():
+        return promo_code.discount_percent
+    return 0
+
+
+def monthly_cost(base_cost, overdue=False, promo_discount=0):
+    """
+    Месячная стоимость договора: сумма цен боксов, наценка 25% за просрочку,
+    затем скидка по промокоду
+    """
+    cost = Decimal(base_cost or 0)
+    if overdue:
+        cost *= OVERDUE_MULTIPLIER
+    return to_money(apply_discount(cost, promo_discount))
+
+
+def quote(monthly_price, duration, promo_discount=0):
+    """Расчёт цены заказа: скидка за срок, затем промокод, итог за весь срок"""
+    discount = duration_discount_percent(duration)
+    after_duration = apply_discount(Decimal(monthly_price), discount)
+    final_monthly = to_money(apply_discount(after_duration, promo_discount))
+    return {
+        'monthly_price': final_monthly,
+        'total_price': to_money(final_monthly * duration),
+        'discount_percent': discount,
+        'promo_discount': promo_discount,
+        'duration': duration,
+    }
+
+
+def base_cost_subquery():
+    """Сумма цен боксов договора одним коррелированным подзапросом"""
+    from .models import Box
+
+    prices = Box.objects.filter(
+        agreements=OuterRef('pk')
+    ).order_by().values('agreements').annotate(
+        total=Sum('box_type__price')
+    ).values('total')
+    return Coalesce(
+        Subquery(prices, output_field=MONEY_FIELD),
+        Value(Decimal('0')),
+        output_field=MONEY_FIELD,
+    )
+
+
+def with_pricing(queryset):
+    """
+    Добавляет к договорам base_monthly_cost и подтягивает промокод,
+    так что расчёт стоимости не делает дополнительных запросов
+    """
+    if 'base_monthly_cost' in queryset.query.annotations:
+        return queryset
+    return queryset.select_related('promo_code').annotate(
+        base_monthly_cost=base_cost_subquery()
+    )
+
+
+def agreement_base_cost(agreement):
+    """Сумма цен боксов: из аннотации или из (предзагруженных) боксов"""
+    if hasattr(agreement, 'base_monthly_cost'):
+        return to_money(agreement.base_monthly_cost or 0)
+    return to_money(sum(
+        (box.box_type.price for box in agreement.boxes.all()),
+        Decimal('0')
+    ))
+
+
+def agreement_monthly_cost(agreement, with_promo=True, today=None):
+    return monthly_cost(
+        agreement_base_cost(agreement),
+        overdue=is_overdue(agreement.status, agreement.end_date, today),
+        promo_discount=promo_percent(agreement.promo_code) if with_promo else 0,
+    )
+
+
+def agreement_total_cost(agreement, today=None):
+    """Стоимость за весь срок договора со скидкой за срок и промокодом"""
+    months = rental_months(agreement.start_date, agreement.end_date)
+    if months is None:
+        return None
+    monthly = monthly_cost(
+        agreement_base_cost(agreement),
+        overdue=is_overdue(agreement.status, agreement.end_date, today),
+    )
+    return quote(monthly, months, promo_percent(agreement.promo_code))['total_price']
+
+
+def price_agreements(queryset, today=None):
+    """
+    Считает стоимость для всех договоров queryset за один запрос.
+    Возвращает список договоров с атрибутами monthly_cost,
+    final_monthly_cost и total_cost
+    """
+    today = today or date.today()
+    agreements = list(with_pricing(queryset))
+    for agreement in agreements:
+        agreement.monthly_cost = agreement_monthly_cost(agreement, with_promo=False, today=today)
+        agreement.final_monthly_cost = agreement_monthly_cost(agreement, today=today)
+        agreement.total_cost = agreement_total_cost(agreement, today=today)
+    return agreements
@@ -0,0 +1,224 @@
+"""
+Замеры management-команд.
+
+ProfiledCommand — базовый класс команд storage: каждый запуск
+сохраняется в CommandRun (длительность, число и время SQL, время по
+фазам), --profile дополнительно пишет профиль cProfile (.prof для
+snakeviz/pstats и .txt с топом функций).
+
+Фазы размечаются в коде через phase('send') или @timed('render').
+Время фазы исключительное: вложенная фаза не входит в родительскую,
+SQL-запросы засчитываются фазе, в которой выполнены. Вне запуска
+команды разметка ничего не делает.
+"""
+import argparse
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# Время и запросы вне размеченных фаз
+OTHER = 'other'
+PROFILE_TOP = 50
+
+_local = threading.local()
+
+
+class RunRecorder:
+    def __init__(self):
+        # Имя фазы -> [секунды, входов, SQL-запросов]
+        self.phases = {}
+        self.queries = 0
+        self.db_time = 0.0
+        self._stack = []
+
+    def _add(self, name, seconds=0.0, calls=0, queries=0):
+        totals = self.phases.setdefault(name, [0.0, 0, 0])
+        totals[0] += seconds
+        totals[1] += calls
+        totals[2] += queries
+
+    def push(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self._add(parent[0], now - parent[1])
+        self._stack.append([name, now])
+        self._add(name, calls=1)
+
+    def pop(self):
+        now = time.perf_counter()
+        name, started = self._stack.pop()
+        self._add(name, now - started)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+            self._add(self._stack[-1][0] if self._stack else OTHER, queries=1)
+
+    def summary(self, duration):
+        """{фаза: {seconds, calls, queries}} с остатком в OTHER"""
+        phases = {
+            name: {'seconds': round(seconds, 6), 'calls': calls, 'queries': queries}
+            for name, (seconds, calls, queries) in self.phases.items()
+        }
+        other = phases.setdefault(OTHER, {'seconds': 0.0, 'calls': 0, 'queries': 0})
+        other['seconds'] = round(max(0.0, duration - sum(p['seconds'] for n, p in phases.items() if n != OTHER)), 6)
+        return phases
+
+
+@contextmanager
+def phase(name):
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        yield
+        return
+    recorder.push(name)
+    try:
+        yield
+    finally:
+        recorder.pop()
+
+
+def timed(name):
+    """Декоратор: весь вызов функции — фаза name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProfiledCommand(BaseCommand):
+    """
+    Команда с записью запусков в CommandRun и опцией --profile.
+    record_runs = False — для бенчмарков и долгоживущих процессов
+    """
+    record_runs = True
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--profile',
+            nargs='?',
+            const='',
+            metavar='DIR',
+            help='Профилировать запуск (cProfile); файлы — в DIR или COMMAND_PROFILE_DIR',
+        )
+        # Передаёт планировщик, чтобы отличать его запуски от ручных
+        parser.add_argument('--scheduled', action='store_true', help=argparse.SUPPRESS)
+        return parser
+
+    @property
+    def command_name(self):
+        return self.__module__.rsplit('.', 1)[-1]
+
+    def execute(self, *args, **options):
+        profile_dir = options.get('profile')
+        if profile_dir is None and not self.record_runs:
+            return super().execute(*args, **options)
+
+        recorder = RunRecorder()
+        profiler = cProfile.Profile() if profile_dir is not None else None
+        started_at = timezone.now()
+        started = time.perf_counter()
+        error = ''
+        outer = getattr(_local, 'recorder', None)
+        _local.recorder = recorder
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(recorder))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    return super().execute(*args, **options)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        except BaseException:
+            error = traceback.format_exc(limit=5)
+            raise
+        finally:
+            _local.recorder = outer
+            duration = time.perf_counter() - started
+            phases = recorder.summary(duration)
+            profile_path = ''
+            if profiler is not None:
+                try:
+                    profile_path = self._write_profile(profiler, profile_dir, started_at)
+                except OSError as e:
+                    logger.warning('Не удалось записать профиль %s: %s', self.command_name, e)
+                self._print_phases(duration, recorder, phases, profile_path)
+            if self.record_runs:
+                self._save_run(
+                    started_at=started_at,
+                    duration=duration,
+                    ok=not error,
+                    scheduled=options.get('scheduled', False),
+                    queries=recorder.queries,
+                    db_time=recorder.db_time,
+                    phases=phases,
+                    profile_path=profile_path,
+                    error=error,
+                )
+
+    def _write_profile(self, profiler, profile_dir, started_at):
+        directory = Path(profile_dir or getattr(settings, 'COMMAND_PROFILE_DIR', settings.BASE_DIR / 'logs' / 'profiles'))
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.command_name}-{timezone.localtime(started_at):%Y%m%d-%H%M%S}.prof"
+        profiler.dump_stats(path)
+
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        path.with_suffix('.txt').write_text(report.getvalue(), encoding='utf-8')
+        return str(path)
+
+    def _print_phases(self, duration, recorder, phases, profile_path):
+        self.stderr.write(
+            f'{self.command_name}: {duration:.3f} с, SQL: {recorder.queries} запросов, '
+            f'{recorder.db_time:.3f} с'
+        )
+        for name, totals in sorted(phases.items(), key=lambda item: -item[1]['seconds']):
+            self.stderr.write(
+                f"  {name:<14} {totals['seconds']:>9.3f} с  вызовов {totals['calls']:>6}  "
+                f"запросов {totals['queries']:>6}"
+            )
+        if profile_path:
+            self.stderr.write(f'Профиль: {profile_path} (топ функций — {Path(profile_path).with_suffix(".txt")})')
+
+    def _save_run(self, **fields):
+        from .models import CommandRun
+
+        retention = timedelta(days=getattr(settings, 'COMMAND_RUNS_RETENTION_DAYS', 90))
+        try:
+            CommandRun.objects.create(command=self.command_name, **fields)
+            CommandRun.objects.filter(
+                command=self.command_name, started_at__lt=timezone.now() - retention
+            ).delete()
+        except DatabaseError as e:
+            # Журнал запусков не должен ломать саму команду
+            logger.warning('Не удалось сохранить запуск %s: %s', self.command_name, e)
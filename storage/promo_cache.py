@@ -0,0 +1,81 @@
+"""
+Кеш промокодов для AJAX-проверки check_promo_code.
+
+Найденные промокоды хранятся целиком, ненайденные — коротким
+«отрицательным» кешем, чтобы перебор несуществующих кодов не бил в БД.
+Для каждого пользователя хранится множество ID уже использованных им
+промокодов. Записи сбрасываются сигналами при сохранении/удалении
+PromoCode и договоров с промокодом (см. signals.py).
+
+Код — пользовательский ввод: в ключ кеша идёт его SHA-1 (в memcached
+ключ не может содержать пробелы и управляющие символы), а заведомо
+несуществующие коды (длиннее поля PromoCode.code) в кеш не попадают.
+"""
+import hashlib
+
+from django.core.cache import cache
+
+from .models import PromoCode, RentalAgreement
+
+
+PROMO_TTL = 5 * 60
+NEGATIVE_TTL = 30
+USED_CODES_TTL = 10 * 60
+
+_NOT_FOUND = 'not-found'
+MAX_CODE_LENGTH = PromoCode._meta.get_field('code').max_length
+
+
+def normalize_code(code):
+    return (code or '').strip()
+
+
+def promo_key(code):
+    digest = hashlib.sha1(normalize_code(code).encode('utf-8')).hexdigest()
+    return f'storage:promo:code:{digest}'
+
+
+def used_codes_key(user_id):
+    return f'storage:promo:used:{user_id}'
+
+
+def get_promo(code):
+    """Активный промокод по коду или None"""
+    code = normalize_code(code)
+    if not code or len(code) > MAX_CODE_LENGTH:
+        return None
+    key = promo_key(code)
+    promo = cache.get(key)
+    if promo == _NOT_FOUND:
+        return None
+    if promo is None:
+        promo = PromoCode.objects.filter(code=code, is_active=True).first()
+        if promo is None:
+            cache.set(key, _NOT_FOUND, NEGATIVE_TTL)
+            return None
+        cache.set(key, promo, PROMO_TTL)
+    return promo
+
+
+def get_used_promo_ids(user_id):
+    """ID промокодов, которые уже есть в договорах клиента этого пользователя"""
+    key = used_codes_key(user_id)
+    used = cache.get(key)
+    if used is None:
+        used = frozenset(
+            RentalAgreement.objects.filter(
+                client__user_id=user_id,
+                promo_code__isnull=False,
+            ).values_list('promo_code_id', flat=True)
+        )
+        cache.set(key, used, USED_CODES_TTL)
+    return used
+
+
+def invalidate_codes(*codes):
+    cache.delete_many([promo_key(code) for code in codes if code])
+
+
+def invalidate_user(user_id):
+    if user_id:
+        cache.delete(used_codes_key(user_id))
@@ -0,0 +1,168 @@
+"""
+Кеш справочных данных: боксы, типы боксов и склады.
+
+Два уровня: LRU в памяти процесса с TTL и общий кеш Django
+(алиас из settings.STORAGE_REFERENCE_CACHE['BACKEND'], None — отключить).
+Записи сбрасываются сигналами post_save/post_delete (см. signals.py);
+в других процессах локальная копия живёт не дольше TTL.
+
+Настройки (все необязательные):
+
+    STORAGE_REFERENCE_CACHE = {
+        'MAXSIZE': 2048,     # записей в памяти процесса
+        'TTL': 300,          # секунд
+        'BACKEND': 'default',
+    }
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Box
+
+
+DEFAULTS = {
+    'MAXSIZE': 2048,
+    'TTL': 300,
+    'BACKEND': 'default',
+}
+KEY_PREFIX = 'storage:ref:'
+_MISSING = object()
+
+
+def _setting(name):
+    return getattr(settings, 'STORAGE_REFERENCE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class LRUCache:
+    """Потокобезопасный LRU с ограничением времени жизни записей"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LRUCache(_setting('MAXSIZE'), _setting('TTL'))
+
+
+def _shared_cache():
+    alias = _setting('BACKEND')
+    return caches[alias] if alias else None
+
+
+def get_value(key):
+    value = local_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    shared = _shared_cache()
+    if shared is not None:
+        value = shared.get(KEY_PREFIX + key, _MISSING)
+        if value is not _MISSING:
+            local_cache.set(key, value)
+            return value
+    return None
+
+
+def set_value(key, value):
+    local_cache.set(key, value)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.set(KEY_PREFIX + key, value, _setting('TTL'))
+
+
+def invalidate(*keys):
+    for key in keys:
+        local_cache.delete(key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete_many([KEY_PREFIX + key for key in keys])
+
+
+def box_key(box_id):
+    return f'box:{box_id}'
+
+
+def box_type_key(box_type_id):
+    return f'box_type:{box_type_id}'
+
+
+def warehouse_key(warehouse_id):
+    return f'warehouse:{warehouse_id}'
+
+
+def _load_box(box_id):
+    """Промах кеша: один запрос с select_related, заполняет все три уровня"""
+    box = Box.objects.select_related('box_type', 'box_type__warehouse').filter(pk=box_id).first()
+    if box is None:
+        return None
+
+    box_type = box.box_type
+    box_ref = {'id': box.pk, 'number': box.number, 'box_type_id': box_type.pk}
+    box_type_ref = {
+        'length': float(box_type.length),
+        'width': float(box_type.width),
+        'height': float(box_type.height),
+        'volume': float(box_type.volume),
+        'price': float(box_type.price),
+        'warehouse_id': box_type.warehouse_id,
+    }
+    set_value(box_key(box.pk), box_ref)
+    set_value(box_type_key(box_type.pk), box_type_ref)
+    set_value(warehouse_key(box_type.warehouse_id), str(box_type.warehouse))
+    return box_ref, box_type_ref, str(box_type.warehouse)
+
+
+def get_box_details(box_id):
+    """Данные бокса для AJAX box_details или None, если бокса нет"""
+    box_ref = get_value(box_key(box_id))
+    box_type_ref = get_value(box_type_key(box_ref['box_type_id'])) if box_ref else None
+    warehouse = get_value(warehouse_key(box_type_ref['warehouse_id'])) if box_type_ref else None
+
+    if warehouse is None:
+        loaded = _load_box(box_id)
+        if loaded is None:
+            return None
+        box_ref, box_type_ref, warehouse = loaded
+
+    return {
+        'id': box_ref['id'],
+        'number': box_ref['number'],
+        'length': box_type_ref['length'],
+        'width': box_type_ref['width'],
+        'height': box_type_ref['height'],
+        'volume': box_type_ref['volume'],
+        'price': box_type_ref['price'],
+        'warehouse': warehouse,
+    }
@@ -0,0 +1,159 @@
+"""
+Прогноз выручки и заполненности складов.
+
+Все договоры читаются одним запросом (цены боксов и их количество
+считаются подзапросами в БД), дальше помесячные суммы набираются
+разностными массивами — O(договоров + складов × месяцев).
+"""
+import csv
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import pricing
+from .models import Box, PromoCode, RentalAgreement, Warehouse
+
+
+GRACE_PERIOD_DAYS = 180
+REPORT_FIELDS = (
+    'warehouse_id', 'warehouse', 'month',
+    'occupied_boxes', 'total_boxes', 'occupancy_percent', 'revenue',
+)
+
+
+def _month_index(day, first):
+    return (day.year - first.year) * 12 + (day.month - first.month)
+
+
+def _month_start(first, offset):
+    month = first.month - 1 + offset
+    return date(first.year + month // 12, month % 12 + 1, 1)
+
+
+def _box_count_subquery():
+    boxes = Box.objects.filter(
+        agreements=OuterRef('pk')
+    ).order_by().values('agreements').annotate(n=Count('pk')).values('n')
+    return Coalesce(
+        Subquery(boxes, output_field=IntegerField()),
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _add_segment(occupied, revenue, start, end, boxes, cost):
+    """Добавляет договор в месяцы [start, end] разностных массивов"""
+    occupied[start] += boxes
+    occupied[end + 1] -= boxes
+    revenue[start] += cost
+    revenue[end + 1] -= cost
+
+
+def revenue_forecast(months=12, today=None):
+    """
+    Прогноз по складам на months месяцев вперёд, начиная с текущего.
+
+    Договор занимает свои боксы с месяца start_date по месяц end_date.
+    Уже просроченные договоры занимают боксы до конца льготного периода
+    (end_date + 180 дней), наценка — как в pricing.is_overdue. Промокод действует, пока
+    он валиден сегодня и не истёк valid_until. Бессрочные договоры
+    занимают боксы до конца горизонта.
+    """
+    today = today or date.today()
+    first = today.replace(day=1)
+    last_index = months - 1
+
+    promos = {promo.pk: promo for promo in PromoCode.objects.all()}
+
+    agreements = RentalAgreement.objects.filter(
+        status__in=['active', 'overdue']
+    ).annotate(
+        base_monthly_cost=pricing.base_cost_subquery(),
+        box_count=_box_count_subquery(),
+    ).order_by().values_list(
+        'warehouse_id', 'start_date', 'end_date', 'status',
+        'base_monthly_cost', 'box_count', 'promo_code_id',
+    )
+
+    occupied = {}
+    revenue = {}
+
+    for warehouse_id, start, end, status, base_cost, boxes, promo_id in agreements.iterator(chunk_size=2000):
+        if not boxes:
+            continue
+
+        # Наценка — по тем же правилам, что и в расчёте стоимости договора
+        overdue = pricing.is_overdue(status, end, today)
+        if end is not None and end < today:
+            end = end + timedelta(days=GRACE_PERIOD_DAYS)
+            if end < today:
+                continue
+
+        start_index = max(0, _month_index(start, first))
+        end_index = last_index if end is None else min(last_index, _month_index(end, first))
+        if start_index > end_index:
+            continue
+
+        if warehouse_id not in occupied:
+            occupied[warehouse_id] = [0] * (months + 1)
+            revenue[warehouse_id] = [Decimal('0')] * (months + 1)
+
+        promo = promos.get(promo_id)
+        discount = pricing.promo_percent(promo)
+        full_cost = pricing.monthly_cost(base_cost, overdue=overdue)
+        promo_cost = pricing.monthly_cost(base_cost, overdue=overdue, promo_discount=discount)
+
+        # Месяцы, пока промокод ещё действует, и месяцы после его истечения
+        promo_end_index = end_index
+        if discount and promo.valid_until:
+            promo_end_index = min(end_index, _month_index(promo.valid_until, first))
+
+        if promo_end_index >= start_index:
+            _add_segment(occupied[warehouse_id], revenue[warehouse_id],
+                         start_index, promo_end_index, boxes, promo_cost)
+        if promo_end_index < end_index:
+            _add_segment(occupied[warehouse_id], revenue[warehouse_id],
+                         max(start_index, promo_end_index + 1), end_index, boxes, full_cost)
+
+    total_boxes = dict(
+        Box.objects.order_by().values_list('box_type__warehouse_id').annotate(n=Count('pk'))
+    )
+
+    rows = []
+    for warehouse in Warehouse.objects.all():
+        month_occupied = occupied.get(warehouse.pk, [0] * (months + 1))
+        month_revenue = revenue.get(warehouse.pk, [Decimal('0')] * (months + 1))
+        total = total_boxes.get(warehouse.pk, 0)
+        boxes_running = 0
+        revenue_running = Decimal('0')
+        for index in range(months):
+            boxes_running += month_occupied[index]
+            revenue_running += month_revenue[index]
+            rows.append({
+                'warehouse_id': warehouse.pk,
+                'warehouse': str(warehouse),
+                'month': _month_start(first, index).strftime('%Y-%m'),
+                'occupied_boxes': boxes_running,
+                'total_boxes': total,
+                'occupancy_percent': round(boxes_running * 100 / total, 1) if total else 0,
+                'revenue': pricing.to_money(revenue_running),
+            })
+    return rows
+
+
+def write_csv(rows, stream):
+    writer = csv.DictWriter(stream, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def write_json(rows, stream):
+    json.dump(
+        [{**row, 'revenue': str(row['revenue'])} for row in rows],
+        stream,
+        ensure_ascii=False,
+        indent=2,
+    )
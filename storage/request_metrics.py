@@ -0,0 +1,182 @@
+"""
+Метрики запросов: время ответа, число и время SQL-запросов по view.
+
+Время ответа пишется в гистограмму для каждого запроса — это один
+perf_counter и короткая блокировка. SQL считается только в выборке
+(REQUEST_METRICS_SAMPLE_RATE): для неё на соединения ставится
+execute_wrapper, медленные запросы и повторы одного запроса
+(признак N+1) уходят в лог с именем view.
+
+Счётчики живут в памяти процесса; /metrics/ отдаёт их в текстовом
+формате Prometheus, у каждого воркера — свои.
+"""
+import hmac
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Границы корзин гистограммы, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Длина SQL в логе
+SQL_LOG_LENGTH = 500
+
+# Списки IN (%s, %s, ...) разной длины — это один и тот же запрос
+_IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def sql_shape(sql):
+    """SQL без параметров: запросы, отличающиеся только значениями, совпадают"""
+    return _NUMBER_RE.sub('?', _IN_LIST_RE.sub('(...)', sql))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for n, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[n] += 1
+                break
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram()
+        self.responses = Counter()
+        # Только по запросам из выборки
+        self.sampled = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.n_plus_one = 0
+
+
+class Registry:
+    def __init__(self):
+        self.views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, duration, status, queries=None):
+        with self._lock:
+            metrics = self.views.get(view)
+            if metrics is None:
+                metrics = self.views[view] = ViewMetrics()
+            metrics.duration.observe(duration)
+            metrics.responses[status // 100] += 1
+            if queries is not None:
+                metrics.sampled += 1
+                metrics.queries += queries.count
+                metrics.db_time += queries.time
+                metrics.n_plus_one += bool(queries.repeated)
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+
+    def render(self):
+        """Текстовый формат Prometheus"""
+        with self._lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# HELP storage_request_duration_seconds Время ответа view',
+                '# TYPE storage_request_duration_seconds histogram',
+            ]
+            for view, metrics in views:
+                cumulative = 0
+                for bound, count in zip(BUCKETS, metrics.duration.buckets):
+                    cumulative += count
+                    lines.append(f'storage_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'storage_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {metrics.duration.count}')
+                lines.append(f'storage_request_duration_seconds_sum{{view="{view}"}} {metrics.duration.sum:.6f}')
+                lines.append(f'storage_request_duration_seconds_count{{view="{view}"}} {metrics.duration.count}')
+
+            lines += [
+                '# HELP storage_responses_total Ответы по классу статуса',
+                '# TYPE storage_responses_total counter',
+            ]
+            for view, metrics in views:
+                for status_class, count in sorted(metrics.responses.items()):
+                    lines.append(f'storage_responses_total{{view="{view}",status="{status_class}xx"}} {count}')
+
+            sampled = [
+                ('storage_sampled_requests_total', 'Запросов в выборке SQL', 'sampled'),
+                ('storage_db_queries_total', 'SQL-запросов в выборке', 'queries'),
+                ('storage_db_seconds_total', 'Время SQL в выборке', 'db_time'),
+                ('storage_n_plus_one_total', 'Запросов выборки с повторяющимся SQL', 'n_plus_one'),
+            ]
+            for name, help_text, attr in sampled:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for view, metrics in views:
+                    value = getattr(metrics, attr)
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{{view="{view}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы, их время и повторы одного SQL"""
+
+    def __init__(self, slow_query):
+        self.slow_query = slow_query
+        self.count = 0
+        self.time = 0.0
+        self.shapes = Counter()
+        self.slow = []
+        self.repeated = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.time += elapsed
+            self.shapes[sql_shape(sql)] += 1
+            if elapsed >= self.slow_query:
+                self.slow.append((elapsed, sql))
+
+    def finish(self, threshold):
+        self.repeated = [(shape, count) for shape, count in self.shapes.items() if count > threshold]
+
+
+def sample_rate():
+    return getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.1)
+
+
+def metrics_view(request):
+    """
+    Гистограммы процесса для Prometheus. Доступ — по токену
+    REQUEST_METRICS_TOKEN (Authorization: Bearer ...) или сотрудникам
+    """
+    token = getattr(settings, 'REQUEST_METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    authorized = bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+    if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def sampled_connections():
+    """Соединения, на которые ставится счётчик (основная БД и реплика)"""
+    return [connections[alias] for alias in connections]
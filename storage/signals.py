@@ -1,25 +1,17 @@
-from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import date
-from .models import RentalAgreement, Box, BoxType
+from .models import RentalAgreement, Box, BoxType, Client, Warehouse, WarehouseImage, PromoCode
 from .notification_service import TelegramNotificationService
+from . import inventory, promo_cache, reference_cache
 
 
 @receiver(pre_save, sender=BoxType)
 def calculate_box_properties(sender, instance, **kwargs):
-    if instance.length and instance.width and instance.height:
-        instance.volume = instance.length * instance.width * instance.height
-        
-        if instance.volume <= 3:
-            instance.category = 'small'
-        elif instance.volume <= 10:
-            instance.category = 'medium'
-        else:
-            instance.category = 'large'
-    else:
-        instance.volume = 0
-        instance.category = 'small'
+    instance.volume, instance.category = BoxType.calculate_properties(
+        instance.length, instance.width, instance.height
+    )
 
 
 @receiver(m2m_changed, sender=RentalAgreement.boxes.through)
@@ -32,9 +24,7 @@ def handle_boxes_m2m_change(sender, instance, action, reverse, model, pk_set, **
             instance.boxes.update(status='free', current_agreement=None)
         elif pk_set:
             Box.objects.filter(pk__in=pk_set).update(status='free', current_agreement=None)
-        return
-
-    if action == 'post_add' and pk_set:
+    elif action == 'post_add' and pk_set:
         affected_boxes = Box.objects.filter(pk__in=pk_set)
         affected_boxes.update(status='occupied', current_agreement=instance)
         
@@ -45,16 +35,54 @@ def handle_boxes_m2m_change(sender, instance, action, reverse, model, pk_set, **
     elif action == 'post_clear':
         instance.boxes.update(status='free', current_agreement=None)
 
+    if reverse:
+        inventory.bump_version(box_types=instance.box_type_id)
+    elif pk_set:
+        inventory.bump_version_for_boxes(pk_set)
+    else:
+        inventory.bump_version(pk=instance.warehouse_id)
+
 @receiver(post_save, sender=RentalAgreement)
 def handle_status_change(sender, instance, created, **kwargs):
     if created:
         return
 
     if instance.status == 'active':
-        instance.boxes.filter(status='free').update(status='occupied', current_agreement=instance)
+        updated = instance.boxes.filter(status='free').update(status='occupied', current_agreement=instance)
     
     else:
-        instance.boxes.filter(current_agreement=instance).update(status='free', current_agreement=None)
+        updated = instance.boxes.filter(current_agreement=instance).update(status='free', current_agreement=None)
+
+    if updated:
+        inventory.bump_version(box_types__boxes__agreements=instance)
+
+
+@receiver(post_save, sender=Box)
+@receiver(post_delete, sender=Box)
+def handle_box_change(sender, instance, **kwargs):
+    inventory.bump_version(box_types=instance.box_type_id)
+    reference_cache.invalidate(reference_cache.box_key(instance.pk))
+
+
+@receiver(post_save, sender=BoxType)
+@receiver(post_delete, sender=BoxType)
+def handle_box_type_change(sender, instance, **kwargs):
+    inventory.bump_version(pk=instance.warehouse_id)
+    reference_cache.invalidate(reference_cache.box_type_key(instance.pk))
+
+
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def handle_warehouse_change(sender, instance, **kwargs):
+    # Карточки складов на страницах каталога кешируются по версии наличия
+    inventory.bump_version(pk=instance.pk)
+    reference_cache.invalidate(reference_cache.warehouse_key(instance.pk))
+
+
+@receiver(post_save, sender=WarehouseImage)
+@receiver(post_delete, sender=WarehouseImage)
+def handle_warehouse_image_change(sender, instance, **kwargs):
+    inventory.bump_version(pk=instance.warehouse_id)
         
         
 @receiver(pre_save, sender=RentalAgreement)
@@ -83,5 +111,37 @@ def check_agreement_date_change(sender, instance, **kwargs):
         if days_until_end <= 3 and not instance.reminder_3d_sent:
             TelegramNotificationService.send_reminder_3d(instance)
         if days_until_end < 0 and not instance.overdue_notification_sent:
-            TelegramNotificationService.send_overdue_notification(instance)        
-        
\ No newline at end of file
+            TelegramNotificationService.send_overdue_notification(instance)
+
+
+@receiver(pre_save, sender=PromoCode)
+def handle_promo_code_rename(sender, instance, **kwargs):
+    """При смене кода сбрасываем кеш и для старого значения"""
+    if not instance.pk:
+        return
+    old_code = PromoCode.objects.filter(pk=instance.pk).values_list('code', flat=True).first()
+    if old_code and old_code != instance.code:
+        promo_cache.invalidate_codes(old_code)
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def handle_promo_code_change(sender, instance, **kwargs):
+    promo_cache.invalidate_codes(instance.code)
+
+
+@receiver(post_save, sender=RentalAgreement)
+@receiver(post_delete, sender=RentalAgreement)
+def handle_promo_redemption(sender, instance, update_fields=None, created=False, **kwargs):
+    # Сохранения отдельных полей (флаги напоминаний и т.п.) промокод не меняют
+    if update_fields is not None and 'promo_code' not in update_fields:
+        return
+    # Новый договор без промокода список использованных не меняет
+    if created and instance.promo_code_id is None:
+        return
+    if RentalAgreement.client.is_cached(instance):
+        user_id = instance.client.user_id
+    else:
+        # Только user_id, без загрузки клиента целиком
+        user_id = Client.objects.filter(pk=instance.client_id).values_list('user_id', flat=True).first()
+    promo_cache.invalidate_user(user_id)
@@ -0,0 +1,176 @@
+"""
+Клиент Telegram Bot API с пулом соединений.
+
+Один requests.Session на процесс: TCP/TLS-соединения переиспользуются
+между запросами, у каждого запроса есть таймауты. Адрес API берётся из
+settings.TELEGRAM_API_URL (для нагрузочных тестов — локальная заглушка,
+см. fake_telegram.py). На 429 клиент ждёт retry_after из ответа, на 5xx
+и сетевые ошибки — повторяет с экспоненциальной паузой.
+
+Во view пользователь ждёт ответа, поэтому там — get_interactive_api():
+одна попытка и короткие таймауты.
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.telegram.org'
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+MAX_RETRIES = 3
+BACKOFF = 0.5
+# Дольше не ждём даже если Telegram просит: лучше вернуть ошибку вызывающему
+MAX_RETRY_AFTER = 30
+# Клиент для отправки из view
+INTERACTIVE_CONNECT_TIMEOUT = 2
+INTERACTIVE_READ_TIMEOUT = 3
+
+
+class TelegramAPIError(Exception):
+    pass
+
+
+class BotAPI:
+    def __init__(self, token=None, pool_size=10, api_url=None, max_retries=MAX_RETRIES,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.token = token or getattr(settings, 'TELEGRAM_BOT_TOKEN', '')
+        api_url = api_url or getattr(settings, 'TELEGRAM_API_URL', DEFAULT_API_URL)
+        self.base_url = f"{api_url.rstrip('/')}/bot{self.token}"
+        self.max_retries = max_retries
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def call(self, method, read_timeout=None, files=None, **params):
+        """Вызов метода Bot API; возвращает поле result или бросает TelegramAPIError"""
+        read_timeout = read_timeout or self.read_timeout
+        attempt = 0
+        while True:
+            retry_after, result = self._request(method, read_timeout, files, params, attempt)
+            if retry_after is None:
+                return result
+            if attempt >= self.max_retries:
+                raise TelegramAPIError(f'{method}: {result}')
+            attempt += 1
+            with self._retries_lock:
+                self.retries += 1
+            logger.warning('Telegram %s: %s, повтор %s через %.1f с', method, result, attempt, retry_after)
+            time.sleep(retry_after)
+
+    def _request(self, method, read_timeout, files, params, attempt):
+        """(None, result) при успехе или (пауза перед повтором, описание ошибки)"""
+        backoff = BACKOFF * 2 ** attempt
+        try:
+            if files:
+                # Файлы — multipart: параметры передаются полями формы
+                response = self.session.post(
+                    f'{self.base_url}/{method}',
+                    data=params,
+                    files=files,
+                    timeout=(self.connect_timeout, read_timeout),
+                )
+            else:
+                response = self.session.post(
+                    f'{self.base_url}/{method}',
+                    json=params,
+                    timeout=(self.connect_timeout, read_timeout),
+                )
+        except requests.RequestException as e:
+            return backoff, e
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {'description': f'HTTP {response.status_code}'}
+
+        if data.get('ok'):
+            return None, data['result']
+        description = data.get('description', response.status_code)
+        if response.status_code == 429:
+            retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+            return min(float(retry_after), MAX_RETRY_AFTER), description
+        if response.status_code >= 500:
+            return backoff, description
+        raise TelegramAPIError(f'{method}: {description}')
+
+    def get_updates(self, offset=None, timeout=50, limit=100):
+        """Long polling: ждёт новые обновления до timeout секунд"""
+        return self.call(
+            'getUpdates',
+            read_timeout=timeout + READ_TIMEOUT,
+            offset=offset,
+            timeout=timeout,
+            limit=limit,
+            allowed_updates=['message'],
+        )
+
+    def send_message(self, chat_id, text, parse_mode='Markdown', **params):
+        return self.call('sendMessage', chat_id=chat_id, text=text, parse_mode=parse_mode, **params)
+
+    def send_photo(self, chat_id, photo, caption='', filename='photo.png'):
+        """photo — содержимое файла в байтах (поток нельзя перечитать при повторе)"""
+        return self.call(
+            'sendPhoto',
+            files={'photo': (filename, photo, 'image/png')},
+            chat_id=chat_id,
+            caption=caption,
+        )
+
+    def close(self):
+        self.session.close()
+
+
+_default_api = None
+_interactive_api = None
+_default_api_lock = threading.Lock()
+
+
+def get_api():
+    """Общий клиент процесса"""
+    global _default_api
+    if _default_api is None:
+        with _default_api_lock:
+            if _default_api is None:
+                _default_api = BotAPI()
+    return _default_api
+
+
+def get_interactive_api():
+    """Клиент для view: без повторов, ошибка возвращается сразу"""
+    global _interactive_api
+    if _interactive_api is None:
+        with _default_api_lock:
+            if _interactive_api is None:
+                _interactive_api = BotAPI(
+                    max_retries=0,
+                    connect_timeout=INTERACTIVE_CONNECT_TIMEOUT,
+                    read_timeout=INTERACTIVE_READ_TIMEOUT,
+                )
+    return _interactive_api
+
+
+def reset_api(api=None):
+    """
+    Закрывает общие клиенты. Следующий get_api() вернёт api или,
+    если он не передан, создаст новый по текущим настройкам
+    """
+    global _default_api, _interactive_api
+    with _default_api_lock:
+        if _default_api is not None and _default_api is not api:
+            _default_api.close()
+        if _interactive_api is not None:
+            _interactive_api.close()
+        _default_api = api
+        _interactive_api = None
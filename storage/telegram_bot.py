@@ -1,23 +1,19 @@
-import os
-import requests
-from django.conf import settings
-from django.db.models import Q 
+from .contacts import normalize_email, normalize_phone
 from .models import Client
 
-def handle_telegram_start(chat_id, user_input):
-    """
-    Обработчик команды /start
-    user_input: email или телефон, который ввёл пользователь
-    """
-    # Ищем клиента по email или телефону
-    client = Client.objects.filter(
-        Q(email=user_input) | Q(phone=user_input)  #  Q без models.
-    ).first()
-    
-    if client:
-        client.telegram_chat_id = str(chat_id)
-        client.telegram_linked = True
-        client.save(update_fields=['telegram_chat_id', 'telegram_linked'])
-        return f"Привет, {client.full_name}! Telegram привязан к вашему аккаунту."
-    else:
-        return "Клиент с такими данными не найден. Проверьте email или телефон в личном кабинете."
\ No newline at end of file
+
+def find_client_by_contact(user_input):
+    """Клиент по email или телефону в любом формате ввода, либо None"""
+    if '@' in user_input:
+        email = normalize_email(user_input)
+        return Client.objects.filter(email_normalized=email).first() if email else None
+    phone = normalize_phone(user_input)
+    return Client.objects.filter(phone_e164=phone).first() if phone else None
+
+
+def link_chat(client, chat_id):
+    """Привязывает Telegram-чат к клиенту"""
+    client.telegram_chat_id = str(chat_id)
+    client.telegram_linked = True
+    client.save(update_fields=['telegram_chat_id', 'telegram_linked'])
+
@@ -0,0 +1,308 @@
+"""
+Диспетчер сообщений Telegram-бота.
+
+Общий для вебхука (telegram_updates.py) и long polling (run_telegram_bot):
+обе точки входа вызывают dispatch(update) и отправляют полученный ответ.
+
+Команды — таблица COMMANDS; команда и аргументы выделяются одним
+скомпилированным регулярным выражением. Ответ на шаг многошагового
+диалога (выбор договора, подтверждение) — таблица STEPS.
+
+Состояние чата (ChatState) читается из TelegramChat на каждое
+сообщение: обновления одного чата могут разбирать разные процессы
+(обработчик в каждом веб-процессе, process_telegram_updates, бот), и
+шаг диалога не должен расходиться между ними. В памяти процесса
+кешируется только список активных договоров клиента (LRU с TTL): перед
+действием договор всё равно перечитывается из БД (_load_agreement).
+"""
+import re
+import threading
+import time
+
+from django.utils import timezone
+
+from .models import RentalAgreement, TelegramChat
+from .notification_service import TelegramNotificationService
+from .reference_cache import LRUCache
+from .telegram_bot import find_client_by_contact, link_chat
+
+
+CACHE_SIZE = 10000
+# Список договоров клиента перечитывается не чаще, чем раз в минуту
+AGREEMENTS_TTL = 60
+# Незавершённый диалог сбрасывается через полчаса
+STEP_TIMEOUT = 30 * 60
+EXTEND_DAYS = 30
+
+COMMAND_RE = re.compile(r'^/(?P<name>[A-Za-z_]+)(?:@\w+)?(?:\s+(?P<args>.*))?$', re.DOTALL)
+CONFIRM_WORDS = frozenset({'да', 'yes', 'y', '+'})
+
+START_HINT = "Пожалуйста, введите email или телефон после /start\nПример: `/start user@example.com`"
+NOT_LINKED = "Сначала привяжите Telegram: отправьте /start и email или телефон из личного кабинета."
+HELP = (
+    "Команды бота:\n"
+    "/start email или телефон — привязать Telegram к аккаунту\n"
+    "/qr — получить QR-код для доступа к боксу\n"
+    "/extend — продлить аренду на месяц\n"
+    "/cancel — отменить текущее действие"
+)
+
+COMMANDS = {}
+STEPS = {}
+
+# client_id -> [{'id', 'label', 'end_date'}]
+agreements_cache = LRUCache(CACHE_SIZE, AGREEMENTS_TTL)
+# Обновления одного чата в процессе обрабатываются по очереди
+_chat_locks = [threading.Lock() for _ in range(64)]
+
+
+def command(*names):
+    def register(handler):
+        for name in names:
+            COMMANDS[name] = handler
+        return handler
+    return register
+
+
+def step(name):
+    def register(handler):
+        STEPS[name] = handler
+        return handler
+    return register
+
+
+class ChatState:
+    def __init__(self, chat_id, client_id=None, client_name='', step='', data=None):
+        self.chat_id = chat_id
+        self.client_id = client_id
+        self.client_name = client_name
+        self.step = step
+        self.data = data or {}
+
+    def set_step(self, name, **data):
+        self.step = name
+        self.data = {**data, 'at': time.time()}
+        save_state(self)
+
+    def clear_step(self):
+        if self.step:
+            self.step = ''
+            self.data = {}
+            save_state(self)
+
+
+def get_state(chat_id):
+    chat = TelegramChat.objects.select_related('client').filter(pk=chat_id).first()
+    if chat is None:
+        state = ChatState(chat_id)
+    else:
+        state = ChatState(
+            chat_id,
+            client_id=chat.client_id,
+            client_name=chat.client.full_name if chat.client else '',
+            step=chat.step,
+            data=chat.data,
+        )
+
+    if state.step and time.time() - state.data.get('at', 0) > STEP_TIMEOUT:
+        state.step, state.data = '', {}
+    return state
+
+
+def save_state(state):
+    # Обычно запись уже есть: один UPDATE вместо update_or_create с блокировкой
+    fields = {'client_id': state.client_id, 'step': state.step, 'data': state.data}
+    updated = TelegramChat.objects.filter(pk=state.chat_id).update(updated_at=timezone.now(), **fields)
+    if not updated:
+        TelegramChat.objects.get_or_create(chat_id=state.chat_id, defaults=fields)
+
+
+def active_agreements(state):
+    """Активные договоры клиента чата: [{'id', 'label', 'end_date'}]"""
+    agreements = agreements_cache.get(state.client_id)
+    if agreements is None:
+        queryset = RentalAgreement.objects.filter(
+            client_id=state.client_id, status='active'
+        ).select_related('warehouse').prefetch_related('boxes').order_by('end_date', 'pk')
+        agreements = [
+            {
+                'id': agreement.pk,
+                'label': _agreement_label(agreement),
+                'end_date': agreement.end_date,
+            }
+            for agreement in queryset
+        ]
+        agreements_cache.set(state.client_id, agreements)
+    return agreements
+
+
+def forget_agreements(state):
+    agreements_cache.delete(state.client_id)
+
+
+def _agreement_label(agreement):
+    boxes = ', '.join(box.number for box in agreement.boxes.all()) or '—'
+    until = f"до {agreement.end_date.strftime('%d.%m.%Y')}" if agreement.end_date else 'бессрочно'
+    return f"Договор №{agreement.pk}: бокс {boxes}, {agreement.warehouse}, {until}"
+
+
+def update_chat_id(update):
+    """Чат, из которого пришло обновление (и в который уходит ответ), или None"""
+    return ((update.get('message') or {}).get('chat') or {}).get('id')
+
+
+def dispatch(update):
+    """
+    Ответ на обновление Telegram: (chat_id, текст) или None, если отвечать не нужно
+    """
+    text = ((update.get('message') or {}).get('text') or '').strip()
+    chat_id = update_chat_id(update)
+    if not text or chat_id is None:
+        return None
+
+    with _chat_locks[hash(chat_id) % len(_chat_locks)]:
+        state = get_state(chat_id)
+        match = COMMAND_RE.match(text)
+        if match:
+            handler = COMMANDS.get(match['name'].lower(), help_command)
+            reply = handler(state, (match['args'] or '').strip())
+        elif state.step in STEPS:
+            reply = STEPS[state.step](state, text)
+        else:
+            return None
+    return (chat_id, reply) if reply else None
+
+
+@command('start')
+def start_command(state, args):
+    if not args:
+        state.set_step('await_contact')
+        return START_HINT
+    return link_contact(state, args)
+
+
+@step('await_contact')
+def link_contact(state, text):
+    client = find_client_by_contact(text)
+    if client is None:
+        return "Клиент с такими данными не найден. Проверьте email или телефон в личном кабинете."
+
+    link_chat(client, state.chat_id)
+    state.client_id = client.pk
+    state.client_name = client.full_name
+    forget_agreements(state)
+    state.step, state.data = '', {}
+    save_state(state)
+    return f"Привет, {client.full_name}! Telegram привязан к вашему аккаунту."
+
+
+@command('help')
+def help_command(state, args):
+    return HELP
+
+
+@command('cancel')
+def cancel_command(state, args):
+    state.clear_step()
+    return "Действие отменено."
+
+
+def _choose_agreement(state, action, step_name):
+    """Единственный договор — сразу action, несколько — просим выбрать номер"""
+    if not state.client_id:
+        return NOT_LINKED
+    agreements = active_agreements(state)
+    if not agreements:
+        return "У вас нет активных договоров аренды."
+    if len(agreements) == 1:
+        return action(state, agreements[0])
+
+    # Номера в списке запоминаются в шаге: список мог обновиться до ответа
+    state.set_step(step_name, ids=[agreement['id'] for agreement in agreements])
+    lines = [f"{n}. {agreement['label']}" for n, agreement in enumerate(agreements, 1)]
+    return "Выберите договор — отправьте его номер в списке:\n" + '\n'.join(lines)
+
+
+def _selected_agreement(state, text):
+    ids = state.data.get('ids', [])
+    if not (text.isdigit() and 1 <= int(text) <= len(ids)):
+        return None
+    agreement_id = ids[int(text) - 1]
+    # Договор из списка мог за это время завершиться
+    for agreement in active_agreements(state):
+        if agreement['id'] == agreement_id:
+            return agreement
+    return None
+
+
+def _load_agreement(state, agreement_id):
+    """Договор для действия: заново из БД, только активный и только этого клиента"""
+    agreement = RentalAgreement.objects.select_related('client', 'warehouse').filter(
+        pk=agreement_id, client_id=state.client_id, status='active'
+    ).first()
+    if agreement is None:
+        forget_agreements(state)
+    return agreement
+
+
+@command('qr')
+def qr_command(state, args):
+    return _choose_agreement(state, send_qr, 'choose_qr')
+
+
+@step('choose_qr')
+def choose_qr(state, text):
+    selected = _selected_agreement(state, text)
+    if selected is None:
+        return "Отправьте номер договора из списка или /cancel."
+    return send_qr(state, selected)
+
+
+def send_qr(state, selected):
+    state.clear_step()
+    agreement = _load_agreement(state, selected['id'])
+    if agreement is None:
+        return "Договор не найден или уже не активен."
+    if TelegramNotificationService.send_qr_code_for_access(agreement):
+        return None  # QR-код и описание уже отправлены
+    return "Не удалось отправить QR-код, попробуйте позже."
+
+
+@command('extend')
+def extend_command(state, args):
+    return _choose_agreement(state, ask_extend_confirmation, 'choose_extend')
+
+
+@step('choose_extend')
+def choose_extend(state, text):
+    selected = _selected_agreement(state, text)
+    if selected is None:
+        return "Отправьте номер договора из списка или /cancel."
+    return ask_extend_confirmation(state, selected)
+
+
+def ask_extend_confirmation(state, selected):
+    if selected['end_date'] is None:
+        state.clear_step()
+        return "Бессрочный договор не нужно продлевать."
+    state.set_step('confirm_extend', agreement_id=selected['id'])
+    return (
+        f"{selected['label']}\n"
+        f"Продлить на {EXTEND_DAYS} дней? Ответьте «да» или отправьте /cancel."
+    )
+
+
+@step('confirm_extend')
+def confirm_extend(state, text):
+    agreement_id = state.data.get('agreement_id')
+    state.clear_step()
+    if text.lower() not in CONFIRM_WORDS:
+        return "Продление отменено."
+
+    agreement = _load_agreement(state, agreement_id)
+    if agreement is None:
+        return "Договор не найден или уже не активен."
+    if not agreement.extend(EXTEND_DAYS):
+        return "Бессрочный договор не нужно продлевать."
+    forget_agreements(state)
+    return f"Договор №{agreement.pk} продлён до {agreement.end_date.strftime('%d.%m.%Y')}."
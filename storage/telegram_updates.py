@@ -0,0 +1,229 @@
+"""
+Очередь обновлений Telegram-вебхука и их обработчик.
+
+Вебхук только сохраняет обновление (TelegramUpdate) и сразу отвечает 200,
+чтобы Telegram не повторял доставку из-за медленного ответа. Обработчик
+забирает новые обновления пачками, получает ответы от диспетчера
+(telegram_dispatch.py) и отправляет их параллельно через общий пул
+соединений.
+
+Обновления одного чата обрабатываются по порядку: берётся только самое
+раннее незавершённое обновление чата, следующее — после того, как оно
+обработано. Это верно и при нескольких обработчиках на Postgres: пока
+один обработчик держит блокировку на первом обновлении чата (его
+транзакция ещё не закоммичена), другой пропускает его (skip_locked), а
+остальные обновления этого чата для него не первые и не берутся.
+
+Неудачная попытка откладывает обновление (next_attempt_at) с растущей
+паузой, после MAX_ATTEMPTS попыток оно помечается 'failed': пока Telegram
+недоступен, обработчик не крутится на одних и тех же записях.
+
+Ответ записывается в обновление до отправки. Если отправка не удалась,
+следующая попытка переотправляет сохранённый текст: диспетчер уже
+изменил состояние (продлил договор, сбросил шаг диалога), и повторный
+вызов дал бы другой ответ или не дал бы никакого.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .db_router import job_scope
+from .models import TelegramUpdate
+from .telegram_api import TelegramAPIError, get_api
+from .telegram_dispatch import dispatch, update_chat_id
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+SEND_WORKERS = 8
+MAX_ATTEMPTS = 3
+# Пауза перед повтором: RETRY_DELAY после первой неудачи, дальше вдвое больше
+RETRY_DELAY = timedelta(seconds=10)
+# Обновление, взятое в обработку и не завершённое за это время
+# (процесс упал), снова считается новым
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# Обработанные записи нужны только для отсечения повторов
+RETENTION = timedelta(days=2)
+PURGE_INTERVAL = 3600
+
+_send_executor = ThreadPoolExecutor(max_workers=SEND_WORKERS, thread_name_prefix='telegram-send')
+
+
+def enqueue_update(update):
+    """Сохраняет обновление; False, если оно уже было получено"""
+    try:
+        with transaction.atomic():
+            TelegramUpdate.objects.create(
+                update_id=update['update_id'], payload=update, chat_id=update_chat_id(update)
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def claim_batch(limit=BATCH_SIZE):
+    """Забирает пачку новых обновлений и помечает их как взятые в обработку"""
+    now = timezone.now()
+    with transaction.atomic():
+        # В чате есть более раннее незавершённое обновление
+        earlier_unfinished = TelegramUpdate.objects.filter(
+            chat_id=OuterRef('chat_id'),
+            update_id__lt=OuterRef('update_id'),
+            status__in=['new', 'processing'],
+        )
+        pending = TelegramUpdate.objects.filter(
+            Q(status='new', next_attempt_at__isnull=True)
+            | Q(status='new', next_attempt_at__lte=now)
+            | Q(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+        ).exclude(Exists(earlier_unfinished)).order_by('update_id')
+        ids = list(
+            pending.select_for_update(skip_locked=True).values_list('update_id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        TelegramUpdate.objects.filter(update_id__in=ids).update(
+            status='processing', claimed_at=now, attempts=F('attempts') + 1
+        )
+        return list(TelegramUpdate.objects.filter(update_id__in=ids).order_by('update_id'))
+
+
+def process_batch(api=None, limit=BATCH_SIZE):
+    """Обрабатывает одну пачку; возвращает число взятых обновлений"""
+    api = api or get_api()
+    updates = claim_batch(limit)
+    if not updates:
+        return 0
+
+    failed = {}
+    dispatched = []
+    for update in updates:
+        if update.reply is not None:
+            continue  # Повтор после неудачной отправки
+        try:
+            reply = dispatch(update.payload)
+        except Exception as e:
+            logger.exception('Ошибка обработки обновления %s', update.update_id)
+            failed[update.update_id] = str(e)
+            continue
+        update.reply = reply[1] if reply else ''
+        dispatched.append(update)
+    if dispatched:
+        TelegramUpdate.objects.bulk_update(dispatched, ['reply'])
+
+    replies = {}  # chat_id -> ([тексты], [update_id])
+    for update in updates:
+        if update.reply:
+            texts, update_ids = replies.setdefault(update.chat_id, ([], []))
+            texts.append(update.reply)
+            update_ids.append(update.update_id)
+
+    def send(item):
+        chat_id, (texts, update_ids) = item
+        try:
+            api.send_message(chat_id, '\n\n'.join(texts))
+        except TelegramAPIError as e:
+            return update_ids, str(e)
+        return update_ids, None
+
+    for update_ids, error in _send_executor.map(send, replies.items()):
+        if error:
+            logger.warning('Не удалось отправить ответ на обновления %s: %s', update_ids, error)
+            failed.update(dict.fromkeys(update_ids, error))
+
+    _finish(updates, failed)
+    return len(updates)
+
+
+def _finish(updates, failed):
+    now = timezone.now()
+    done_ids = [update.update_id for update in updates if update.update_id not in failed]
+    TelegramUpdate.objects.filter(update_id__in=done_ids).update(
+        status='done', processed_at=now, error=''
+    )
+    for update in updates:
+        if update.update_id in failed:
+            # attempts уже увеличен при взятии в обработку
+            if update.attempts >= MAX_ATTEMPTS:
+                status, next_attempt_at = 'failed', None
+            else:
+                status, next_attempt_at = 'new', now + retry_delay(update.attempts)
+            TelegramUpdate.objects.filter(update_id=update.update_id).update(
+                status=status, error=failed[update.update_id], next_attempt_at=next_attempt_at
+            )
+
+
+def retry_delay(attempts):
+    """Пауза перед следующей попыткой после attempts неудачных"""
+    return RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def purge_processed():
+    """Удаляет старые обработанные обновления"""
+    deleted, _ = TelegramUpdate.objects.filter(
+        status='done', processed_at__lt=timezone.now() - RETENTION
+    ).delete()
+    return deleted
+
+
+class UpdateWorker:
+    """
+    Фоновый поток обработки очереди внутри веб-процесса.
+    Вебхук будит его после сохранения обновления; без пробуждения очередь
+    проверяется раз в poll_interval секунд
+    """
+
+    def __init__(self, poll_interval=1):
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self.run, name='telegram-updates', daemon=True
+                )
+                self._thread.start()
+
+    def run(self):
+        logger.info('Обработчик обновлений Telegram запущен')
+        last_purge = 0
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                while True:
+                    with job_scope():
+                        if not process_batch():
+                            break
+                if time.monotonic() - last_purge > PURGE_INTERVAL:
+                    purge_processed()
+                    last_purge = time.monotonic()
+            except Exception:
+                logger.exception('Ошибка обработчика обновлений Telegram')
+            finally:
+                close_old_connections()
+
+
+worker = UpdateWorker()
+
+
+def notify_worker():
+    """Будит обработчик в этом процессе, если он включён в настройках"""
+    if getattr(settings, 'TELEGRAM_UPDATES_IN_PROCESS', True):
+        worker.ensure_started()
+        worker.wake()
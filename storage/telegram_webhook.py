@@ -1,40 +1,46 @@
+import hmac
+import json
+import logging
+
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.conf import settings
-import json
-import requests
-from .telegram_bot import handle_telegram_start
+from django.views.decorators.http import require_POST
+
+from .telegram_updates import enqueue_update, notify_worker
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
 
 @csrf_exempt  # Отключаем CSRF для вебхука Telegram
+@require_POST
 def telegram_webhook_view(request):
-    if request.method == 'POST':
-        data = json.loads(request.body)
-        
-        # Проверяем, что это сообщение с командой /start
-        if 'message' in data and 'text' in data['message']:
-            chat_id = data['message']['chat']['id']
-            text = data['message']['text'].strip()
-            
-            # Если команда /start
-            if text.startswith('/start'):
-                # Получаем аргумент после /start (email или телефон)
-                user_input = text.replace('/start', '').strip()
-                
-                if user_input:
-                    # Запускаем функцию привязки
-                    response_text = handle_telegram_start(chat_id, user_input)
-                else:
-                    response_text = "Пожалуйста, введите email или телефон после /start\nПример: `/start user@example.com`"
-                
-                # Отправляем ответ пользователю
-                token = getattr(settings, 'TELEGRAM_BOT_TOKEN', '')
-                url = f"https://api.telegram.org/bot{token}/sendMessage"
-                requests.post(url, data={
-                    'chat_id': chat_id,
-                    'text': response_text,
-                    'parse_mode': 'Markdown'
-                })
-        
+    """
+    Принимает обновление и сразу отвечает 200: обработка и ответ
+    пользователю — в фоне (storage.telegram_updates)
+    """
+    secret = getattr(settings, 'TELEGRAM_WEBHOOK_SECRET', '')
+    if not secret:
+        # Без секрета нельзя отличить Telegram от постороннего: не принимаем ничего
+        logger.error('Telegram webhook: TELEGRAM_WEBHOOK_SECRET не задан, запрос отклонён')
+        return JsonResponse({'ok': False}, status=503)
+    if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret):
+        logger.warning('Telegram webhook: неверный секретный токен')
+        return JsonResponse({'ok': False}, status=403)
+
+    try:
+        update = json.loads(request.body)
+        update_id = int(update['update_id'])
+    except (ValueError, TypeError, KeyError):
+        # Повтор не поможет: подтверждаем, чтобы Telegram не слал его снова
+        logger.warning('Telegram webhook: некорректное обновление')
         return JsonResponse({'ok': True})
-    
-    return JsonResponse({'ok': False})
\ No newline at end of file
+
+    if enqueue_update(update):
+        notify_worker()
+    else:
+        logger.info('Telegram webhook: повтор обновления %s', update_id)
+    return JsonResponse({'ok': True})
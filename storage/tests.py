@@ -1,3 +1,733 @@
-from django.test import TestCase
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import _does_token_match
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import db_router, inventory, pricing, promo_cache, reports, telegram_dispatch, telegram_updates
+from .contacts import normalize_email, normalize_phone
+from .forms import OrderForm
+from .management.commands.explain_hot_queries import full_scan, hot_queries
+from .models import Box, BoxType, Client, CommandRun, PromoCode, RentalAgreement, TelegramChat, TelegramUpdate, Warehouse
+from .telegram_api import BotAPI, TelegramAPIError, get_interactive_api, reset_api
+from .telegram_bot import find_client_by_contact
+from .page_cache import cache_anonymous_page
+from .throttling import rate_limit, single_flight, take_token
+from .telegram_updates import claim_batch, enqueue_update, process_batch
+
+
+def make_warehouse(**kwargs):
+    return Warehouse.objects.create(**{
+        'town': 'Москва', 'address': 'ул. Складская, 1', 'ceiling_height': Decimal('4'), **kwargs,
+    })
+
+
+def make_box_type(warehouse, length='1', width='1', height='1', price='1000'):
+    # Объём и категорию считает сигнал pre_save
+    return BoxType.objects.create(
+        warehouse=warehouse,
+        length=Decimal(length),
+        width=Decimal(width),
+        height=Decimal(height),
+        price=Decimal(price),
+    )
+
+
+def make_client(**kwargs):
+    return Client.objects.create(**{
+        'full_name': 'Иван Петров',
+        'address': 'ул. Жилая, 2',
+        'phone': '+79991234567',
+        'email': 'ivan@example.com',
+        **kwargs,
+    })
+
+
+def make_agreement(client, warehouse, boxes=(), **kwargs):
+    agreement = RentalAgreement.objects.create(client=client, warehouse=warehouse, **kwargs)
+    agreement.boxes.set(boxes)
+    return agreement
+
+
+class ContactTests(TestCase):
+    def test_normalize_phone(self):
+        for value in ('+7 (999) 123-45-67', '89991234567', '9991234567', ' +79991234567 '):
+            self.assertEqual(normalize_phone(value), '+79991234567', value)
+        self.assertEqual(normalize_phone('+44 20 7946 0958'), '+442079460958')
+        self.assertEqual(normalize_phone('123'), '')
+        self.assertEqual(normalize_phone(None), '')
+
+    def test_normalize_email(self):
+        self.assertEqual(normalize_email('  Ivan@Example.COM '), 'ivan@example.com')
+        self.assertEqual(normalize_email('ivan'), '')
+
+    def test_find_client_by_contact_in_any_format(self):
+        client = make_client(email='Ivan@Example.com', phone='8 (999) 123-45-67')
+        self.assertEqual(find_client_by_contact('IVAN@example.com'), client)
+        self.assertEqual(find_client_by_contact('+79991234567'), client)
+        self.assertIsNone(find_client_by_contact('+79990000000'))
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class BestFitTests(TestCase):
+    def setUp(self):
+        # ID складов в тестах повторяются: наличие и индекс объёмов из прошлого теста не нужны
+        cache.clear()
+        inventory._volume_indexes.clear()
+        self.warehouse = make_warehouse()
+        small = make_box_type(self.warehouse, '1', '1', '1', price='1000')
+        # Два бокса одного объёма с разной ценой: выбирается меньший номер
+        for number, price in (('B2', '2000'), ('A1', '2500')):
+            Box.objects.create(box_type=make_box_type(self.warehouse, '2', '1', '1', price=price), number=number)
+        Box.objects.create(box_type=small, number='C1', status='occupied')
+
+    def order_form(self, **data):
+        return OrderForm(data={
+            'warehouse': self.warehouse.pk,
+            'mode': 'auto',
+            'rental_duration': 6,
+            'start_date': (date.today() + timedelta(days=1)).isoformat(),
+            'pdn_accepted': 'on',
+            'need_length': '1.5',
+            'need_width': '1',
+            'need_height': '1',
+            **data,
+        })
+
+    def best_fit(self, **params):
+        return self.client.get(reverse('ajax_best_fit'), {
+            'warehouse_id': self.warehouse.pk, 'volume': '1.5', 'duration': 6, **params,
+        }).json()
+
+    def test_endpoint_and_order_form_pick_the_same_box(self):
+        data = self.best_fit()
+        self.assertEqual(data['box']['number'], 'A1')
+
+        form = self.order_form()
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['selected_box'].number, 'A1')
+        price = form.calculate_price()
+        self.assertEqual(price['monthly_price'], Decimal(str(data['quote']['monthly_price'])))
+        self.assertEqual(price['total_price'], Decimal(str(data['quote']['total_price'])))
+
+    def test_quote_includes_promo_code(self):
+        PromoCode.objects.create(code='SALE10', discount_percent=10, valid_until=date.today() + timedelta(days=5))
+        quote = self.best_fit(promo='SALE10')['quote']
+        # 2500 − 10 % за 6 месяцев − 10 % промокода
+        self.assertEqual(quote['monthly_price'], 2025.0)
+        self.assertEqual(quote['promo_discount'], 10)
+
+    def test_no_box_for_volume(self):
+        self.assertFalse(self.best_fit(volume='5')['found'])
+        form = self.order_form(need_length='5')
+        self.assertFalse(form.is_valid())
+
+    def test_index_follows_box_changes(self):
+        self.best_fit()
+        Box.objects.filter(number='A1').update(status='occupied')
+        inventory.bump_version(pk=self.warehouse.pk)
+        self.assertEqual(self.best_fit()['box']['number'], 'B2')
+
+
+class PricingTests(TestCase):
+    def test_to_money_rounds_half_up(self):
+        self.assertEqual(pricing.to_money(Decimal('0.005')), Decimal('0.01'))
+        self.assertEqual(pricing.to_money(Decimal('2.675')), Decimal('2.68'))
+        self.assertEqual(pricing.to_money(Decimal('2.674')), Decimal('2.67'))
+
+    def test_quote_applies_duration_then_promo(self):
+        quote = pricing.quote(Decimal('333.33'), 12, promo_discount=5)
+        self.assertEqual(quote['discount_percent'], 15)
+        self.assertEqual(quote['monthly_price'], Decimal('269.16'))
+        # Итог — от округлённой месячной цены, как в договоре
+        self.assertEqual(quote['total_price'], Decimal('3229.92'))
+        self.assertEqual(pricing.quote(Decimal('1000'), 5)['monthly_price'], Decimal('1000.00'))
+        self.assertEqual(pricing.quote(Decimal('1000'), 6)['monthly_price'], Decimal('900.00'))
+
+    def test_monthly_cost_surcharge_then_promo(self):
+        self.assertEqual(
+            pricing.monthly_cost(Decimal('999.99'), overdue=True, promo_discount=10),
+            Decimal('1124.99'),
+        )
+
+    def test_batch_pricing_matches_single_agreement(self):
+        today = date.today()
+        warehouse = make_warehouse()
+        promo = PromoCode.objects.create(code='SALE10', discount_percent=10)
+        for n, (price, end) in enumerate((('999.99', today - timedelta(days=5)), ('1500', today + timedelta(days=365)))):
+            box = Box.objects.create(box_type=make_box_type(warehouse, price=price), number=str(n), status='occupied')
+            client = make_client(email=f'client{n}@example.com', phone=f'+7999123456{n}')
+            make_agreement(client, warehouse, [box], promo_code=promo,
+                           start_date=today - timedelta(days=30), end_date=end)
+        with self.assertNumQueries(1):
+            batch = pricing.price_agreements(RentalAgreement.objects.order_by('pk'), today=today)
+        for agreement in batch:
+            single = RentalAgreement.objects.get(pk=agreement.pk)
+            self.assertEqual(agreement.monthly_cost, single.get_total_monthly_cost())
+            self.assertEqual(agreement.final_monthly_cost, single.get_final_monthly_cost())
+            self.assertEqual(agreement.total_cost, single.get_total_cost())
+        self.assertEqual(batch[0].monthly_cost, Decimal('1249.99'))
+
+
+class PromoCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.promo = PromoCode.objects.create(code='SALE10', discount_percent=10)
+
+    def test_key_is_hashed_and_code_normalized(self):
+        key = promo_cache.promo_key(' bad code\n')
+        self.assertRegex(key, r'^storage:promo:code:[0-9a-f]{40}$')
+        self.assertEqual(key, promo_cache.promo_key('bad code'))
+        self.assertEqual(promo_cache.get_promo('  SALE10 '), self.promo)
+
+    def test_unknown_code_is_cached_negatively(self):
+        self.assertIsNone(promo_cache.get_promo('NOPE'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(promo_cache.get_promo('NOPE'))
+
+    def test_too_long_code_is_not_queried_or_cached(self):
+        code = 'X' * (promo_cache.MAX_CODE_LENGTH + 1)
+        with self.assertNumQueries(0):
+            self.assertIsNone(promo_cache.get_promo(code))
+        self.assertIsNone(cache.get(promo_cache.promo_key(code)))
+
+    def test_redemption_resets_used_codes(self):
+        user = User.objects.create_user('ivan', password='x')
+        client = make_client(user=user)
+        warehouse = make_warehouse()
+        self.assertEqual(promo_cache.get_used_promo_ids(user.pk), frozenset())
+        agreement = make_agreement(client, warehouse, end_date=date.today() + timedelta(days=30))
+        # Договор без промокода не сбрасывает кеш и не читает клиента
+        self.assertIsNotNone(cache.get(promo_cache.used_codes_key(user.pk)))
+        agreement = RentalAgreement.objects.get(pk=agreement.pk)
+        agreement.promo_code = self.promo
+        with CaptureQueriesContext(connection) as queries:
+            agreement.save(update_fields=['promo_code'])
+        # Из клиента читается только user_id
+        client_queries = [q['sql'] for q in queries if 'FROM "storage_client"' in q['sql']]
+        self.assertEqual(len(client_queries), 1)
+        self.assertNotIn('full_name",', client_queries[0])
+        self.assertEqual(promo_cache.get_used_promo_ids(user.pk), frozenset({self.promo.pk}))
+
+
+class RevenueForecastTests(TestCase):
+    def test_surcharge_only_for_active_overdue_agreements(self):
+        today = date(2026, 5, 15)
+        client = make_client()
+        for status, price in (('active', '1000'), ('overdue', '2000')):
+            warehouse = make_warehouse(address=f'ул. {status}')
+            box = Box.objects.create(box_type=make_box_type(warehouse, price=price), number='A1', status='occupied')
+            make_agreement(
+                client, warehouse, [box], status=status,
+                start_date=date(2026, 1, 1), end_date=date(2026, 4, 30),
+            )
+        rows = reports.revenue_forecast(months=1, today=today)
+        revenue = {row['warehouse'].split(', ')[-1]: row['revenue'] for row in rows}
+        self.assertEqual(revenue, {'ул. active': Decimal('1250.00'), 'ул. overdue': Decimal('2000.00')})
+
+
+class ImportBoxesTests(TestCase):
+    def setUp(self):
+        self.warehouse = make_warehouse()
+
+    def import_csv(self, *rows, stderr=None):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('warehouse,number,length,width,height,price\n')
+            for row in rows:
+                f.write(','.join([str(self.warehouse.pk), *row]) + '\n')
+        call_command('import_boxes', path, stdout=StringIO(), stderr=stderr or StringIO())
+
+    def test_imports_boxes_and_groups_them_by_type(self):
+        self.import_csv(('A1', '1', '1', '2', '1500'), ('A2', '1', '1', '2', '1500'), ('B1', '2', '2', '2', '3000'))
+        self.assertEqual(BoxType.objects.count(), 2)
+        box_type = BoxType.objects.get(length=1)
+        self.assertEqual(box_type.volume, Decimal('2.00'))
+        self.assertEqual(box_type.total_count, 2)
+        self.assertEqual(Box.objects.count(), 3)
+
+    def test_every_invalid_row_is_reported_and_nothing_is_saved(self):
+        stderr = StringIO()
+        with self.assertRaisesMessage(CommandError, '6 ошибок'):
+            self.import_csv(
+                ('A1', '50', '50', '50', '1000'),
+                ('A2', '1000', '1', '1', '1000'),
+                ('A3', '0.05', '1', '1', '1000'),
+                ('A4', 'abc', '1', '1', '1000'),
+                ('A5', 'Infinity', '1', '1', '1000'),
+                ('A6', '1', '1', '1', '1000'),
+                ('A6', '1', '1', '1', '1000'),
+                stderr=stderr,
+            )
+        errors = stderr.getvalue()
+        self.assertIn('Строка 1: объём 125000.00 м³ больше 9999.99', errors)
+        self.assertIn('Строка 2: Длина (м) больше 999.99', errors)
+        self.assertIn('Строка 7: бокс №A6 повторяется', errors)
+        self.assertFalse(BoxType.objects.exists())
+
+
+class FakeBotAPI:
+    """Записывает отправленные сообщения; первые fail_times отправок — ошибка"""
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.sent = []
+
+    def send_message(self, chat_id, text, **params):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise TelegramAPIError('sendMessage: Bad Gateway')
+        self.sent.append((chat_id, text))
+        return {}
+
+
+def telegram_message(update_id, chat_id, text):
+    return {'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': text}}
+
+
+class TelegramUpdateQueueTests(TestCase):
+    chat_id = 5550001
+
+    def setUp(self):
+        telegram_dispatch.agreements_cache.clear()
+        self.client_obj = make_client(telegram_chat_id=str(self.chat_id), telegram_linked=True)
+        warehouse = make_warehouse()
+        box = Box.objects.create(box_type=make_box_type(warehouse), number='A1', status='occupied')
+        self.agreement = make_agreement(
+            self.client_obj, warehouse, [box], end_date=date.today() + timedelta(days=10)
+        )
+        TelegramChat.objects.create(
+            chat_id=self.chat_id,
+            client=self.client_obj,
+            step='confirm_extend',
+            data={'agreement_id': self.agreement.pk, 'at': time.time()},
+        )
+
+    def test_failed_send_resends_saved_reply_without_dispatching_again(self):
+        end_date = self.agreement.end_date
+        enqueue_update(telegram_message(1, self.chat_id, 'да'))
+
+        process_batch(api=FakeBotAPI(fail_times=1))
+        update = TelegramUpdate.objects.get(pk=1)
+        self.assertEqual(update.status, 'new')
+        self.assertIn('продлён', update.reply)
+
+        api = FakeBotAPI()
+        with mock.patch.object(telegram_updates, 'dispatch') as dispatch:
+            with self.later(telegram_updates.RETRY_DELAY):
+                process_batch(api=api)
+        dispatch.assert_not_called()
+        self.assertEqual(api.sent, [(self.chat_id, update.reply)])
+        self.assertEqual(TelegramUpdate.objects.get(pk=1).status, 'done')
+        self.agreement.refresh_from_db()
+        self.assertEqual(self.agreement.end_date, end_date + timedelta(days=30))
+
+    def test_update_failed_after_max_attempts(self):
+        enqueue_update(telegram_message(1, self.chat_id, '/help'))
+        for attempt in range(3):
+            with self.later(telegram_updates.RETRY_DELAY * 2 ** attempt):
+                process_batch(api=FakeBotAPI(fail_times=1))
+        update = TelegramUpdate.objects.get(pk=1)
+        self.assertEqual(update.status, 'failed')
+        self.assertEqual(update.attempts, 3)
+
+    def test_failed_update_waits_for_backoff(self):
+        enqueue_update(telegram_message(1, self.chat_id, '/help'))
+        process_batch(api=FakeBotAPI(fail_times=1))
+        update = TelegramUpdate.objects.get(pk=1)
+        self.assertGreater(update.next_attempt_at, timezone.now())
+        # Пока Telegram недоступен, обработчик не берёт то же обновление сразу
+        self.assertEqual(process_batch(api=FakeBotAPI()), 0)
+        with self.later(telegram_updates.RETRY_DELAY):
+            self.assertEqual(process_batch(api=FakeBotAPI()), 1)
+        self.assertEqual(TelegramUpdate.objects.get(pk=1).status, 'done')
+
+    def test_batch_skips_chats_busy_in_another_batch(self):
+        enqueue_update(telegram_message(1, self.chat_id, '/extend'))
+        enqueue_update(telegram_message(2, self.chat_id, '1'))
+        enqueue_update(telegram_message(3, self.chat_id + 1, '/help'))
+        TelegramUpdate.objects.filter(pk=1).update(status='processing', claimed_at=timezone.now())
+
+        self.assertEqual([update.pk for update in claim_batch()], [3])
+
+    def later(self, delta):
+        """Время обработчика сдвинуто вперёд на delta (+1 с)"""
+        return mock.patch.object(
+            telegram_updates.timezone, 'now', return_value=timezone.now() + delta + timedelta(seconds=1)
+        )
+
+    def test_chat_updates_are_claimed_one_at_a_time(self):
+        enqueue_update(telegram_message(1, self.chat_id, '/extend'))
+        enqueue_update(telegram_message(2, self.chat_id, '1'))
+        self.assertEqual([update.pk for update in claim_batch()], [1])
+        self.assertEqual(claim_batch(), [])
+        TelegramUpdate.objects.filter(pk=1).update(status='done')
+        self.assertEqual([update.pk for update in claim_batch()], [2])
+
+    def test_overlapping_claimer_skips_chat_locked_by_uncommitted_claim(self):
+        enqueue_update(telegram_message(1, self.chat_id, '/extend'))
+        enqueue_update(telegram_message(2, self.chat_id, '1'))
+        enqueue_update(telegram_message(3, self.chat_id + 1, '/help'))
+        # Обработчик A взял обновление 1 и ещё не закоммитил транзакцию:
+        # для обработчика B строка 1 по-прежнему 'new', но заблокирована,
+        # и select_for_update(skip_locked=True) её пропускает (как на Postgres)
+        locked = {1}
+        select_for_update = QuerySet.select_for_update
+
+        def skip_locked(queryset, **kwargs):
+            return select_for_update(queryset, **kwargs).exclude(update_id__in=locked)
+
+        with transaction.atomic():
+            with mock.patch.object(QuerySet, 'select_for_update', skip_locked):
+                claimed_by_b = [update.pk for update in claim_batch()]
+        self.assertEqual(claimed_by_b, [3])
+
+    def test_repeated_delivery_is_ignored(self):
+        self.assertTrue(enqueue_update(telegram_message(1, self.chat_id, '/help')))
+        self.assertFalse(enqueue_update(telegram_message(1, self.chat_id, '/help')))
+
+
+class TelegramDialogTests(TestCase):
+    chat_id = 5550002
+
+    def setUp(self):
+        telegram_dispatch.agreements_cache.clear()
+        self.client_obj = make_client()
+        warehouse = make_warehouse()
+        self.agreements = [
+            make_agreement(self.client_obj, warehouse, end_date=date.today() + timedelta(days=days))
+            for days in (10, 20)
+        ]
+        TelegramChat.objects.create(chat_id=self.chat_id, client=self.client_obj)
+
+    def send(self, text):
+        reply = telegram_dispatch.dispatch(telegram_message(1, self.chat_id, text))
+        return reply[1] if reply else None
+
+    def step(self):
+        return TelegramChat.objects.get(pk=self.chat_id).step
+
+    def test_extend_choose_confirm(self):
+        self.assertIn('Выберите договор', self.send('/extend'))
+        self.assertEqual(self.step(), 'choose_extend')
+        self.assertIn('Продлить', self.send('2'))
+        self.assertEqual(self.step(), 'confirm_extend')
+        self.assertIn('продлён', self.send('да'))
+        self.assertEqual(self.step(), '')
+
+        agreement = self.agreements[1]
+        old_end_date = agreement.end_date
+        agreement.refresh_from_db()
+        self.assertEqual(agreement.end_date, old_end_date + timedelta(days=telegram_dispatch.EXTEND_DAYS))
+
+    def test_wrong_choice_keeps_step(self):
+        self.send('/extend')
+        self.assertIn('номер договора', self.send('7'))
+        self.assertEqual(self.step(), 'choose_extend')
+
+    def test_cancel_and_refusal_clear_step(self):
+        self.send('/extend')
+        self.assertEqual(self.send('/cancel'), 'Действие отменено.')
+        self.assertEqual(self.step(), '')
+
+        self.send('/extend')
+        self.send('1')
+        self.assertEqual(self.send('нет'), 'Продление отменено.')
+        self.assertEqual(self.step(), '')
+
+    def test_step_is_read_from_database(self):
+        # Шаг сбросил другой процесс: этот не должен отвечать по старому шагу
+        self.send('/extend')
+        TelegramChat.objects.filter(pk=self.chat_id).update(step='', data={})
+        self.assertIsNone(self.send('1'))
+
+    def test_unlinked_chat(self):
+        TelegramChat.objects.filter(pk=self.chat_id).update(client=None)
+        self.assertEqual(self.send('/qr'), telegram_dispatch.NOT_LINKED)
+
+
+@override_settings(TELEGRAM_UPDATES_IN_PROCESS=False)
+class TelegramWebhookTests(TestCase):
+    url = reverse('telegram_webhook')
+
+    def post(self, secret=None):
+        headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret is not None else {}
+        return self.client.post(
+            self.url, telegram_message(1, 1, '/help'), content_type='application/json', headers=headers
+        )
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET='')
+    def test_rejects_everything_without_configured_secret(self):
+        self.assertEqual(self.post().status_code, 503)
+        self.assertFalse(TelegramUpdate.objects.exists())
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET='s3cret')
+    def test_checks_secret_header(self):
+        self.assertEqual(self.post('wrong').status_code, 403)
+        self.assertEqual(self.post('s3cret').status_code, 200)
+        self.assertTrue(TelegramUpdate.objects.filter(pk=1).exists())
+
+
+class BotAPIRetryTests(TestCase):
+    def tearDown(self):
+        reset_api()
+
+    def response(self, status, data):
+        return mock.Mock(status_code=status, json=mock.Mock(return_value=data))
+
+    def test_retries_after_server_error(self):
+        api = BotAPI(token='t', api_url='http://bot.test')
+        responses = [self.response(502, {'ok': False}), self.response(200, {'ok': True, 'result': 7})]
+        with mock.patch.object(api.session, 'post', side_effect=responses), mock.patch('time.sleep') as sleep:
+            self.assertEqual(api.call('getMe'), 7)
+        sleep.assert_called_once()
+
+    def test_interactive_api_does_not_wait_for_retry_after(self):
+        api = get_interactive_api()
+        limited = self.response(429, {'ok': False, 'parameters': {'retry_after': 30}})
+        with mock.patch.object(api.session, 'post', return_value=limited) as post, \
+                mock.patch('time.sleep') as sleep:
+            with self.assertRaises(TelegramAPIError):
+                api.call('sendMessage', chat_id=1, text='x')
+        self.assertEqual(post.call_count, 1)
+        sleep.assert_not_called()
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_take_token_refills_at_rate(self):
+        with mock.patch('time.time', return_value=1000.0):
+            results = [take_token('test', rate=1, burst=3)[0] for _ in range(4)]
+            self.assertEqual(results, [True, True, True, False])
+        with mock.patch('time.time', return_value=1000.5):
+            self.assertEqual(take_token('test', rate=1, burst=3), (False, 0.5))
+        with mock.patch('time.time', return_value=1001.0):
+            self.assertEqual([take_token('test', rate=1, burst=3)[0] for _ in range(2)], [True, False])
+
+    def test_burst_is_not_doubled_after_idle(self):
+        with mock.patch('time.time', return_value=1000.0):
+            take_token('test', rate=1, burst=3)
+        # После долгого простоя корзина полна, но не больше burst
+        with mock.patch('time.time', return_value=2000.0):
+            results = [take_token('test', rate=1, burst=3)[0] for _ in range(6)]
+        self.assertEqual(results, [True, True, True, False, False, False])
+
+    def test_concurrent_requests_do_not_exceed_burst(self):
+        allowed = []
+
+        def hammer():
+            for _ in range(10):
+                allowed.append(take_token('test', rate=0.001, burst=20)[0])
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed), 20)
+
+    def test_rate_limit_returns_429_with_retry_after(self):
+        @rate_limit(rate=1, burst=2, scope='test')
+        def view(request):
+            return JsonResponse({'ok': True})
+
+        factory = RequestFactory()
+        with mock.patch('time.time', return_value=1000.0):
+            statuses = [view(factory.get('/x/')).status_code for _ in range(2)]
+            response = view(factory.get('/x/'))
+            # Другой IP считается отдельно
+            other_ip = view(factory.get('/x/', REMOTE_ADDR='10.0.0.2'))
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(other_ip.status_code, 200)
+
+    def test_single_flight_follower_gets_snapshot(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        @single_flight()
+        def view(request):
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            response = HttpResponse('{"n": 1}', content_type='application/json')
+            response['ETag'] = '"v1"'
+            return response
+
+        factory = RequestFactory()
+        results = {}
+
+        def leader():
+            response = view(factory.get('/x/'))
+            # Лидер меняет ответ уже после того, как ведомые проснулись
+            response.content = b'changed'
+            results['leader'] = response
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.update(follower=view(factory.get('/x/'))))
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        thread.join(5)
+        follower.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results['follower'].content, b'{"n": 1}')
+        self.assertEqual(results['follower']['ETag'], '"v1"')
+
+
+class HotQueryIndexTests(TestCase):
+    def test_hot_queries_do_not_scan_tables(self):
+        for name, table, queryset in hot_queries():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertFalse(full_scan(plan, table), plan)
+
+    def test_partial_indexes_are_used(self):
+        # Почти все боксы заняты — как на рабочем складе; ANALYZE даёт
+        # планировщику статистику, по которой частичный индекс выгоднее
+        warehouse = make_warehouse()
+        box_type = make_box_type(warehouse)
+        Box.objects.bulk_create(
+            Box(box_type=box_type, number=str(n), status='free' if n < 2 else 'occupied')
+            for n in range(200)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        plans = {name: queryset.explain() for name, _, queryset in hot_queries()}
+        self.assertIn('box_free_type_idx', plans['Свободные боксы типа'])
+        self.assertIn('box_free_type_idx', plans['Свободные боксы склада'])
+        self.assertIn('agreement_active_end_idx', plans['Истекающие договоры'])
+
+
+@mock.patch.object(db_router, 'replica_configured', return_value=True)
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        db_router.start_request(pinned=False)
+
+    def tearDown(self):
+        db_router.start_request(pinned=False)
+
+    def test_reads_go_to_replica_until_first_write(self, _):
+        with db_router.use_replica():
+            self.assertEqual(self.router.db_for_read(Box), 'replica')
+            self.assertEqual(self.router.db_for_write(Box), 'default')
+            self.assertTrue(db_router.has_written())
+            self.assertEqual(self.router.db_for_read(Box), 'default')
+        self.assertEqual(self.router.db_for_read(Warehouse), 'default')
+
+    def test_pinned_request_reads_primary(self, _):
+        db_router.start_request(pinned=True)
+        with db_router.use_replica():
+            self.assertEqual(self.router.db_for_read(Box), 'default')
+
+    def test_job_scope_resets_state_between_background_jobs(self, _):
+        # Поток фонового обработчика: запись в первом задании
+        with db_router.job_scope():
+            self.router.db_for_write(Box)
+            self.assertTrue(db_router.has_written())
+        with db_router.job_scope(), db_router.use_replica():
+            self.assertFalse(db_router.has_written())
+            self.assertEqual(self.router.db_for_read(Box), 'replica')
+
+    def test_update_worker_runs_each_batch_in_job_scope(self, _):
+        states = []
+
+        def batch(**kwargs):
+            states.append(db_router.has_written())
+            self.router.db_for_write(TelegramUpdate)
+            return len(states) < 3
+
+        worker = telegram_updates.UpdateWorker(poll_interval=0)
+        with mock.patch.object(telegram_updates, 'process_batch', side_effect=batch), \
+                mock.patch.object(telegram_updates, 'purge_processed'), \
+                mock.patch.object(telegram_updates, 'close_old_connections', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                worker.run()
+        self.assertEqual(states, [False, False, False])
+
+    def test_session_write_does_not_stick(self, _):
+        with db_router.use_replica():
+            self.assertEqual(self.router.db_for_write(Session), 'default')
+            self.assertFalse(db_router.has_written())
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+            self.assertEqual(self.router.db_for_read(Box), 'replica')
+
+
+class CommandRunAdminTests(TestCase):
+    def test_change_page_renders_phase_table(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        run = CommandRun.objects.create(
+            command='send_reminders', started_at=timezone.now(), duration=1.5,
+            phases={'load': {'seconds': 0.25, 'calls': 1, 'queries': 3}, '<send>': {'seconds': 1.125, 'calls': 4, 'queries': 8}},
+        )
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:storage_commandrun_change', args=[run.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<td>load</td><td>0.250</td><td>1</td><td>3</td>', html=False)
+        self.assertContains(response, '<td>&lt;send&gt;</td><td>1.125</td>', html=False)
+        # Сырой JSON рядом с таблицей не выводится
+        self.assertNotContains(response, '&quot;queries&quot;')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_tracking_parameters_share_one_entry(self):
+        calls = []
+
+        @cache_anonymous_page(query_params=('page',))
+        def view(request):
+            calls.append(request.get_full_path())
+            return HttpResponse(f'page {request.GET.get("page", 1)}')
+
+        factory = RequestFactory()
+        self.assertEqual(view(factory.get('/boxes/?utm_source=vk')).content, b'page 1')
+        self.assertEqual(view(factory.get('/boxes/?utm_source=ya&utm_campaign=x')).content, b'page 1')
+        self.assertEqual(view(factory.get('/boxes/?page=2&utm_source=vk')).content, b'page 2')
+        self.assertEqual(view(factory.get('/boxes/?page=2')).content, b'page 2')
+        self.assertEqual(len(calls), 2)
+
+    def test_cached_page_gets_fresh_csrf_token_per_visitor(self):
+        url = reverse('home')
+        tokens = []
+        for cached in (False, True):
+            visitor = self.client_class(enforce_csrf_checks=True)
+            # Второй посетитель получает страницу из кеша, view не вызывается
+            with mock.patch('users.views.render', side_effect=AssertionError) if cached else nullcontext():
+                response = visitor.get(url)
+            self.assertEqual(response.status_code, 200)
+            match = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', response.content)
+            self.assertIsNotNone(match)
+            tokens.append(match[1].decode())
+            # Токен страницы проходит проверку CSRF у этого посетителя
+            cookie = visitor.cookies[settings.CSRF_COOKIE_NAME].value
+            self.assertTrue(_does_token_match(tokens[-1], cookie))
+        self.assertNotEqual(tokens[0], tokens[1])
@@ -0,0 +1,176 @@
+"""
+Защита AJAX-эндпоинтов от всплесков трафика.
+
+rate_limit — token bucket на IP и на сессию. Корзина (токены, время
+последнего пополнения) живёт в кеше Django; чтение и запись корзины
+выполняются под короткой блокировкой на cache.add, поэтому лимит общий
+для всех процессов, если кеш общий (Redis, memcached); с LocMemCache
+лимит считается в каждом процессе отдельно.
+single_flight — объединение одинаковых одновременных GET-запросов:
+ответ считает только первый запрос, остальные ждут и получают копию.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+
+def client_ip(request):
+    """IP клиента; X-Forwarded-For учитывается только за доверенным прокси"""
+    if getattr(settings, 'RATE_LIMIT_TRUST_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+# Блокировка корзины: сколько она живёт, если процесс упал, и сколько ждать
+BUCKET_LOCK_TTL = 1
+BUCKET_LOCK_WAIT = 0.05
+
+
+@contextmanager
+def _bucket_lock(cache_key):
+    """
+    Блокировка корзины между процессами через атомарный cache.add.
+    Если за BUCKET_LOCK_WAIT её взять не удалось, запрос обрабатывается
+    без неё: лимит в этот момент может быть чуть превышен, но запрос не ждёт
+    """
+    lock_key = f'{cache_key}:lock'
+    deadline = time.monotonic() + BUCKET_LOCK_WAIT
+    locked = cache.add(lock_key, 1, BUCKET_LOCK_TTL)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.001)
+        locked = cache.add(lock_key, 1, BUCKET_LOCK_TTL)
+    try:
+        yield
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def take_token(key, rate, burst):
+    """
+    Забирает токен из корзины key. rate — токенов в секунду, burst — ёмкость.
+    Возвращает (разрешено, секунд до следующего токена)
+    """
+    cache_key = f'storage:ratelimit:{key}'
+    with _bucket_lock(cache_key):
+        # Время общее для всех процессов, поэтому time.time(), а не monotonic
+        now = time.time()
+        tokens, updated_at = cache.get(cache_key, (burst, now))
+        tokens = min(burst, tokens + max(0, now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(cache_key, (tokens, now), math.ceil(burst / rate) + 1)
+    return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+def rate_limit(rate, burst, scope=None):
+    """
+    Ограничивает частоту запросов к view: rate запросов в секунду
+    в среднем и до burst подряд, отдельно по IP и по сессии
+    """
+    def decorator(view_func):
+        bucket_scope = scope or view_func.__name__
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+                return view_func(request, *args, **kwargs)
+
+            keys = [f'{bucket_scope}:ip:{client_ip(request)}']
+            session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+            if session_key:
+                keys.append(f'{bucket_scope}:session:{session_key}')
+
+            for key in keys:
+                allowed, retry_after = take_token(key, rate, burst)
+                if not allowed:
+                    message = 'Слишком много запросов, попробуйте позже'
+                    response = JsonResponse(
+                        {'error': message, 'message': message},
+                        status=429,
+                    )
+                    response['Retry-After'] = max(1, round(retry_after))
+                    return response
+
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        # (content, status, headers) — снимок ответа лидера; None, если
+        # ответ не получен или потоковый
+        self.snapshot = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _snapshot(response):
+    if response.streaming:
+        return None
+    return response.content, response.status_code, list(response.items())
+
+
+def _clone_response(snapshot):
+    content, status, headers = snapshot
+    clone = HttpResponse(content, status=status)
+    for header, value in headers:
+        clone[header] = value
+    return clone
+
+
+def single_flight(vary_on_user=False, timeout=10):
+    """
+    Одинаковые одновременные GET-запросы (путь + query string + If-None-Match,
+    и пользователь при vary_on_user) выполняются один раз
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+
+            key = (
+                view_func.__module__,
+                view_func.__name__,
+                request.get_full_path(),
+                request.META.get('HTTP_IF_NONE_MATCH', ''),
+                request.user.pk if vary_on_user else None,
+            )
+
+            with _flights_lock:
+                flight = _flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = _flights[key] = _Flight()
+
+            if not leader:
+                if flight.done.wait(timeout) and flight.snapshot is not None:
+                    return _clone_response(flight.snapshot)
+                return view_func(request, *args, **kwargs)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+                # Снимок делается до done.set(): ведомые не должны видеть
+                # объект ответа, который лидер ещё отдаёт дальше по middleware
+                flight.snapshot = _snapshot(response)
+                return response
+            finally:
+                with _flights_lock:
+                    _flights.pop(key, None)
+                flight.done.set()
+        return wrapper
+    return decorator
@@ -5,6 +5,8 @@ from .telegram_webhook import telegram_webhook_view
 
 urlpatterns =  [
     path('ajax/get-boxes/', views.get_boxes_by_warehouse, name='ajax_get_boxes'),
+    path('ajax/inventory/', views.box_inventory, name='ajax_inventory'),
+    path('ajax/best-fit/', views.best_fit_box, name='ajax_best_fit'),
     path('ajax/box-details/<int:box_id>/', views.box_details, name='box_details'),
     path('ajax/check-promo/', views.check_promo_code, name='check_promo'),
     path('telegram/webhook/', telegram_webhook_view, name='telegram_webhook'),
@@ -1,39 +1,35 @@
-import requests
 from django.conf import settings
 import logging
 
+from .log_handlers import HIGH_VOLUME
+from .profiling import phase
+from .telegram_api import TelegramAPIError, get_api
+
 logger = logging.getLogger(__name__)
 
-def send_telegram_notification(chat_id, text, parse_mode='HTML'):
-    """Отправляет сообщение в Telegram"""
+def send_telegram_notification(chat_id, text, parse_mode='HTML', api=None):
+    """Отправляет сообщение в Telegram; api — клиент (по умолчанию общий, с повторами)"""
     token = getattr(settings, 'TELEGRAM_BOT_TOKEN', '')
     if not token or not chat_id:
-        logger.warning(f"Telegram: нет токена или chat_id")
+        logger.warning("Telegram: нет токена или chat_id")
         return False
     
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    
+    # Общий клиент: пул соединений, таймауты и повторы на 429/5xx
     try:
-        response = requests.post(url, data={
-            'chat_id': chat_id,
-            'text': text,
-            'parse_mode': parse_mode,
-            'disable_web_page_preview': True
-        }, timeout=10)
-        response.raise_for_status()
-        result = response.json()
-        logger.info(f"Telegram: сообщение отправлено, ok={result.get('ok')}")
-        return result.get('ok', False)
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Telegram error: {e}")
+        with phase('send'):
+            (api or get_api()).send_message(chat_id, text, parse_mode=parse_mode, disable_web_page_preview=True)
+        logger.debug("Telegram: сообщение отправлено в %s", chat_id, extra=HIGH_VOLUME)
+        return True
+    except TelegramAPIError as e:
+        logger.error("Telegram error: %s", e)
         return False
 
 
-def send_order_notification_to_client(agreement, price_info, client, final_box, applied_promo):
+def send_order_notification_to_client(agreement, price_info, client, final_box, applied_promo, api=None):
     """Отправляет уведомление о заказе клиенту в Telegram"""
     
     if not client.telegram_chat_id or not client.telegram_linked:
-        logger.info(f"Клиент {client.id} не привязал Telegram")
+        logger.info("Клиент %s не привязал Telegram", client.id)
         return False
     
     # Формируем красивое сообщение
@@ -63,4 +59,4 @@ def send_order_notification_to_client(agreement, price_info, client, final_box,
 
 🔗 <a href="https://antoxaboss.pythonanywhere.com/cabinet/">Личный кабинет</a>"""
 
-    return send_telegram_notification(client.telegram_chat_id, message)
\ No newline at end of file
+    return send_telegram_notification(client.telegram_chat_id, message, api=api)
\ No newline at end of file
@@ -1,14 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages 
 from django.utils import timezone  
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from .forms import OrderForm 
 from .models import Box, Client, RentalAgreement, Warehouse
 from datetime import timedelta
 from .models import PromoCode
 from datetime import date
+from .telegram_api import get_interactive_api
 from .utils import send_order_notification_to_client
+from . import inventory, pricing, promo_cache, reference_cache
+from .db_router import read_replica
+from .throttling import rate_limit, single_flight
+from decimal import Decimal, InvalidOperation
 import logging
 
 
@@ -18,6 +25,9 @@ def index(request):
     return render(request, 'index.html')
 
 
+@rate_limit(rate=5, burst=20)
+@single_flight()
+@read_replica
 def get_boxes_by_warehouse(request):
     warehouse_id = request.GET.get('warehouse_id')
     
@@ -40,6 +50,85 @@ def get_boxes_by_warehouse(request):
     return JsonResponse({'boxes': data})
 
 
+def _inventory_etag(request):
+    warehouse_id = request.GET.get('warehouse_id', '')
+    if not warehouse_id.isdigit():
+        return None
+    request.inventory_version = inventory.get_version(warehouse_id)
+    if request.inventory_version is None:
+        return None
+    return inventory.make_etag(warehouse_id, request.inventory_version)
+
+
+@rate_limit(rate=5, burst=20)
+@single_flight()
+@read_replica
+@condition(etag_func=_inventory_etag)
+def box_inventory(request):
+    """AJAX: свободные боксы склада в колоночном виде, с ETag по версии наличия"""
+    warehouse_id = request.GET.get('warehouse_id', '')
+    version = getattr(request, 'inventory_version', None)
+
+    if version is None:
+        return JsonResponse({'error': 'Склад не найден'}, status=404)
+
+    response = JsonResponse(inventory.get_inventory(warehouse_id, version))
+    # Браузер хранит ответ, но каждый раз перепроверяет его по ETag (304)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@rate_limit(rate=5, burst=20)
+@single_flight()
+@read_replica
+def best_fit_box(request):
+    """
+    AJAX: наименьший свободный бокс под объём и расчёт цены для него.
+    promo — код, уже проверенный check-promo; учитывается в расчёте
+    """
+    warehouse_id = request.GET.get('warehouse_id', '')
+    try:
+        volume = Decimal(request.GET.get('volume', ''))
+        duration = int(request.GET.get('duration', 1))
+    except (InvalidOperation, ValueError):
+        return JsonResponse({'error': 'Неверные параметры'}, status=400)
+
+    if not warehouse_id.isdigit() or not volume.is_finite() or volume <= 0 or duration < 1:
+        return JsonResponse({'error': 'Неверные параметры'}, status=400)
+
+    version = inventory.get_version(warehouse_id)
+    if version is None:
+        return JsonResponse({'error': 'Склад не найден'}, status=404)
+
+    box = inventory.best_fit_box(warehouse_id, volume, version)
+    if box is None:
+        return JsonResponse({'found': False, 'volume': float(volume)})
+
+    # Без проверки «уже использован»: ответ общий для всех пользователей (single_flight)
+    promo_code = request.GET.get('promo', '').strip()
+    promo = promo_cache.get_promo(promo_code) if promo_code else None
+    quote = pricing.quote(box['price'], duration, pricing.promo_percent(promo))
+    return JsonResponse({
+        'found': True,
+        'box': {
+            'id': box['id'],
+            'number': box['number'],
+            'length': box['length'],
+            'width': box['width'],
+            'height': box['height'],
+            'volume': float(box['volume']),
+            'price': float(box['price']),
+        },
+        'quote': {
+            'monthly_price': float(quote['monthly_price']),
+            'total_price': float(quote['total_price']),
+            'discount_percent': quote['discount_percent'],
+            'promo_discount': quote['promo_discount'],
+            'duration': duration,
+        },
+    })
+
+
 @login_required
 def order_view(request):
 
@@ -154,10 +243,12 @@ def order_view(request):
                 price_info=price_info,
                 client=client,
                 final_box=final_box,  # Важно: final_box должен быть определён выше!
-                applied_promo=applied_promo
+                applied_promo=applied_promo,
+                # Пользователь ждёт ответа: одна попытка без ожидания retry_after
+                api=get_interactive_api(),
             )
         except Exception as e:
-            logger.error(f"Ошибка отправки Telegram: {e}")
+            logger.error("Ошибка отправки Telegram: %s", e)
         
         
         
@@ -213,19 +304,15 @@ def order_view(request):
     return render(request, 'order_form.html', context)
 
 
+@rate_limit(rate=10, burst=30)
+@single_flight()
+@read_replica
 def box_details(request, box_id):
-    """AJAX: детали бокса"""
-    box = get_object_or_404(Box, id=box_id)
-    return JsonResponse({
-        'id': box.id,
-        'number': box.number,
-        'length': float(box.box_type.length),
-        'width': float(box.box_type.width),
-        'height': float(box.box_type.height),
-        'volume': float(box.box_type.volume),
-        'price': float(box.box_type.price),
-        'warehouse': str(box.box_type.warehouse),
-    })
+    """AJAX: детали бокса (из кеша справочных данных)"""
+    details = reference_cache.get_box_details(box_id)
+    if details is None:
+        raise Http404('Бокс не найден')
+    return JsonResponse(details)
 
 
 def order_confirmation_view(request):
@@ -239,53 +326,52 @@ def order_confirmation_view(request):
         'order_data': order_data,
         'show_cabinet_link': True
     })
-    
+
+
+# Строгий лимит: защита от перебора промокодов
+@rate_limit(rate=0.5, burst=5)
+@single_flight(vary_on_user=True)
 def check_promo_code(request):
     code = request.GET.get('code', '').strip()
     
-    # Получаем клиента текущего пользователя
-    try:
-        client = Client.objects.get(user=request.user)
-    except Client.DoesNotExist:
-        client = None
+    # Промокод и список уже использованных кодов берутся из кеша
+    promo = promo_cache.get_promo(code) if code else None
     
-    try:
-        promo = PromoCode.objects.get(code=code, is_active=True)
-        
-        # Проверка: уже использовал ли этот клиент этот промокод?
-        if client and RentalAgreement.objects.filter(client=client, promo_code=promo).exists():
-            return JsonResponse({
-                'valid': False,
-                'message': f'Промокод "{promo.code}" уже использован вами в другой аренде'
-            })
-        
-        # Проверка: валиден ли (лимит, сроки)?
-        if not promo.is_valid():
-            return JsonResponse({
-                'valid': False,
-                'message': 'Промокод просрочен или исчерпан'
-            })
-        
-        # Промокод можно использовать
+    if promo is None:
         return JsonResponse({
-            'valid': True,
-            'discount': promo.discount_percent,
-            'message': f'Промокод действует! Скидка {promo.discount_percent}%'
+            'valid': False,
+            'message': 'Промокод не найден'
         })
-        
-    except PromoCode.DoesNotExist:
+    
+    # Проверка: уже использовал ли этот клиент этот промокод?
+    if request.user.is_authenticated and promo.pk in promo_cache.get_used_promo_ids(request.user.pk):
         return JsonResponse({
             'valid': False,
-            'message': 'Промокод не найден'
-        })    
+            'message': f'Промокод "{promo.code}" уже использован вами в другой аренде'
+        })
+    
+    # Проверка: валиден ли (лимит, сроки)?
+    if not promo.is_valid():
+        return JsonResponse({
+            'valid': False,
+            'message': 'Промокод просрочен или исчерпан'
+        })
+    
+    # Промокод можно использовать
+    return JsonResponse({
+        'valid': True,
+        'discount': promo.discount_percent,
+        'message': f'Промокод действует! Скидка {promo.discount_percent}%'
+    })
 
 
 @login_required
 def extend_rent_view(request, pk):
     rental = get_object_or_404(RentalAgreement, id=pk, client__user=request.user)
-    rental.end_date += timedelta(days=30)
-    rental.save()
-    messages.success(request, "Срок аренды продлен на 1 месяц!")
+    if rental.extend():
+        messages.success(request, "Срок аренды продлен на 1 месяц!")
+    else:
+        messages.info(request, "Бессрочный договор не нужно продлевать.")
     return redirect('my_rent')
 
 
@@ -312,7 +398,7 @@ def request_qr_code_view(request, pk):
         return redirect('my_rent')
     
     # Отправляем QR-код
-    success = TelegramNotificationService.send_qr_code_for_access(agreement)
+    success = TelegramNotificationService.send_qr_code_for_access(agreement, api=get_interactive_api())
     
     if success:
         messages.success(request, 'QR-код отправлен в ваш Telegram!')
@@ -0,0 +1,96 @@
+"""
+Покупатель текущего запроса: пользователь, его профиль и клиент.
+
+CustomerBackend загружает пользователя сессии сразу с профилем и
+клиентом (один запрос вместо трёх), get_customer(request) собирает их
+в объект, который кешируется на запросе. Профиль и клиент создаются
+при первом обращении, если их ещё нет: сигналов на сохранение User
+нет, вход и правка пользователя профиль не трогают.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from storage.models import Client
+from .models import Profile
+
+
+# Обратные OneToOne от User, загружаемые вместе с пользователем
+CUSTOMER_RELATED = ('profile', 'client_profile')
+
+
+class CustomerBackend(ModelBackend):
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related(*CUSTOMER_RELATED).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def _related(name):
+    return getattr(get_user_model(), name).related
+
+
+def _cached_related(user, name):
+    """(загружено ли, объект или None) для обратной OneToOne без запроса к БД"""
+    related = _related(name)
+    if not related.is_cached(user):
+        return False, None
+    return True, related.get_cached_value(user)
+
+
+class Customer:
+    def __init__(self, user):
+        self.user = user
+        loaded = [_cached_related(user, name) for name in CUSTOMER_RELATED]
+        if not all(is_loaded for is_loaded, _ in loaded):
+            # Сессия старого бэкенда: догружаем профиль и клиента одним запросом
+            fresh = get_user_model()._default_manager.select_related(*CUSTOMER_RELATED).get(pk=user.pk)
+            loaded = [_cached_related(fresh, name) for name in CUSTOMER_RELATED]
+            for name, (_, value) in zip(CUSTOMER_RELATED, loaded):
+                _related(name).set_cached_value(user, value)
+        (_, self.profile), (_, self.client) = loaded
+
+    def get_or_create_profile(self):
+        if self.profile is None:
+            self.profile, _ = Profile.objects.get_or_create(user=self.user)
+            _related('profile').set_cached_value(self.user, self.profile)
+        return self.profile
+
+    def get_or_create_client(self):
+        if self.client is None:
+            user = self.user
+            self.client, _ = Client.objects.get_or_create(
+                user=user,
+                defaults={
+                    'full_name': f"{user.first_name} {user.last_name}".strip() or user.username,
+                    'email': user.email,
+                    'phone': self.profile.phone if self.profile else '',
+                    'address': self.profile.address if self.profile else '',
+                },
+            )
+            _related('client_profile').set_cached_value(user, self.client)
+        return self.client
+
+
+def save_changed(instance, values, always=()):
+    """
+    Присваивает значения полям и сохраняет только изменившиеся (и поля
+    из always, например загруженный файл). Возвращает список сохранённых
+    """
+    changed = list(always)
+    for field, value in values.items():
+        if getattr(instance, field) != value:
+            setattr(instance, field, value)
+            changed.append(field)
+    if changed:
+        instance.save(update_fields=changed)
+    return changed
+
+
+def get_customer(request):
+    """Покупатель запроса (только для вошедшего пользователя)"""
+    if not hasattr(request, '_customer'):
+        request._customer = Customer(request.user)
+    return request._customer
@@ -107,15 +107,15 @@ class UserRegistrationForm(UserCreationForm):
         if commit:
             user.save()
             
-            # Получаем или создаём профиль
-            profile = user.profile
-            
-            # Обновляем данные профиля
-            profile.first_name = self.cleaned_data.get('first_name', '')
-            profile.last_name = self.cleaned_data.get('last_name', '')
-            profile.phone = self.cleaned_data.get('phone', '')
-            profile.address = self.cleaned_data.get('address', '')
-            profile.pdn_accepted = self.cleaned_data['pdn_accepted']
+            # Создаём профиль сразу с данными формы: один INSERT
+            profile = Profile(
+                user=user,
+                first_name=self.cleaned_data.get('first_name', ''),
+                last_name=self.cleaned_data.get('last_name', ''),
+                phone=self.cleaned_data.get('phone', ''),
+                address=self.cleaned_data.get('address', ''),
+                pdn_accepted=self.cleaned_data['pdn_accepted'],
+            )
             
             # Сохраняем аватар, если он загружен
             avatar = self.cleaned_data.get('avatar')
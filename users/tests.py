@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from storage.models import Box, BoxType, Client, RentalAgreement, Warehouse
+from .models import Profile
+
+
+class CustomerPagesTests(TestCase):
+    """Личный кабинет и «Моя аренда» — постоянное число запросов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivan', 'ivan@example.com', 'secret-pass')
+        Profile.objects.create(user=cls.user, phone='+79991234567', qr_code='qr_codes/qr_1.png')
+        client = Client.objects.create(
+            user=cls.user, full_name='Иван Петров', address='ул. Жилая, 2',
+            phone='+79991234567', email='ivan@example.com',
+        )
+        warehouse = Warehouse.objects.create(town='Москва', address='ул. Складская, 1', ceiling_height=Decimal('4'))
+        box_type = BoxType.objects.create(
+            warehouse=warehouse, length=Decimal('1'), width=Decimal('1'), height=Decimal('1'), price=Decimal('1000'),
+        )
+        for n in range(3):
+            agreement = RentalAgreement.objects.create(
+                client=client, warehouse=warehouse, end_date=date.today() + timedelta(days=30 * (n + 1)),
+            )
+            agreement.boxes.set([
+                Box.objects.create(box_type=box_type, number=f'{n}-{m}', status='occupied') for m in range(2)
+            ])
+
+    def setUp(self):
+        self.client.force_login(self.user, backend='users.customer.CustomerBackend')
+
+    def page_queries(self, name):
+        """Запросы страницы без чтения сессии (его делает SessionMiddleware)"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        session_table = '"django_session"'
+        return response, [q['sql'] for q in queries if session_table not in q['sql']]
+
+    def test_cabinet_queries(self):
+        # Пользователь вместе с профилем и клиентом
+        _, queries = self.page_queries('cabinet')
+        self.assertEqual(len(queries), 1, queries)
+
+    def test_my_rent_queries_do_not_grow_with_agreements(self):
+        # Пользователь с профилем и клиентом, договоры, боксы с типами
+        response, queries = self.page_queries('my_rent')
+        self.assertEqual(len(queries), 3, queries)
+        self.assertEqual(len(response.context['rentals']), 3)
+
+
+class ProfilePersistenceTests(TestCase):
+    """Профиль не сохраняется вместе с User; пишутся только изменённые поля"""
+
+    def test_login_does_not_touch_profile(self):
+        user = User.objects.create_user('ivan', 'ivan@example.com', 'secret-pass')
+        Profile.objects.create(user=user, phone='+79991234567')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'ivan', 'password': 'secret-pass'})
+        self.assertRedirects(response, reverse('cabinet'), fetch_redirect_response=False)
+        profile_writes = [
+            q['sql'] for q in queries
+            if q['sql'].startswith(('UPDATE', 'INSERT')) and Profile._meta.db_table in q['sql']
+        ]
+        self.assertEqual(profile_writes, [])
+
+    def test_register_creates_profile_and_client(self):
+        data = {
+            'username': 'petr', 'email': 'petr@example.com', 'first_name': 'Пётр', 'last_name': 'Иванов',
+            'phone': '+79990000000', 'address': 'ул. Новая, 3', 'pdn_accepted': 'on',
+            'password1': 'Very-secret-123', 'password2': 'Very-secret-123',
+        }
+        response = self.client.post(reverse('register'), data)
+        self.assertRedirects(response, reverse('cabinet'), fetch_redirect_response=False)
+        user = User.objects.get(username='petr')
+        self.assertEqual(int(self.client.session['_auth_user_id']), user.pk)
+        self.assertEqual(self.client.session['_auth_user_backend'], 'users.customer.CustomerBackend')
+        self.assertEqual(user.profile.phone, '+79990000000')
+        self.assertTrue(user.profile.pdn_accepted)
+
+        self.client.get(reverse('my_rent'))
+        client = Client.objects.get(user=user)
+        self.assertEqual((client.full_name, client.phone), ('Пётр Иванов', '+79990000000'))
+
+    def test_edit_profile_saves_only_changed_fields(self):
+        user = User.objects.create_user('ivan', 'ivan@example.com', 'secret-pass', first_name='Иван')
+        Profile.objects.create(user=user, phone='+79991234567', address='ул. Жилая, 2')
+        self.client.force_login(user, backend='users.customer.CustomerBackend')
+        data = {
+            'first_name': 'Иван', 'last_name': '', 'email': 'ivan@example.com',
+            'phone': '+79997654321', 'address': 'ул. Жилая, 2',
+        }
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('edit_profile'), data)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        profile_updates = [sql for sql in updates if Profile._meta.db_table in sql]
+        self.assertEqual(len(profile_updates), 1)
+        self.assertIn('"phone"', profile_updates[0])
+        self.assertNotIn('"address"', profile_updates[0])
+        # Пользователь не менялся — его UPDATE нет
+        self.assertFalse([sql for sql in updates if User._meta.db_table in sql])
+        self.assertEqual(Profile.objects.get(user=user).phone, '+79997654321')
@@ -8,25 +8,25 @@ from django.contrib import messages
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.files.base import ContentFile
+from django.db.models import Prefetch
 from io import BytesIO
 import qrcode
-import base64
+from .customer import get_customer, save_changed
 from .forms import UserRegistrationForm, UserLoginForm
-from .models import Profile
+from storage.db_router import read_replica
+from storage.page_cache import cache_anonymous_page
 
 
+@cache_anonymous_page()
+@read_replica
 def home_view(request):
     """Главная страница сайта"""
     from storage.models import Warehouse
     
     # Получаем 1-2 featured склады (можно добавить поле is_featured в модель)
-    featured_warehouses = Warehouse.objects.prefetch_related('images')[:2]
-    
-    # Добавляем вычисляемые поля
-    for warehouse in featured_warehouses:
-        warehouse.free_count = warehouse.free_units
-        warehouse.total_count = warehouse.total_units
-        warehouse.min_price_val = warehouse.min_price
+    # Карточки кешируются в шаблоне по версии наличия склада, поэтому
+    # счётчики и фото запрашиваются только при промахе кеша
+    featured_warehouses = Warehouse.objects.all()[:2]
     
     context = {
         'featured_warehouses': featured_warehouses,
@@ -38,16 +38,13 @@ def home_view(request):
     return render(request, 'index.html', context)
 
 
+@cache_anonymous_page()
+@read_replica
 def boxes_view(request):
     from storage.models import Warehouse
     
-    warehouses = Warehouse.objects.prefetch_related('box_types', 'box_types__boxes')
-    
-    # Добавляем вычисляемые поля
-    for warehouse in warehouses:
-        warehouse.free_count = warehouse.free_units
-        warehouse.total_count = warehouse.total_units
-        warehouse.min_price_val = warehouse.min_price
+    # Списки боксов кешируются в шаблоне по версии наличия склада
+    warehouses = Warehouse.objects.all()
     
     context = {
         'warehouses': warehouses,
@@ -59,6 +56,7 @@ def boxes_view(request):
     return render(request, 'boxes.html', context)
 
 
+@cache_anonymous_page()
 def faq_view(request):
     """Страница правил хранения"""
     return render(request, 'faq.html')
@@ -77,7 +75,8 @@ def register_view(request):
         form = UserRegistrationForm(request.POST, request.FILES)
         if form.is_valid():
             user = form.save()
-            login(request, user)
+            # Бэкендов два, пользователь не прошёл authenticate — указываем явно
+            login(request, user, backend='users.customer.CustomerBackend')
             messages.success(
                 request,
                 f'Добро пожаловать, {user.username}! Вы успешно зарегистрировались.'
@@ -139,15 +138,11 @@ def cabinet_view(request):
     Вьюха личного кабинета
     Доступна только авторизованным пользователям
     """
-    profile, created = Profile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'phone': '',
-            'address': ''
-        }
-    )
+    # Пользователь, профиль и клиент уже загружены вместе с сессией
+    customer = get_customer(request)
+    profile = customer.get_or_create_profile()
     
-    # Генерация или получение существующего QR-кода
+    # QR-код генерируется один раз; шаблон показывает его по URL, файл не читается
     if not profile.qr_code:
         qr_data = f"user_id:{request.user.id};username:{request.user.username};access:storage"
         
@@ -169,18 +164,13 @@ def cabinet_view(request):
         
         # Сохраняем в модель
         qr_image = ContentFile(buffer.getvalue(), name=f'qr_{request.user.id}.png')
-        profile.qr_code.save(f'qr_{request.user.id}.png', qr_image, save=True)
-    
-    # Кодируем в base64 для отображения
-    qr_base64 = None
-    if profile.qr_code:
-        with profile.qr_code.open('rb') as f:
-            qr_base64 = base64.b64encode(f.read()).decode('utf-8')
+        profile.qr_code.save(f'qr_{request.user.id}.png', qr_image, save=False)
+        profile.save(update_fields=['qr_code'])
     
     context = {
         'profile': profile,
+        'client': customer.client,
         'user': request.user,
-        'qr_code': qr_base64,
     }
     return render(request, 'cabinet.html', context)
 
@@ -190,24 +180,25 @@ def edit_profile_view(request):
     """
     Вьюха редактирования профиля
     """
-    profile = request.user.profile
+    profile = get_customer(request).get_or_create_profile()
     
     if request.method == 'POST':
-        # Обновляем данные пользователя
-        request.user.first_name = request.POST.get('first_name', request.user.first_name)
-        request.user.last_name = request.POST.get('last_name', request.user.last_name)
-        request.user.email = request.POST.get('email', request.user.email)
-        request.user.save()
-        
-        # Обновляем данные профиля
-        profile.phone = request.POST.get('phone', profile.phone)
-        profile.address = request.POST.get('address', profile.address)
-        
-        # Обновляем аватар, если загружен новый
-        if 'avatar' in request.FILES:
-            profile.avatar = request.FILES['avatar']
-        
-        profile.save()
+        # Обновляем данные пользователя и профиля: пишутся только изменённые поля
+        user = request.user
+        save_changed(user, {
+            'first_name': request.POST.get('first_name', user.first_name),
+            'last_name': request.POST.get('last_name', user.last_name),
+            'email': request.POST.get('email', user.email),
+        })
+
+        # Новый аватар сохраняется всегда, если загружен
+        avatar = request.FILES.get('avatar')
+        if avatar:
+            profile.avatar = avatar
+        save_changed(profile, {
+            'phone': request.POST.get('phone', profile.phone),
+            'address': request.POST.get('address', profile.address),
+        }, always=['avatar'] if avatar else ())
         
         messages.success(request, 'Данные профиля успешно обновлены.')
         return redirect('cabinet')
@@ -224,33 +215,29 @@ def my_rent_view(request):
     """
     Вьюха "Моя аренда" — показывает активные аренды или пустое состояние
     """
-    from storage.models import RentalAgreement, Client
+    from storage.models import Box, RentalAgreement
+    from storage import pricing
     
-    # Получаем или создаем клиента для пользователя
-    client, created = Client.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'full_name': f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username,
-            'email': request.user.email,
-            'phone': getattr(request.user.profile, 'phone', ''),
-            'address': getattr(request.user.profile, 'address', '')
-        }
-    )
+    # Клиент загружен вместе с пользователем; создаётся только при первом заходе
+    customer = get_customer(request)
+    client = customer.get_or_create_client()
     
-    # Получаем активные аренды
-    active_rentals = RentalAgreement.objects.filter(
+    # Активные аренды: один запрос договоров и один — боксов с типами
+    active_rentals = list(pricing.with_pricing(RentalAgreement.objects.filter(
         client=client
-    ).exclude(status__in=['completed', 'cancelled']).select_related('warehouse').prefetch_related('boxes', 'boxes__box_type')
+    ).exclude(status__in=['completed', 'cancelled'])).select_related('warehouse').prefetch_related(
+        Prefetch('boxes', queryset=Box.objects.select_related('box_type'))
+    ))
     
-    if active_rentals.exists():
+    if active_rentals:
         return render(request, 'my-rent.html', {
             'rentals': active_rentals,
             'user': request.user,
-            'profile': request.user.profile
+            'profile': customer.profile
         })
     
     # Если аренд нет — показываем пустое состояние
     return render(request, 'my-rent-empty.html', {
         'user': request.user,
-        'profile': request.user.profile
+        'profile': customer.profile
     })
\ No newline at end of file